@@ -0,0 +1,146 @@
+"""
+bench_anomaly.py
+Débit d'ajustement et de scoring de la détection d'utilisateurs atypiques (model_ia_steps/anomaly.py) sur une
+population synthétique (features de synthetic_features.py, 10M utilisateurs par défaut).
+
+L'ajustement est mesuré une fois, le scoring pour chaque nombre de processus demandé ; chaque commande tourne
+dans un sous-processus dont on mesure temps mur, temps CPU et pic RSS. Pour vérifier que le modèle repère bien
+les robots, des utilisateurs synthétiques à très fort volume de vues (sans panier ni achat) sont ensuite scorés
+avec le même modèle : la part signalée est le rappel sur ces robots.
+
+Usage (depuis la racine du projet) :
+    python -m benchmarks.bench_anomaly --users 10M --jobs 1,4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List
+
+from benchmarks.bench_etl import parse_size, size_label
+from benchmarks.bench_model import DATA_DIR, RESULTS_DIR, ensure_dataset, prepare_workdir, run_step, save_json, step_command
+
+# =============================================================================
+# CONSTANTES DE CONFIGURATION
+# =============================================================================
+
+LATEST_PATH = os.path.join(RESULTS_DIR, 'anomaly_latest.json')
+
+DEFAULT_USERS = '10M'
+DEFAULT_JOBS = f"1,{os.cpu_count() or 1}"
+SEED = 42
+
+# Robots synthétiques : nombre et plage de vues (tirage log-uniforme), aucun panier ni achat
+N_BOTS = 1000
+BOT_VIEWS = (1e4, 1e7)
+BOT_BASE_USER_ID = 900000000
+
+# =============================================================================
+# DONNÉES
+# =============================================================================
+
+def bots_path(seed: int = SEED) -> str:
+    return os.path.join(DATA_DIR, f"bots_{N_BOTS}_seed{seed}.csv")
+
+def write_bots_csv(features_path: str, path: str, seed: int = SEED):
+    """Robots au schéma du fichier de features : des milliers à des millions de vues, sans conversion."""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    columns = list(pd.read_csv(features_path, nrows=0).columns)
+    views = np.exp(rng.uniform(np.log(BOT_VIEWS[0]), np.log(BOT_VIEWS[1]), N_BOTS)).round()
+    bots = pd.DataFrame(0.0, index=range(N_BOTS), columns=columns)
+    bots['user_id'] = BOT_BASE_USER_ID + np.arange(N_BOTS)
+    bots['view'] = views
+    for col, ratio in (('unique_categories', 0.01), ('unique_brands', 0.005)):
+        if col in bots.columns:
+            bots[col] = np.maximum(1, (views * ratio).round())
+    bots.to_csv(path, index=False)
+
+def ensure_bots(features_path: str) -> str:
+    """Génère les robots dans un interpréteur neuf, pour garder le processus du benchmark léger (voir bench_model)."""
+    path = bots_path()
+    if not os.path.exists(path):
+        print(f"🧪 Génération de {path} ({N_BOTS} robots)...")
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            executor.submit(write_bots_csv, features_path, path).result()
+    return path
+
+# =============================================================================
+# MESURES
+# =============================================================================
+
+def read_report(workdir: str) -> Dict[str, Any]:
+    with open(os.path.join(workdir, 'model_ia_steps', 'anomaly_report.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def print_row(command: str, jobs, stage: Dict[str, Any]):
+    print(f"   {command:<10}{str(jobs):>6}{stage['wall_s']:>10.1f}{stage['cpu_s']:>10.1f}"
+          f"{stage['rss_peak_bytes'] / 2**20:>14.0f}{stage['rows_per_s']:>12.0f}")
+
+def run_benchmark(n_users: int, jobs_list: List[int], keep_workdir: bool = False) -> Dict[str, Any]:
+    features_path = ensure_dataset(n_users)
+    bots = ensure_bots(features_path)
+    workdir = tempfile.mkdtemp(prefix='bench_anomaly_')
+    prepare_workdir(features_path, workdir)
+    log_path = os.path.join(workdir, 'anomaly.log')
+    results: Dict[str, Any] = {'users': n_users, 'score': {}}
+    print(f"   {'Commande':<10}{'Jobs':>6}{'Mur (s)':>10}{'CPU (s)':>10}{'Pic RSS (MB)':>14}{'Lignes/s':>12}")
+    try:
+        fit = run_step(step_command('anomaly', ['fit']), workdir, log_path)
+        fit['rows_per_s'] = round(n_users / fit['wall_s'], 1)
+        fit.update(read_report(workdir)['fit'])
+        results['fit'] = fit
+        print_row('fit', 1, fit)
+        for jobs in jobs_list:
+            stage = run_step(step_command('anomaly', ['score', '--jobs', str(jobs)]), workdir, log_path)
+            stage['rows_per_s'] = round(n_users / stage['wall_s'], 1)
+            stage['flagged'] = read_report(workdir)['score']['flagged']
+            results['score'][str(jobs)] = stage
+            print_row('score', jobs, stage)
+        run_step(step_command('anomaly', ['score', '--jobs', '1', '--input', os.path.abspath(bots),
+                                          '--output', os.path.join('model_ia_steps', 'bots_flags.csv')]),
+                 workdir, log_path)
+        results['bots'] = {'n_bots': N_BOTS, 'flagged': read_report(workdir)['score']['flagged']}
+    finally:
+        if keep_workdir:
+            print(f"   Fichiers conservés dans {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+# =============================================================================
+# POINT D'ENTRÉE
+# =============================================================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Débit d'ajustement et de scoring de la détection d'anomalies.")
+    parser.add_argument('--users', default=DEFAULT_USERS, help=f"Taille de la population (défaut : {DEFAULT_USERS})")
+    parser.add_argument('--jobs', default=DEFAULT_JOBS,
+                        help=f"Nombres de processus de scoring à mesurer (défaut : {DEFAULT_JOBS})")
+    parser.add_argument('--keep-workdir', action='store_true', help="Conserve les fichiers produits")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    n_users = parse_size(args.users)
+    jobs_list = sorted({int(j) for j in args.jobs.split(',') if j.strip()})
+    print(f"\n🚀 Détection d'anomalies : {size_label(n_users)} utilisateurs")
+    results = run_benchmark(n_users, jobs_list, args.keep_workdir)
+    flagged = next(iter(results['score'].values()))['flagged']
+    print(f"\n📊 {flagged} utilisateurs signalés sur {n_users} ({flagged / n_users:.3%}, "
+          f"contamination {results['fit']['contamination']:.3%})")
+    bots = results['bots']
+    print(f"   Robots synthétiques signalés : {bots['flagged']} sur {bots['n_bots']} "
+          f"(rappel {bots['flagged'] / bots['n_bots']:.1%})")
+    save_json(results, LATEST_PATH)
+    print(f"\nMesures sauvegardées dans {LATEST_PATH}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
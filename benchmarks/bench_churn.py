@@ -0,0 +1,158 @@
+"""
+bench_churn.py
+Temps d'entraînement et de scoring du modèle de churn (model_ia_steps/churn.py) sur une population synthétique
+(features de synthetic_features.py, 10M utilisateurs par défaut).
+
+L'activité par utilisateur (output/user_activity.csv, écrit normalement par l'ETL) est dérivée des features,
+vues comme calculées avant FEATURES_UNTIL (output/features_window.json, écrit normalement par
+main_etl.py --features-until) : la probabilité de ne plus revenir après cette date décroît avec le nombre de
+vues et les achats, de sorte que le modèle ait un signal à apprendre. Chaque commande (train puis score, pour chaque modèle) tourne dans un sous-processus dont on
+mesure temps mur, temps CPU et pic RSS ; les métriques d'évaluation viennent de churn_report.json.
+
+Usage (depuis la racine du projet) :
+    python -m benchmarks.bench_churn --users 10M --models hgb,sgd
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict
+
+from benchmarks.bench_etl import parse_size, size_label
+from benchmarks.bench_model import DATA_DIR, RESULTS_DIR, ensure_dataset, prepare_workdir, run_step, save_json, step_command
+
+# =============================================================================
+# CONSTANTES DE CONFIGURATION
+# =============================================================================
+
+LATEST_PATH = os.path.join(RESULTS_DIR, 'churn_latest.json')
+
+DEFAULT_USERS = '10M'
+DEFAULT_MODELS = 'hgb,sgd'
+SEED = 42
+
+# Activité synthétique : dernier événement observé, inactivité des churnés (aucun événement depuis
+# FEATURES_UNTIL, 31 jours avant la référence) et des actifs
+REFERENCE_DATE = '2019-12-31T23:59:59'
+FEATURES_UNTIL = '2019-11-30T23:59:59+00:00'
+CHURNED_INACTIVITY_DAYS = (31, 90)
+ACTIVE_INACTIVITY_DAYS = (0, 30)
+HISTORY_DAYS = 90
+
+# =============================================================================
+# DONNÉES
+# =============================================================================
+
+def activity_path(n_users: int, seed: int = SEED) -> str:
+    return os.path.join(DATA_DIR, f"activity_{n_users}_seed{seed}.csv")
+
+def write_activity_csv(features_path: str, path: str, seed: int = SEED, chunk_size: int = 1000000):
+    """Premier / dernier événement de chaque utilisateur, tirés selon ses features (chunk par chunk)."""
+    import numpy as np
+    import pandas as pd
+
+    reference = np.datetime64(REFERENCE_DATE, 's')
+    header = True
+    with pd.read_csv(features_path, chunksize=chunk_size) as reader:
+        for block_index, chunk in enumerate(reader):
+            rng = np.random.default_rng(np.random.SeedSequence([seed, block_index]))
+            logit = 1.5 - 0.7 * np.log1p(chunk['view']) - 1.2 * (chunk['purchase'] > 0) + 0.6 * (chunk['cart'] == 0)
+            churned = rng.random(len(chunk)) < 1 / (1 + np.exp(-logit.to_numpy()))
+            low = np.where(churned, CHURNED_INACTIVITY_DAYS[0], ACTIVE_INACTIVITY_DAYS[0])
+            high = np.where(churned, CHURNED_INACTIVITY_DAYS[1], ACTIVE_INACTIVITY_DAYS[1])
+            inactivity = (rng.uniform(low, high) * 86400).astype(np.int64)
+            last_event = reference - inactivity.astype('timedelta64[s]')
+            first_event = last_event - (rng.uniform(0, HISTORY_DAYS, len(chunk)) * 86400).astype('timedelta64[s]')
+            pd.DataFrame({
+                'user_id': chunk['user_id'],
+                'first_event': np.datetime_as_string(first_event, unit='s'),
+                'last_event': np.datetime_as_string(last_event, unit='s'),
+                'events': chunk[['cart', 'purchase', 'remove_from_cart', 'view']].sum(axis=1),
+            }).to_csv(path, mode='w' if header else 'a', header=header, index=False)
+            header = False
+
+def ensure_activity(n_users: int, features_path: str) -> str:
+    """Génère l'activité dans un interpréteur neuf, pour garder le processus du benchmark léger (voir bench_model)."""
+    path = activity_path(n_users)
+    if not os.path.exists(path):
+        print(f"🧪 Génération de {path} (activité de {n_users} utilisateurs)...")
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            executor.submit(write_activity_csv, features_path, path).result()
+    return path
+
+def write_features_window(features_path: str, path: str):
+    """
+    Fenêtre d'observation des features synthétiques, au format de main_etl.save_features_window
+    (signature de robust_stats.file_signature, recalculée ici sans importer numpy ni pandas).
+    """
+    stat = os.stat(features_path)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'features_until': FEATURES_UNTIL, 'source': {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}},
+                  f, indent=2)
+
+# =============================================================================
+# MESURES
+# =============================================================================
+
+def run_benchmark(n_users: int, models, keep_workdir: bool = False) -> Dict[str, Any]:
+    features_path = ensure_dataset(n_users)
+    activity = ensure_activity(n_users, features_path)
+    workdir = tempfile.mkdtemp(prefix='bench_churn_')
+    prepare_workdir(features_path, workdir)
+    os.symlink(os.path.abspath(activity), os.path.join(workdir, 'output', 'user_activity.csv'))
+    write_features_window(features_path, os.path.join(workdir, 'output', 'features_window.json'))
+    log_path = os.path.join(workdir, 'churn.log')
+    results: Dict[str, Any] = {'users': n_users, 'models': {}}
+    print(f"   {'Modèle':<8}{'Commande':<10}{'Mur (s)':>10}{'CPU (s)':>10}{'Pic RSS (MB)':>14}{'Lignes/s':>12}")
+    try:
+        for model in models:
+            stages = {}
+            for command, args in (('train', ['train', '--model', model]), ('score', ['score'])):
+                stages[command] = run_step(step_command('churn', args), workdir, log_path)
+                stages[command]['rows_per_s'] = round(n_users / stages[command]['wall_s'], 1)
+                print(f"   {model:<8}{command:<10}{stages[command]['wall_s']:>10.1f}{stages[command]['cpu_s']:>10.1f}"
+                      f"{stages[command]['rss_peak_bytes'] / 2**20:>14.0f}{stages[command]['rows_per_s']:>12.0f}")
+            with open(os.path.join(workdir, 'model_ia_steps', 'churn_report.json'), 'r', encoding='utf-8') as f:
+                report = json.load(f)
+            stages['metrics'] = report['train']['metrics']
+            stages['n_train'] = report['train']['n_train']
+            results['models'][model] = stages
+    finally:
+        if keep_workdir:
+            print(f"   Fichiers conservés dans {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+# =============================================================================
+# POINT D'ENTRÉE
+# =============================================================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Temps d'entraînement et de scoring du modèle de churn.")
+    parser.add_argument('--users', default=DEFAULT_USERS, help=f"Taille de la population (défaut : {DEFAULT_USERS})")
+    parser.add_argument('--models', default=DEFAULT_MODELS, help=f"Modèles à mesurer (défaut : {DEFAULT_MODELS})")
+    parser.add_argument('--keep-workdir', action='store_true', help="Conserve les fichiers produits")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    n_users = parse_size(args.users)
+    models = [m.strip() for m in args.models.split(',') if m.strip()]
+    print(f"\n🚀 Churn : {size_label(n_users)} utilisateurs")
+    results = run_benchmark(n_users, models, args.keep_workdir)
+    print("\n📊 Évaluation (utilisateurs réservés)")
+    for model, stages in results['models'].items():
+        metrics = stages['metrics']
+        print(f"   {model:<8}ROC-AUC {metrics.get('roc_auc', float('nan')):.4f}   F1 {metrics.get('f1', float('nan')):.4f}"
+              f"   ({stages['n_train']} lignes d'entraînement)")
+    save_json(results, LATEST_PATH)
+    print(f"\nMesures sauvegardées dans {LATEST_PATH}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,254 @@
+"""
+bench_etl.py
+Benchmark du pipeline ETL (extract_data_in_chunks, clean_data, create_features, save_to_csv)
+sur des jeux d'événements synthétiques de taille fixe (1M, 10M, 50M événements par défaut).
+Mesure le débit (lignes/s) et le pic mémoire de chaque étape, conserve une référence (baseline)
+et signale les régressions par rapport à celle-ci.
+
+Usage (depuis la racine du projet) :
+    python -m benchmarks.bench_etl --sizes 1M,10M
+    python -m benchmarks.bench_etl --update-baseline
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, List
+
+# =============================================================================
+# CONSTANTES DE CONFIGURATION
+# =============================================================================
+
+BENCHMARKS_DIR = 'benchmarks'
+DATA_DIR = os.path.join(BENCHMARKS_DIR, 'data')
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+BASELINE_PATH = os.path.join(RESULTS_DIR, 'etl_baseline.json')
+LATEST_PATH = os.path.join(RESULTS_DIR, 'etl_latest.json')
+
+DEFAULT_SIZES = '1M,10M,50M'
+CHUNK_SIZE = 100000
+SEED = 42
+
+# Écart toléré avant de signaler une régression (débit plus bas ou mémoire plus haute)
+REGRESSION_TOLERANCE = 0.10
+
+STAGES = ['extract_data_in_chunks', 'clean_data', 'create_features', 'save_to_csv']
+
+# =============================================================================
+# FONCTIONS UTILITAIRES
+# =============================================================================
+
+def parse_size(value: str) -> int:
+    """Convertit '1M', '500k', '2000' en nombre d'événements."""
+    value = value.strip().upper()
+    factors = {'K': 1000, 'M': 1000000, 'G': 1000000000}
+    if value and value[-1] in factors:
+        return int(float(value[:-1]) * factors[value[-1]])
+    return int(value)
+
+def size_label(n_events: int) -> str:
+    if n_events % 1000000 == 0:
+        return f"{n_events // 1000000}M"
+    if n_events % 1000 == 0:
+        return f"{n_events // 1000}k"
+    return str(n_events)
+
+def dataset_path(n_events: int, seed: int = SEED) -> str:
+    from benchmarks.synthetic_events import GENERATOR_VERSION
+    return os.path.join(DATA_DIR, f"events_{size_label(n_events)}_seed{seed}_v{GENERATOR_VERSION}.csv")
+
+def ensure_dataset(n_events: int, seed: int = SEED) -> str:
+    """Génère le jeu de données s'il n'existe pas déjà (les fichiers sont réutilisés d'un run à l'autre)."""
+    from benchmarks.synthetic_events import write_events_csv
+
+    path = dataset_path(n_events, seed)
+    if not os.path.exists(path):
+        print(f"🧪 Génération de {path} ({n_events} événements)...")
+        write_events_csv(path, n_events, seed=seed)
+    return path
+
+# =============================================================================
+# MESURE D'UNE TAILLE (exécutée dans un sous-processus dédié)
+# =============================================================================
+
+def run_single(data_path: str, chunk_size: int = CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    Exécute le pipeline ETL instrumenté sur un fichier et retourne les mesures par étape.
+    Chaque taille tourne dans un processus neuf pour que les pics RSS ne se cumulent pas.
+    """
+    import pandas as pd
+    from etl_steps.extract import extract_data_in_chunks
+    from etl_steps.transform import clean_data, create_features
+    from etl_steps.load import save_to_csv
+    from monitoring.profiling import RunProfiler
+
+    profiler = RunProfiler('bench_etl', output_dir=tempfile.gettempdir(), trace_allocations=False)
+    clean = profiler.wrap(clean_data)
+    featurize = profiler.wrap(create_features)
+    save = profiler.wrap(save_to_csv)
+
+    all_features = []
+    # Les messages de clean_data/create_features font partie du coût mesuré mais ne sont pas affichés
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for chunk in profiler.wrap_iterator(extract_data_in_chunks(data_path, chunk_size=chunk_size),
+                                            'extract_data_in_chunks'):
+            features = featurize(clean(chunk))
+            if not features.empty:
+                all_features.append(features)
+        features_df = pd.concat(all_features, ignore_index=True)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            save(features_df, os.path.join(tmp_dir, 'features.csv'))
+
+    summary = profiler.summary()
+    stages = {
+        name: {
+            'wall_s': summary['stages'][name]['wall_s'],
+            'cpu_s': summary['stages'][name]['cpu_s'],
+            'rows_in': summary['stages'][name]['rows_in'],
+            'rows_out': summary['stages'][name]['rows_out'],
+            'rows_per_s': summary['stages'][name]['rows_per_s'],
+            'rss_peak_bytes': summary['stages'][name]['rss_peak_bytes'],
+        }
+        for name in STAGES if name in summary['stages']
+    }
+    stages['_total'] = {'wall_s': summary['total_wall_s'], 'rss_peak_bytes': summary['peak_rss_bytes']}
+    return stages
+
+def run_size_isolated(n_events: int, chunk_size: int) -> Dict[str, Any]:
+    """Lance run_single dans un sous-processus Python et relit ses mesures."""
+    data_path = ensure_dataset(n_events)
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as tmp:
+        result_path = tmp.name
+    try:
+        cmd = [sys.executable, '-m', 'benchmarks.bench_etl', '--worker', data_path,
+               '--worker-output', result_path, '--chunk-size', str(chunk_size)]
+        ret = subprocess.run(cmd)
+        if ret.returncode != 0:
+            raise RuntimeError(f"Le benchmark {size_label(n_events)} a échoué (code {ret.returncode})")
+        with open(result_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        os.remove(result_path)
+
+# =============================================================================
+# RÉFÉRENCES ET RÉGRESSIONS
+# =============================================================================
+
+def environment_info() -> Dict[str, Any]:
+    import numpy as np
+    import pandas as pd
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def compare_to_baseline(results: Dict[str, Any], baseline: Dict[str, Any],
+                        tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    """
+    Compare les mesures à la référence.
+    Returns:
+        Liste des régressions détectées (débit en baisse ou pic mémoire en hausse au-delà de la tolérance).
+    """
+    regressions = []
+    for size, stages in results['sizes'].items():
+        base_stages = baseline.get('sizes', {}).get(size)
+        if not base_stages:
+            continue
+        for stage in STAGES:
+            current, reference = stages.get(stage), base_stages.get(stage)
+            if not current or not reference:
+                continue
+            if reference.get('rows_per_s') and current.get('rows_per_s'):
+                ratio = current['rows_per_s'] / reference['rows_per_s']
+                if ratio < 1 - tolerance:
+                    regressions.append(f"{size} {stage} : débit {current['rows_per_s']:.0f} l/s "
+                                       f"vs {reference['rows_per_s']:.0f} l/s ({(ratio - 1) * 100:+.1f}%)")
+            if reference.get('rss_peak_bytes') and current.get('rss_peak_bytes'):
+                ratio = current['rss_peak_bytes'] / reference['rss_peak_bytes']
+                if ratio > 1 + tolerance:
+                    regressions.append(f"{size} {stage} : pic RSS {current['rss_peak_bytes'] / 2**20:.0f} MB "
+                                       f"vs {reference['rss_peak_bytes'] / 2**20:.0f} MB ({(ratio - 1) * 100:+.1f}%)")
+    return regressions
+
+def print_results(results: Dict[str, Any]):
+    print(f"\n📊 Résultats du benchmark ETL")
+    print(f"   {'Taille':<8}{'Étape':<26}{'Mur (s)':>10}{'Lignes/s':>14}{'Pic RSS (MB)':>14}")
+    for size, stages in results['sizes'].items():
+        for stage in STAGES:
+            if stage in stages:
+                s = stages[stage]
+                rows_per_s = f"{s['rows_per_s']:.0f}" if s['rows_per_s'] else '-'
+                print(f"   {size:<8}{stage:<26}{s['wall_s']:>10.2f}{rows_per_s:>14}{s['rss_peak_bytes'] / 2**20:>14.0f}")
+
+def save_json(data: Dict[str, Any], path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+
+# =============================================================================
+# POINT D'ENTRÉE
+# =============================================================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark des étapes ETL sur des données synthétiques.")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f"Tailles en événements, séparées par des virgules (défaut : {DEFAULT_SIZES})")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Taille des chunks de lecture")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="Fichier de référence")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="Remplace la référence par les mesures de ce run")
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE,
+                        help="Écart relatif toléré avant de signaler une régression (défaut : 0.10)")
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--worker-output', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.worker:
+        save_json(run_single(args.worker, chunk_size=args.chunk_size), args.worker_output)
+        return 0
+
+    sizes = [parse_size(s) for s in args.sizes.split(',') if s.strip()]
+    results = {'environment': environment_info(), 'chunk_size': args.chunk_size, 'sizes': {}}
+    for n_events in sizes:
+        print(f"\n🚀 Benchmark ETL : {size_label(n_events)} événements")
+        results['sizes'][size_label(n_events)] = run_size_isolated(n_events, args.chunk_size)
+    print_results(results)
+    save_json(results, LATEST_PATH)
+    print(f"\nMesures sauvegardées dans {LATEST_PATH}")
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    if args.update_baseline or baseline is None:
+        # Les tailles non mesurées dans ce run conservent leur référence précédente
+        merged = baseline or {'sizes': {}}
+        merged['sizes'].update(results['sizes'])
+        merged['environment'] = results['environment']
+        merged['chunk_size'] = results['chunk_size']
+        save_json(merged, args.baseline)
+        print(f"Référence enregistrée dans {args.baseline}")
+        return 0
+
+    regressions = compare_to_baseline(results, baseline, tolerance=args.tolerance)
+    if regressions:
+        print(f"\n❌ {len(regressions)} régression(s) par rapport à la référence ({baseline['environment']['date']}) :")
+        for regression in regressions:
+            print(f"   - {regression}")
+        return 1
+    print("\n✅ Aucune régression par rapport à la référence.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
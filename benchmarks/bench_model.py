@@ -0,0 +1,329 @@
+"""
+bench_model.py
+Benchmark des étapes du modèle (step2_preprocess, step3_pca, step4_clustering, step5_analyse_clusters)
+sur des populations synthétiques de taille croissante (100k, 1M, 10M utilisateurs par défaut,
+voir synthetic_features.py).
+
+Chaque étape est exécutée dans chacun de ses modes, dans un sous-processus dont on mesure le temps mur,
+le temps CPU et le pic RSS. Le mode de référence d'une étape est exécuté en dernier : c'est sa sortie
+qui alimente l'étape suivante. Pour le clustering, la qualité de chaque mode est mesurée sur le fichier
+produit (nombre de clusters, inertie sur toute la population, silhouette sur un échantillon commun).
+
+Les mesures sont écrites sous forme de table (benchmarks/results/model_latest.csv et .json), comparées
+à une référence (model_baseline.json) et les régressions sont signalées.
+
+Usage (depuis la racine du projet) :
+    python -m benchmarks.bench_model --sizes 100k,1M,10M
+    python -m benchmarks.bench_model --sizes 1M --exclude step4_clustering:exact --update-baseline
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from importlib.metadata import version
+from typing import Any, Dict, List, Optional
+
+from benchmarks.bench_etl import parse_size, size_label
+
+# =============================================================================
+# CONSTANTES DE CONFIGURATION
+# =============================================================================
+
+BENCHMARKS_DIR = 'benchmarks'
+DATA_DIR = os.path.join(BENCHMARKS_DIR, 'data')
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+BASELINE_PATH = os.path.join(RESULTS_DIR, 'model_baseline.json')
+LATEST_PATH = os.path.join(RESULTS_DIR, 'model_latest.json')
+TABLE_PATH = os.path.join(RESULTS_DIR, 'model_latest.csv')
+STEPS_DIR = os.path.abspath('model_ia_steps')
+
+DEFAULT_SIZES = '100k,1M,10M'
+SEED = 42
+
+# Modes de chaque étape (arguments passés au script)
+STEP_MODES: Dict[str, Dict[str, List[str]]] = {
+    'step2_preprocess': {'full': [], 'streaming': ['--streaming']},
+    'step3_pca': {'full': ['--solver', 'full'], 'randomized': ['--solver', 'randomized'],
+                  'incremental': ['--solver', 'incremental']},
+    'step4_clustering': {'exact': ['--mode', 'exact'], 'sample': ['--mode', 'sample'],
+                         'coreset': ['--mode', 'coreset'], 'minibatch': ['--mode', 'minibatch']},
+    'step5_analyse_clusters': {'default': []},
+}
+
+# Mode exécuté en dernier pour chaque étape (mémoire bornée, disponible à toutes les tailles)
+REFERENCE_MODES = {
+    'step2_preprocess': 'streaming',
+    'step3_pca': 'incremental',
+    'step4_clustering': 'minibatch',
+    'step5_analyse_clusters': 'default',
+}
+
+# Au-delà de cette population, le KMeans exact (n_init=10 pour chaque k) n'est pas lancé
+EXACT_MAX_USERS = 1000000
+
+# Mesure de la qualité du clustering : lignes lues par chunk et taille de l'échantillon silhouette
+QUALITY_CHUNK_SIZE = 500000
+SILHOUETTE_SAMPLE_SIZE = 10000
+
+# Écarts tolérés avant de signaler une régression (temps ou mémoire relatifs, silhouette absolue)
+REGRESSION_TOLERANCE = 0.10
+SILHOUETTE_TOLERANCE = 0.02
+
+# =============================================================================
+# FONCTIONS UTILITAIRES
+# =============================================================================
+
+def dataset_path(n_users: int, seed: int = SEED) -> str:
+    return os.path.join(DATA_DIR, f"features_{n_users}_seed{seed}.csv")
+
+def ensure_dataset(n_users: int, seed: int = SEED) -> str:
+    """
+    Génère la population si elle n'existe pas déjà (les fichiers sont réutilisés d'un run à l'autre).
+    La génération tourne dans un sous-processus pour garder le processus du benchmark léger (voir measure_quality).
+    """
+    path = dataset_path(n_users, seed)
+    if not os.path.exists(path):
+        print(f"🧪 Génération de {path} ({n_users} utilisateurs)...")
+        subprocess.run([sys.executable, '-m', 'benchmarks.synthetic_features', '--users', str(n_users),
+                        '--output', path, '--seed', str(seed)], check=True, stdout=subprocess.DEVNULL)
+    return path
+
+def prepare_workdir(data_path: str, workdir: str):
+    """Arborescence attendue par les étapes (output/features_all_users.csv, model_ia_steps/)."""
+    os.makedirs(os.path.join(workdir, 'output'), exist_ok=True)
+    os.makedirs(os.path.join(workdir, 'model_ia_steps'), exist_ok=True)
+    features_link = os.path.join(workdir, 'output', 'features_all_users.csv')
+    if not os.path.exists(features_link):
+        os.symlink(os.path.abspath(data_path), features_link)
+
+def run_step(cmd: List[str], cwd: str, log_path: str) -> Dict[str, Any]:
+    """Lance une étape et mesure temps mur, temps CPU et pic RSS du sous-processus."""
+    start = time.perf_counter()
+    with open(log_path, 'a', encoding='utf-8') as log:
+        log.write(f"\n$ {' '.join(cmd)}\n")
+        log.flush()
+        process = subprocess.Popen(cmd, cwd=cwd, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+    returncode = os.waitstatus_to_exitcode(status)
+    if returncode != 0:
+        raise RuntimeError(f"{' '.join(cmd)} a échoué (code {returncode}), voir {log_path}")
+    rss_peak = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    return {
+        'wall_s': round(time.perf_counter() - start, 3),
+        'cpu_s': round(usage.ru_utime + usage.ru_stime, 3),
+        'rss_peak_bytes': rss_peak,
+    }
+
+def step_command(step: str, args: List[str]) -> List[str]:
+    return [sys.executable, os.path.join(STEPS_DIR, f'{step}.py')] + list(args)
+
+def clustering_quality(clusters_csv: str, chunk_size: int = QUALITY_CHUNK_SIZE,
+                       sample_size: int = SILHOUETTE_SAMPLE_SIZE, seed: int = 42) -> Dict[str, Any]:
+    """
+    Qualité d'une segmentation (fichier features_clusters.csv) en une passe par chunks :
+    inertie = Σ||x||² - Σ_c n_c·||μ_c||², silhouette sur un échantillon uniforme de taille ~sample_size
+    (même graine pour tous les modes).
+    """
+    import numpy as np
+    import pandas as pd
+    from sklearn.metrics import silhouette_score
+
+    n_rows = sum(1 for _ in open(clusters_csv, encoding='utf-8')) - 1
+    keep_probability = min(1.0, sample_size / max(n_rows, 1))
+    rng = np.random.default_rng(seed)
+    sums, counts, squared_norms, samples = {}, {}, 0.0, []
+    with pd.read_csv(clusters_csv, chunksize=chunk_size) as reader:
+        for chunk in reader:
+            labels = chunk.pop('cluster').to_numpy()
+            X = chunk.drop(columns=['user_id'], errors='ignore').to_numpy(dtype=np.float64)
+            squared_norms += float((X ** 2).sum())
+            for cluster in np.unique(labels):
+                members = X[labels == cluster]
+                sums[cluster] = sums.get(cluster, 0) + members.sum(axis=0)
+                counts[cluster] = counts.get(cluster, 0) + len(members)
+            selected = rng.random(len(X)) < keep_probability
+            samples.append((X[selected], labels[selected]))
+    inertia = squared_norms - sum(float((sums[c] ** 2).sum()) / counts[c] for c in counts)
+    sample_X = np.vstack([x for x, _ in samples])
+    sample_labels = np.concatenate([labels for _, labels in samples])
+    silhouette = (float(silhouette_score(sample_X, sample_labels))
+                  if len(np.unique(sample_labels)) > 1 else float('nan'))
+    return {'k': len(counts), 'inertia': inertia, 'silhouette': silhouette}
+
+def measure_quality(clusters_csv: str) -> Dict[str, Any]:
+    """
+    clustering_quality dans un interpréteur neuf : sous Linux, le pic RSS d'un enfant inclut la mémoire du
+    parent au moment du fork, le processus du benchmark doit donc rester léger (ni numpy ni pandas chargés).
+    """
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(clustering_quality, clusters_csv).result()
+
+# =============================================================================
+# MESURE D'UNE TAILLE
+# =============================================================================
+
+def run_size(n_users: int, dtype: str = 'float64', exclude: Optional[List[str]] = None,
+             keep_workdir: bool = False) -> List[Dict[str, Any]]:
+    """Exécute toutes les étapes dans tous leurs modes pour une population ; retourne une ligne par (étape, mode)."""
+    data_path = ensure_dataset(n_users)
+    workdir = tempfile.mkdtemp(prefix=f'bench_model_{size_label(n_users)}_')
+    prepare_workdir(data_path, workdir)
+    log_path = os.path.join(workdir, 'steps.log')
+    exclude = set(exclude or [])
+    if n_users > EXACT_MAX_USERS:
+        exclude.add('step4_clustering:exact')
+    rows = []
+    try:
+        for step, modes in STEP_MODES.items():
+            reference = REFERENCE_MODES[step]
+            ordered = [mode for mode in modes if mode != reference] + [reference]
+            for mode in ordered:
+                if f'{step}:{mode}' in exclude and mode != reference:
+                    continue
+                dtype_args = ['--dtype', dtype] if step != 'step5_analyse_clusters' else []
+                stats = run_step(step_command(step, modes[mode] + dtype_args), workdir, log_path)
+                row = {'size': size_label(n_users), 'users': n_users, 'step': step, 'mode': mode, 'dtype': dtype}
+                row.update(stats)
+                row['users_per_s'] = round(n_users / stats['wall_s'], 1) if stats['wall_s'] > 0 else None
+                if step == 'step4_clustering':
+                    row.update(measure_quality(os.path.join(workdir, 'model_ia_steps', 'features_clusters.csv')))
+                rows.append(row)
+                print_row(row)
+    finally:
+        if keep_workdir:
+            print(f"   Fichiers conservés dans {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return rows
+
+# =============================================================================
+# RÉFÉRENCES ET RÉGRESSIONS
+# =============================================================================
+
+def environment_info() -> Dict[str, Any]:
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': version('pandas'),
+        'numpy': version('numpy'),
+        'sklearn': version('scikit-learn'),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def row_key(row: Dict[str, Any]) -> str:
+    return f"{row['size']}/{row['step']}/{row['mode']}/{row['dtype']}"
+
+def compare_to_baseline(rows: List[Dict[str, Any]], baseline: Dict[str, Any],
+                        tolerance: float = REGRESSION_TOLERANCE,
+                        silhouette_tolerance: float = SILHOUETTE_TOLERANCE) -> List[str]:
+    """
+    Compare les mesures à la référence.
+    Returns:
+        Liste des régressions détectées (temps ou pic mémoire en hausse au-delà de la tolérance,
+        silhouette en baisse de plus de silhouette_tolerance).
+    """
+    reference_rows = {row_key(row): row for row in baseline.get('rows', [])}
+    regressions = []
+    for row in rows:
+        reference = reference_rows.get(row_key(row))
+        if not reference:
+            continue
+        for metric, label in (('wall_s', 'temps'), ('rss_peak_bytes', 'pic RSS')):
+            if reference.get(metric) and row.get(metric):
+                ratio = row[metric] / reference[metric]
+                if ratio > 1 + tolerance:
+                    regressions.append(f"{row_key(row)} : {label} {(ratio - 1) * 100:+.1f}%")
+        if reference.get('silhouette') is not None and row.get('silhouette') is not None:
+            if row['silhouette'] < reference['silhouette'] - silhouette_tolerance:
+                regressions.append(f"{row_key(row)} : silhouette {row['silhouette']:.4f} "
+                                   f"vs {reference['silhouette']:.4f}")
+    return regressions
+
+def print_header():
+    print(f"   {'Taille':<8}{'Étape':<24}{'Mode':<13}{'Mur (s)':>9}{'Pic RSS (MB)':>14}{'k':>4}"
+          f"{'Inertie':>14}{'Silhouette':>12}")
+
+def print_row(row: Dict[str, Any]):
+    quality = ''
+    if 'k' in row:
+        quality = f"{row['k']:>4}{row['inertia']:>14.6g}{row['silhouette']:>12.4f}"
+    print(f"   {row['size']:<8}{row['step']:<24}{row['mode']:<13}{row['wall_s']:>9.1f}"
+          f"{row['rss_peak_bytes'] / 2**20:>14.0f}{quality}")
+
+def save_json(data: Dict[str, Any], path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+
+# =============================================================================
+# POINT D'ENTRÉE
+# =============================================================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark des étapes du modèle sur des populations synthétiques.")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f"Tailles en utilisateurs, séparées par des virgules (défaut : {DEFAULT_SIZES})")
+    parser.add_argument('--dtype', choices=['float64', 'float32'], default='float64',
+                        help="Type flottant des étapes 2 à 4")
+    parser.add_argument('--exclude', default='',
+                        help="Modes à ignorer, au format étape:mode séparés par des virgules "
+                             "(ex. step4_clustering:exact) ; le mode de référence est toujours exécuté")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="Fichier de référence")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="Remplace la référence par les mesures de ce run")
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE,
+                        help="Écart relatif toléré (temps, mémoire) avant de signaler une régression (défaut : 0.10)")
+    parser.add_argument('--keep-workdir', action='store_true', help="Conserve les fichiers produits")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    sizes = [parse_size(s) for s in args.sizes.split(',') if s.strip()]
+    exclude = [item.strip() for item in args.exclude.split(',') if item.strip()]
+    results = {'environment': environment_info(), 'rows': []}
+    for n_users in sizes:
+        print(f"\n🚀 Benchmark du modèle : {size_label(n_users)} utilisateurs ({args.dtype})")
+        print_header()
+        results['rows'].extend(run_size(n_users, args.dtype, exclude, args.keep_workdir))
+
+    import pandas as pd
+    table = pd.DataFrame(results['rows'])
+    table['rss_peak_mb'] = (table['rss_peak_bytes'] / 2**20).round(1)
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    table.drop(columns=['rss_peak_bytes']).to_csv(TABLE_PATH, index=False)
+    save_json(results, LATEST_PATH)
+    print(f"\nMesures sauvegardées dans {LATEST_PATH} et {TABLE_PATH}")
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    if args.update_baseline or baseline is None:
+        # Les lignes non mesurées dans ce run conservent leur référence précédente
+        merged = {row_key(row): row for row in (baseline or {}).get('rows', [])}
+        merged.update({row_key(row): row for row in results['rows']})
+        save_json({'environment': results['environment'], 'rows': list(merged.values())}, args.baseline)
+        print(f"Référence enregistrée dans {args.baseline}")
+        return 0
+
+    regressions = compare_to_baseline(results['rows'], baseline, tolerance=args.tolerance)
+    if regressions:
+        print(f"\n❌ {len(regressions)} régression(s) par rapport à la référence ({baseline['environment']['date']}) :")
+        for regression in regressions:
+            print(f"   - {regression}")
+        return 1
+    print("\n✅ Aucune régression par rapport à la référence.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
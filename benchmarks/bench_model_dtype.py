@@ -0,0 +1,127 @@
+"""
+bench_model_dtype.py
+Compare le pipeline du modèle (étapes 2 à 4 : prétraitement, PCA, clustering) en float64 et en float32
+sur une population synthétique (voir synthetic_features.py).
+
+Chaque étape tourne dans un sous-processus dont on mesure le temps mur, le temps CPU et le pic RSS.
+Les segments obtenus dans les deux types sont ensuite comparés : nombre de clusters retenu, nombre de
+composantes, part des utilisateurs affectés au même segment (après appariement des numéros de clusters)
+et indice de Rand ajusté.
+
+Usage (depuis la racine du projet) :
+    python -m benchmarks.bench_model_dtype --users 2M --mode minibatch
+"""
+import argparse
+import os
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+from benchmarks.bench_model import ensure_dataset, prepare_workdir, run_step, save_json, step_command
+
+# =============================================================================
+# CONSTANTES DE CONFIGURATION
+# =============================================================================
+
+LATEST_PATH = os.path.join('benchmarks', 'results', 'model_dtype_latest.json')
+
+DEFAULT_USERS = '2M'
+DTYPES = ['float64', 'float32']
+STEPS = ['step2_preprocess', 'step3_pca', 'step4_clustering']
+
+# Part minimale d'utilisateurs au même segment pour considérer les segmentations identiques
+MIN_AGREEMENT = 0.999
+
+# =============================================================================
+# EXÉCUTION
+# =============================================================================
+
+def run_pipeline(data_path: str, workdir: str, dtype: str, step_args: Dict[str, List[str]]) -> Dict[str, Any]:
+    """Exécute les étapes 2 à 4 dans `workdir` (arborescence output/ et model_ia_steps/ du projet)."""
+    prepare_workdir(data_path, workdir)
+    log_path = os.path.join(workdir, 'steps.log')
+    stages = {}
+    for step in STEPS:
+        cmd = step_command(step, ['--dtype', dtype] + step_args.get(step, []))
+        stages[step] = run_step(cmd, workdir, log_path)
+        print(f"   {dtype:<8}{step:<20}{stages[step]['wall_s']:>9.1f} s{stages[step]['rss_peak_bytes'] / 2**20:>9.0f} MB")
+    return stages
+
+def compare_segments(workdirs: Dict[str, str]) -> Dict[str, Any]:
+    """Accord des segments float32 / float64 (numéros de clusters appariés par l'algorithme hongrois)."""
+    import joblib
+    import numpy as np
+    import pandas as pd
+    from scipy.optimize import linear_sum_assignment
+    from sklearn.metrics import adjusted_rand_score
+
+    labels = {dtype: pd.read_csv(os.path.join(path, 'model_ia_steps', 'features_clusters.csv'),
+                                 usecols=['cluster'])['cluster'].to_numpy()
+              for dtype, path in workdirs.items()}
+    reference, candidate = labels['float64'], labels['float32']
+    k = int(max(reference.max(), candidate.max())) + 1
+    contingency = np.zeros((k, k), dtype=np.int64)
+    np.add.at(contingency, (reference, candidate), 1)
+    rows, cols = linear_sum_assignment(-contingency)
+    components = {dtype: len(joblib.load(os.path.join(path, 'model_ia_steps', 'pca_model.joblib'))['components'])
+                  for dtype, path in workdirs.items()}
+    return {
+        'best_k': {dtype: int(values.max()) + 1 for dtype, values in labels.items()},
+        'n_components': components,
+        'agreement': float(contingency[rows, cols].sum() / len(reference)),
+        'ari': float(adjusted_rand_score(reference, candidate)),
+    }
+
+# =============================================================================
+# POINT D'ENTRÉE
+# =============================================================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare le pipeline du modèle en float64 et en float32.")
+    parser.add_argument('--users', default=DEFAULT_USERS, help=f"Taille de la population (défaut : {DEFAULT_USERS})")
+    parser.add_argument('--solver', default='full', help="Solveur PCA de l'étape 3 (voir step3_pca.py)")
+    parser.add_argument('--mode', default='minibatch', help="Mode de clustering de l'étape 4 (voir step4_clustering.py)")
+    parser.add_argument('--streaming', action='store_true', help="Prétraitement par chunks (étape 2)")
+    parser.add_argument('--keep-workdir', action='store_true', help="Conserve les fichiers produits")
+    return parser.parse_args()
+
+def main():
+    from benchmarks.synthetic_features import parse_size
+
+    args = parse_args()
+    n_users = parse_size(args.users)
+    data_path = ensure_dataset(n_users)
+    step_args = {
+        'step2_preprocess': ['--streaming'] if args.streaming else [],
+        'step3_pca': ['--solver', args.solver],
+        'step4_clustering': ['--mode', args.mode],
+    }
+    results = {'users': n_users, 'step_args': step_args, 'dtypes': {}}
+    root = tempfile.mkdtemp(prefix='bench_model_dtype_')
+    workdirs = {dtype: os.path.join(root, dtype) for dtype in DTYPES}
+    print(f"\n🚀 Pipeline du modèle sur {n_users} utilisateurs (fichiers dans {root})")
+    for dtype in DTYPES:
+        results['dtypes'][dtype] = run_pipeline(data_path, workdirs[dtype], dtype, step_args)
+    results['accuracy'] = compare_segments(workdirs)
+
+    print(f"\n📊 float32 / float64")
+    for step in STEPS:
+        f64, f32 = results['dtypes']['float64'][step], results['dtypes']['float32'][step]
+        print(f"   {step:<20}temps x{f32['wall_s'] / f64['wall_s']:.2f}"
+              f"   pic RSS x{f32['rss_peak_bytes'] / f64['rss_peak_bytes']:.2f}")
+    accuracy = results['accuracy']
+    print(f"   k retenu {accuracy['best_k']}, composantes {accuracy['n_components']}, "
+          f"segments identiques {accuracy['agreement']:.4%}, ARI {accuracy['ari']:.4f}")
+    save_json(results, LATEST_PATH)
+    print(f"\nMesures sauvegardées dans {LATEST_PATH}")
+    if not args.keep_workdir:
+        import shutil
+        shutil.rmtree(root)
+
+    unchanged = (accuracy['best_k']['float32'] == accuracy['best_k']['float64']
+                 and accuracy['agreement'] >= MIN_AGREEMENT)
+    print("✅ Segments inchangés en float32." if unchanged else "❌ Les segments float32 diffèrent du float64.")
+    return 0 if unchanged else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
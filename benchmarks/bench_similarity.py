@@ -0,0 +1,174 @@
+"""
+bench_similarity.py
+Rappel et latence de l'index de similarité (model_ia_steps/similarity_index.py) selon le nombre de
+listes sondées (nprobe).
+
+La vérité terrain est la recherche exacte de l'index (nprobe=None, bornée par les rayons des listes) ; le rappel@k est la part des voisins
+renvoyés dont la distance ne dépasse pas celle du k-ième vrai voisin (les ex æquo, fréquents entre
+utilisateurs aux comportements identiques, comptent comme trouvés). Les latences sont mesurées par
+requête isolée (p50/p99) et par lots (débit). Un KDTree exact (scikit-learn, en mémoire) sert de référence.
+
+Usage (depuis la racine du projet) :
+    python -m benchmarks.bench_similarity --users 10M
+    python -m benchmarks.bench_similarity --input model_ia_steps/features_pca.csv
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath('model_ia_steps'))
+from similarity_index import SimilarityIndex, build_index  # noqa: E402
+
+# =============================================================================
+# CONSTANTES DE CONFIGURATION
+# =============================================================================
+
+RESULTS_DIR = os.path.join('benchmarks', 'results')
+LATEST_PATH = os.path.join(RESULTS_DIR, 'similarity_latest.json')
+
+DEFAULT_NPROBES = '1,2,4,8,16,32'
+N_QUERIES = 1000
+N_SINGLE_QUERIES = 200
+K = 10
+SEED = 42
+
+# Population synthétique : mélange gaussien dans un espace de dimension DIM
+DIM = 5
+N_MODES = 12
+
+# =============================================================================
+# MESURES
+# =============================================================================
+
+def synthetic_embeddings(n_users: int, dim: int = DIM, seed: int = SEED):
+    """Coordonnées de type PCA : mélange de gaussiennes anisotropes, et user_id séquentiels."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(scale=3.0, size=(N_MODES, dim))
+    scales = rng.uniform(0.2, 1.5, size=(N_MODES, dim))
+    modes = rng.choice(N_MODES, size=n_users, p=rng.dirichlet(np.ones(N_MODES)))
+    vectors = np.empty((n_users, dim), dtype=np.float32)
+    for start in range(0, n_users, 1000000):
+        block = modes[start:start + 1000000]
+        vectors[start:start + len(block)] = centers[block] + scales[block] * rng.standard_normal((len(block), dim))
+    return vectors, np.arange(500000000, 500000000 + n_users, dtype=np.int64)
+
+def recall_at_k(distances, true_distances) -> float:
+    kth = true_distances[:, -1:]
+    return float((distances <= kth * (1 + 1e-4) + 1e-6).mean())
+
+def single_query_latencies(index: SimilarityIndex, queries, k: int, nprobe: int) -> List[float]:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query[None, :], k, nprobe)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    values = np.array(latencies) * 1000
+    return {'p50_ms': round(float(np.percentile(values, 50)), 4), 'p99_ms': round(float(np.percentile(values, 99)), 4)}
+
+def run_benchmark(vectors, user_ids, nprobes: List[int], k: int = K, n_lists=None,
+                  kdtree: bool = True) -> Dict[str, Any]:
+    rng = np.random.default_rng(SEED)
+    queries = vectors[rng.choice(len(vectors), size=min(N_QUERIES, len(vectors)), replace=False)]
+    results: Dict[str, Any] = {'n_users': int(len(vectors)), 'dim': int(vectors.shape[1]), 'k': k, 'runs': []}
+    with tempfile.TemporaryDirectory(prefix='similarity_index_') as index_dir:
+        start = time.perf_counter()
+        meta = build_index(vectors, user_ids, index_dir, n_lists)
+        results['build_s'] = round(time.perf_counter() - start, 3)
+        results['n_lists'] = meta['n_lists']
+        results['index_bytes'] = sum(os.path.getsize(os.path.join(index_dir, name)) for name in os.listdir(index_dir))
+        print(f"Index : {meta['n_lists']} listes, {results['index_bytes'] / 2**20:.0f} MB, "
+              f"construit en {results['build_s']:.1f} s")
+
+        index = SimilarityIndex.load(index_dir)
+        start = time.perf_counter()
+        _, true_distances = index.search(queries, k, nprobe=None)
+        exact_batch_s = time.perf_counter() - start
+        for nprobe in sorted(n for n in nprobes if n < index.n_lists) + [None]:
+            if nprobe is None:
+                distances, batch_s = true_distances, exact_batch_s
+            else:
+                start = time.perf_counter()
+                _, distances = index.search(queries, k, nprobe)
+                batch_s = time.perf_counter() - start
+            run = {
+                'method': 'ivf' if nprobe is not None else 'ivf_exact',
+                'nprobe': nprobe,
+                'recall': recall_at_k(distances, true_distances),
+                'batch_queries_per_s': round(len(queries) / batch_s, 1),
+            }
+            run.update(summarize(single_query_latencies(index, queries[:N_SINGLE_QUERIES], k, nprobe)))
+            results['runs'].append(run)
+            print(f"   {'exacte' if nprobe is None else f'nprobe={nprobe}':<12}rappel@{k} {run['recall']:.4f}   "
+                  f"p50 {run['p50_ms']:.3f} ms   p99 {run['p99_ms']:.3f} ms   "
+                  f"{run['batch_queries_per_s']:.0f} requêtes/s par lots")
+
+    if kdtree:
+        from sklearn.neighbors import KDTree
+        start = time.perf_counter()
+        tree = KDTree(vectors)
+        build_s = time.perf_counter() - start
+        start = time.perf_counter()
+        distances, _ = tree.query(queries, k=k)
+        batch_s = time.perf_counter() - start
+        latencies = []
+        for query in queries[:N_SINGLE_QUERIES]:
+            start = time.perf_counter()
+            tree.query(query[None, :], k=k)
+            latencies.append(time.perf_counter() - start)
+        run = {'method': 'kdtree', 'nprobe': None, 'build_s': round(build_s, 3),
+               'recall': recall_at_k(distances, true_distances),
+               'batch_queries_per_s': round(len(queries) / batch_s, 1)}
+        run.update(summarize(latencies))
+        results['runs'].append(run)
+        print(f"   KDTree (en mémoire, construit en {build_s:.1f} s) : rappel@{k} {run['recall']:.4f}   "
+              f"p50 {run['p50_ms']:.3f} ms   p99 {run['p99_ms']:.3f} ms   {run['batch_queries_per_s']:.0f} requêtes/s par lots")
+    return results
+
+# =============================================================================
+# POINT D'ENTRÉE
+# =============================================================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Rappel et latence de l'index de similarité.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--users', default='1M', help="Population synthétique (ex. 100k, 10M)")
+    source.add_argument('--input', help="CSV de coordonnées PCA (user_id, PC1, ...) au lieu de données synthétiques")
+    parser.add_argument('--nprobe', default=DEFAULT_NPROBES, help=f"Valeurs de nprobe (défaut : {DEFAULT_NPROBES})")
+    parser.add_argument('--n-lists', type=int, default=None, help="Nombre de listes de l'index")
+    parser.add_argument('--k', type=int, default=K, help="Nombre de voisins")
+    parser.add_argument('--no-kdtree', action='store_true', help="Sans la référence KDTree")
+    return parser.parse_args()
+
+def main():
+    from benchmarks.synthetic_features import parse_size
+
+    args = parse_args()
+    if args.input:
+        import pandas as pd
+        df = pd.read_csv(args.input)
+        user_ids = df.pop('user_id').to_numpy() if 'user_id' in df.columns else np.arange(len(df))
+        vectors = df.to_numpy(dtype=np.float32)
+        del df
+    else:
+        vectors, user_ids = synthetic_embeddings(parse_size(args.users))
+    print(f"\n🚀 Index de similarité : {len(vectors)} utilisateurs, dimension {vectors.shape[1]}")
+    nprobes = [int(v) for v in args.nprobe.split(',') if v.strip()]
+    results = run_benchmark(vectors, user_ids, nprobes, args.k, args.n_lists, not args.no_kdtree)
+    results['source'] = args.input or f"synthetic:{args.users}"
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(LATEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nMesures sauvegardées dans {LATEST_PATH}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""
+load_test_scoring.py
+Test de charge du service de segmentation (model_ia_steps/scoring_service.py) en local.
+Plusieurs clients (threads, connexions HTTP persistantes) envoient des requêtes POST /segments
+pendant une durée fixe ; le script rapporte le débit, les latences côté client (p50/p90/p99/max)
+et les indicateurs du serveur (/stats), et les sauvegarde dans benchmarks/results/.
+
+Usage (depuis la racine du projet) :
+    python -m benchmarks.load_test_scoring --start-server --concurrency 32 --duration 20
+    python -m benchmarks.load_test_scoring --url http://127.0.0.1:8080 --users-per-request 10
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+
+# =============================================================================
+# CONSTANTES DE CONFIGURATION
+# =============================================================================
+
+RESULTS_DIR = os.path.join('benchmarks', 'results')
+LATEST_PATH = os.path.join(RESULTS_DIR, 'scoring_load_latest.json')
+FEATURES_CSV = os.path.join('output', 'features_all_users.csv')
+SERVICE_SCRIPT = os.path.join('model_ia_steps', 'scoring_service.py')
+
+DEFAULT_URL = 'http://127.0.0.1:8080'
+CONCURRENCY = 16
+DURATION_S = 10.0
+USERS_PER_REQUEST = 1
+
+# Utilisateurs réels chargés pour construire les requêtes
+POOL_SIZE = 10000
+
+# Attente maximale du démarrage du service (--start-server)
+STARTUP_TIMEOUT_S = 30.0
+
+# =============================================================================
+# FONCTIONS UTILITAIRES
+# =============================================================================
+
+def load_user_pool(path: str, size: int = POOL_SIZE) -> List[Dict[str, Any]]:
+    """Premiers utilisateurs du fichier de features, au format attendu par POST /segments."""
+    df = pd.read_csv(path, nrows=size)
+    return json.loads(df.to_json(orient='records'))
+
+def get_json(conn: http.client.HTTPConnection, path: str) -> Dict[str, Any]:
+    conn.request('GET', path)
+    response = conn.getresponse()
+    return json.loads(response.read())
+
+def open_connection(host: str, port: int) -> http.client.HTTPConnection:
+    """Connexion persistante sans algorithme de Nagle (requêtes courtes envoyées immédiatement)."""
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    conn.connect()
+    conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return conn
+
+def wait_for_service(host: str, port: int, timeout: float = STARTUP_TIMEOUT_S) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=1)
+            get_json(conn, '/health')
+            conn.close()
+            return True
+        except (OSError, http.client.HTTPException, ValueError):
+            time.sleep(0.2)
+    return False
+
+# =============================================================================
+# CLIENTS
+# =============================================================================
+
+def client_loop(host: str, port: int, pool: List[Dict[str, Any]], users_per_request: int,
+                deadline: float, seed: int, latencies: List[float], errors: List[int]):
+    """Envoie des requêtes jusqu'à `deadline` sur une connexion persistante ; latences en secondes."""
+    rng = np.random.default_rng(seed)
+    conn = open_connection(host, port)
+    headers = {'Content-Type': 'application/json'}
+    while time.perf_counter() < deadline:
+        users = [pool[i] for i in rng.integers(0, len(pool), users_per_request)]
+        body = json.dumps({'users': users})
+        start = time.perf_counter()
+        try:
+            conn.request('POST', '/segments', body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+                continue
+        except (OSError, http.client.HTTPException):
+            errors.append(0)
+            conn.close()
+            try:
+                conn = open_connection(host, port)
+            except OSError:
+                time.sleep(0.1)
+            continue
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+def run_load_test(url: str, concurrency: int, duration: float, users_per_request: int,
+                  pool: List[Dict[str, Any]]) -> Dict[str, Any]:
+    parsed = urlparse(url)
+    host, port = parsed.hostname, parsed.port or 80
+    per_client: List[List[float]] = [[] for _ in range(concurrency)]
+    errors: List[int] = []
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=client_loop,
+                         args=(host, port, pool, users_per_request, deadline, i, per_client[i], errors))
+        for i in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([value for values in per_client for value in values])
+    conn = http.client.HTTPConnection(host, port, timeout=5)
+    server_stats = get_json(conn, '/stats')
+    conn.close()
+    result = {
+        'url': url,
+        'concurrency': concurrency,
+        'duration_s': round(elapsed, 3),
+        'users_per_request': users_per_request,
+        'requests': int(len(latencies)),
+        'errors': len(errors),
+        'requests_per_s': round(len(latencies) / elapsed, 1),
+        'users_per_s': round(len(latencies) * users_per_request / elapsed, 1),
+        'server': server_stats,
+    }
+    for q in (50, 90, 99):
+        result[f'p{q}_ms'] = round(float(np.percentile(latencies, q) * 1000), 3) if len(latencies) else None
+    result['max_ms'] = round(float(latencies.max() * 1000), 3) if len(latencies) else None
+    return result
+
+def print_report(result: Dict[str, Any]):
+    print(f"\n📊 Test de charge : {result['concurrency']} clients, {result['duration_s']} s, "
+          f"{result['users_per_request']} utilisateur(s) par requête")
+    print(f"   requêtes : {result['requests']} ({result['requests_per_s']} req/s, "
+          f"{result['users_per_s']} utilisateurs/s), erreurs : {result['errors']}")
+    print(f"   latence client : p50 {result['p50_ms']} ms, p90 {result['p90_ms']} ms, "
+          f"p99 {result['p99_ms']} ms, max {result['max_ms']} ms")
+    server = result['server']
+    print(f"   serveur : p50 {server['p50_ms']:.3f} ms, p99 {server['p99_ms']:.3f} ms, "
+          f"{server['mean_requests_per_batch']:.1f} requêtes par micro-lot")
+
+# =============================================================================
+# POINT D'ENTRÉE
+# =============================================================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Test de charge du service de segmentation en local.")
+    parser.add_argument('--url', default=DEFAULT_URL, help=f"Adresse du service (défaut : {DEFAULT_URL})")
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help="Clients simultanés")
+    parser.add_argument('--duration', type=float, default=DURATION_S, help="Durée du test (secondes)")
+    parser.add_argument('--users-per-request', type=int, default=USERS_PER_REQUEST)
+    parser.add_argument('--input', default=FEATURES_CSV, help="Features des utilisateurs envoyés")
+    parser.add_argument('--start-server', action='store_true',
+                        help="Démarre le service dans un sous-processus le temps du test")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    pool = load_user_pool(args.input)
+    server = None
+    parsed = urlparse(args.url)
+    if args.start_server:
+        server = subprocess.Popen([sys.executable, SERVICE_SCRIPT, '--host', parsed.hostname,
+                                   '--port', str(parsed.port or 80)])
+    try:
+        if not wait_for_service(parsed.hostname, parsed.port or 80):
+            print(f"❌ Service injoignable sur {args.url}")
+            sys.exit(1)
+        result = run_load_test(args.url, args.concurrency, args.duration, args.users_per_request, pool)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    result['timestamp'] = datetime.now().isoformat(timespec='seconds')
+    print_report(result)
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(LATEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print(f"Résultats sauvegardés dans {LATEST_PATH}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,405 @@
+"""
+synthetic_events.py
+Génération déterministe et parallèle d'événements synthétiques au schéma attendu par etl_steps/transform.py
+(event_time, event_type, product_id, category_id, category_code, brand, price, user_id, user_session),
+pour tester le pipeline à l'échelle de la production sans données clients.
+
+Caractéristiques reproduites :
+- popularité Zipfienne des utilisateurs et des produits ;
+- entonnoir view -> cart -> purchase (et remove_from_cart) ;
+- doublons exacts, valeurs manquantes et prix aberrants injectés à des taux configurables.
+
+Même graine et même nombre de shards = fichiers identiques, quel que soit le nombre de workers.
+
+Usage (depuis la racine du projet) :
+    python -m benchmarks.synthetic_events --events 300M --shards 64 --workers 8 --format csv.gz
+"""
+import argparse
+import gzip
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from etl_steps.transform import VALID_EVENT_TYPES, PRICE_MAX_THRESHOLD
+
+# =============================================================================
+# CONSTANTES DE CONFIGURATION
+# =============================================================================
+
+# Colonnes dans l'ordre des fichiers sources
+EVENT_COLUMNS = ['event_time', 'event_type', 'product_id', 'category_id', 'category_code',
+                 'brand', 'price', 'user_id', 'user_session']
+
+# Entonnoir : paniers par vue, achats et retraits par panier
+CART_PER_VIEW = 0.07
+PURCHASE_PER_CART = 0.30
+REMOVE_PER_CART = 0.25
+
+# Nombre moyen d'événements par utilisateur (détermine le nombre d'utilisateurs par défaut)
+EVENTS_PER_USER = 20
+
+# Exposants de Zipf (popularité selon le rang)
+USER_ZIPF_EXPONENT = 0.7
+PRODUCT_ZIPF_EXPONENT = 0.9
+
+# Catalogue
+N_PRODUCTS = 50000
+N_CATEGORIES = 500
+BASE_USER_ID = 500000000
+BASE_PRODUCT_ID = 1000000
+BASE_CATEGORY_ID = 2053013552226107603
+CATEGORY_CODES = ['electronics.smartphone', 'appliances.kitchen.refrigerators', 'computers.notebook',
+                  'apparel.shoes', 'furniture.living_room.sofa', 'electronics.audio.headphone',
+                  'construction.tools.drill', 'kids.toys', 'auto.accessories.player', 'sport.bicycle']
+BRANDS = ['samsung', 'apple', 'xiaomi', 'huawei', 'lg', 'sony', 'bosch', 'lenovo', 'acer', 'nike']
+
+# Anomalies injectées
+DUPLICATE_RATE = 0.002
+PRICE_OUTLIER_RATE = 0.001
+CATALOG_NA_RATES = {'category_code': 0.30, 'brand': 0.12}
+EVENT_NA_RATES = {'brand': 0.02, 'user_session': 0.0005, 'price': 0.0005, 'user_id': 0.0002}
+
+# Période couverte (un mois, comme les fichiers sources)
+START_TIME = '2019-10-01'
+PERIOD_SECONDS = 31 * 24 * 3600
+
+# Version du générateur (à incrémenter si les données produites changent, les jeux en cache sont alors régénérés)
+GENERATOR_VERSION = 2
+
+# Écriture
+BLOCK_SIZE = 1000000
+OUTPUT_FORMATS = ['csv', 'csv.gz', 'parquet']
+GZIP_LEVEL = 1
+DEFAULT_OUTPUT_DIR = os.path.join('benchmarks', 'data', 'synthetic')
+
+# =============================================================================
+# PRIMITIVES VECTORISÉES
+# =============================================================================
+
+_HEX_DIGITS = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+_UUID_DIGIT_POSITIONS = np.array([i for i in range(36) if i not in (8, 13, 18, 23)])
+
+def mix64(x: np.ndarray) -> np.ndarray:
+    """Hachage splitmix64 vectorisé (uint64 -> uint64, débordements volontaires)."""
+    x = x.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+def uuid_strings(keys: np.ndarray) -> np.ndarray:
+    """Chaînes au format UUID (8-4-4-4-12) dérivées de façon déterministe de clés entières."""
+    keys = keys.astype(np.uint64)
+    raw = np.stack([mix64(keys), mix64(keys ^ np.uint64(0x5851F42D4C957F2D))], axis=1)
+    raw = raw.view(np.uint8).reshape(len(keys), 16)
+    digits = np.empty((len(keys), 32), dtype=np.uint8)
+    digits[:, 0::2] = _HEX_DIGITS[raw >> 4]
+    digits[:, 1::2] = _HEX_DIGITS[raw & 15]
+    out = np.full((len(keys), 36), ord('-'), dtype=np.uint8)
+    out[:, _UUID_DIGIT_POSITIONS] = digits
+    return np.array([b.decode('ascii') for b in out.view('S36').ravel().tolist()], dtype=object)
+
+def bounded_zipf(rng: np.random.Generator, n: int, exponent: float, size: int) -> np.ndarray:
+    """
+    Rangs (0 .. n-1) tirés selon une loi de Zipf bornée, par inversion de la fonction de répartition
+    continue : mémoire O(1) quelle que soit la taille de la population.
+    """
+    u = rng.random(size)
+    if abs(exponent - 1.0) < 1e-9:
+        x = np.exp(u * math.log(n + 1))
+    else:
+        a = 1.0 - exponent
+        x = (1.0 + u * ((n + 1) ** a - 1.0)) ** (1.0 / a)
+    return np.minimum(x.astype(np.int64) - 1, n - 1)
+
+def scatter_ranks(ranks: np.ndarray, n: int) -> np.ndarray:
+    """Bijection rang -> identifiant, pour que les plus populaires ne soient pas les premiers identifiants."""
+    multiplier = 2654435761
+    while math.gcd(multiplier, n) != 1:
+        multiplier += 2
+    return (ranks * multiplier + 12345) % n
+
+def time_of_day_strings() -> np.ndarray:
+    """Les 86400 suffixes ' HH:MM:SS UTC' d'une journée."""
+    return np.array([f" {s // 3600:02d}:{s % 3600 // 60:02d}:{s % 60:02d} UTC" for s in range(86400)], dtype=object)
+
+def day_strings() -> np.ndarray:
+    days = pd.date_range(START_TIME, periods=PERIOD_SECONDS // 86400 + 1, freq='D')
+    return np.array(days.strftime('%Y-%m-%d'), dtype=object)
+
+def funnel_probabilities() -> List[float]:
+    """Probabilités des types d'événements (ordre de VALID_EVENT_TYPES) déduites des ratios de l'entonnoir."""
+    weights = {
+        'view': 1.0,
+        'cart': CART_PER_VIEW,
+        'remove_from_cart': CART_PER_VIEW * REMOVE_PER_CART,
+        'purchase': CART_PER_VIEW * PURCHASE_PER_CART,
+    }
+    total = sum(weights[t] for t in VALID_EVENT_TYPES)
+    return [weights[t] / total for t in VALID_EVENT_TYPES]
+
+# =============================================================================
+# GÉNÉRATION
+# =============================================================================
+
+def build_catalog(seed: int) -> Dict[str, np.ndarray]:
+    """Catalogue produits (catégorie, code, marque, prix de base), identique dans tous les workers."""
+    rng = np.random.default_rng(np.random.SeedSequence([seed, 0]))
+    category_idx = rng.integers(0, N_CATEGORIES, N_PRODUCTS)
+    category_code = np.asarray(CATEGORY_CODES, dtype=object)[category_idx % len(CATEGORY_CODES)]
+    category_code[rng.random(N_PRODUCTS) < CATALOG_NA_RATES['category_code']] = None
+    brand = np.asarray(BRANDS, dtype=object)[rng.integers(0, len(BRANDS), N_PRODUCTS)]
+    brand[rng.random(N_PRODUCTS) < CATALOG_NA_RATES['brand']] = None
+    return {
+        'category_id': BASE_CATEGORY_ID + category_idx,
+        'category_code': category_code,
+        'brand': brand,
+        'price': rng.lognormal(mean=4.0, sigma=1.2, size=N_PRODUCTS),
+    }
+
+class BlockGenerator:
+    """Génère des blocs d'événements pour une population et un catalogue donnés."""
+
+    def __init__(self, seed: int, n_users: int):
+        self.n_users = n_users
+        self.catalog = build_catalog(seed)
+        self.event_types = np.asarray(VALID_EVENT_TYPES, dtype=object)
+        self.event_probabilities = funnel_probabilities()
+        self.days = day_strings()
+        self.times_of_day = time_of_day_strings()
+
+    def generate(self, rng: np.random.Generator, n_events: int, t_start: int, t_end: int) -> pd.DataFrame:
+        """
+        Génère n_events événements triés par date dans la fenêtre [t_start, t_end) (secondes depuis START_TIME).
+        Les doublons injectés sont des copies exactes, adjacentes à leur original.
+        """
+        n_duplicates = int(round(n_events * DUPLICATE_RATE))
+        n_base = n_events - n_duplicates
+
+        offsets = np.sort(rng.integers(t_start, max(t_end, t_start + 1), n_base))
+        user_idx = scatter_ranks(bounded_zipf(rng, self.n_users, USER_ZIPF_EXPONENT, n_base), self.n_users)
+        product_idx = scatter_ranks(bounded_zipf(rng, N_PRODUCTS, PRODUCT_ZIPF_EXPONENT, n_base), N_PRODUCTS)
+        type_idx = rng.choice(len(self.event_types), n_base, p=self.event_probabilities)
+        price = np.round(self.catalog['price'][product_idx] * rng.uniform(0.95, 1.05, n_base), 2)
+
+        # Prix aberrants : moitié à zéro, moitié au-delà du seuil maximal
+        outliers = np.flatnonzero(rng.random(n_base) < PRICE_OUTLIER_RATE)
+        price[outliers[::2]] = 0.0
+        price[outliers[1::2]] = PRICE_MAX_THRESHOLD + price[outliers[1::2]] * 1000
+        price[rng.random(n_base) < EVENT_NA_RATES['price']] = np.nan
+
+        # Valeurs manquantes injectées avant la duplication : les doublons en sont des copies exactes
+        day = offsets // 86400
+        brand = self.catalog['brand'][product_idx]
+        brand[rng.random(n_base) < EVENT_NA_RATES['brand']] = None
+        user_session = uuid_strings(user_idx.astype(np.uint64) * np.uint64(64) + day.astype(np.uint64))
+        user_session[rng.random(n_base) < EVENT_NA_RATES['user_session']] = None
+        user_id = pd.array(BASE_USER_ID + user_idx, dtype='Int64')
+        user_id[rng.random(n_base) < EVENT_NA_RATES['user_id']] = pd.NA
+
+        # Doublons exacts : lignes recopiées puis replacées à côté de l'original
+        order = np.arange(n_base)
+        if n_duplicates > 0:
+            order = np.sort(np.concatenate([order, rng.integers(0, n_base, n_duplicates)]), kind='stable')
+        offsets = offsets[order]
+        product_idx = product_idx[order]
+
+        return pd.DataFrame({
+            'event_time': self.days[day[order]] + self.times_of_day[offsets % 86400],
+            'event_type': self.event_types[type_idx[order]],
+            'product_id': BASE_PRODUCT_ID + product_idx,
+            'category_id': self.catalog['category_id'][product_idx],
+            'category_code': self.catalog['category_code'][product_idx],
+            'brand': brand[order],
+            'price': price[order],
+            'user_id': user_id[order],
+            'user_session': user_session[order],
+        }, columns=EVENT_COLUMNS)
+
+def default_n_users(n_events: int) -> int:
+    return max(n_events // EVENTS_PER_USER, 1)
+
+def generate_events(n_events: int, seed: int = 42, n_users: Optional[int] = None) -> pd.DataFrame:
+    """
+    Génère un DataFrame d'événements synthétiques couvrant toute la période.
+    Args:
+        n_events: Nombre d'événements.
+        seed: Graine aléatoire (même graine = mêmes données).
+        n_users: Nombre d'utilisateurs distincts (défaut : n_events / EVENTS_PER_USER).
+    """
+    generator = BlockGenerator(seed, n_users or default_n_users(n_events))
+    rng = np.random.default_rng(np.random.SeedSequence([seed, 1]))
+    return generator.generate(rng, n_events, 0, PERIOD_SECONDS)
+
+# =============================================================================
+# ÉCRITURE DES SHARDS
+# =============================================================================
+
+def shard_path(output_dir: str, shard_index: int, fmt: str) -> str:
+    return os.path.join(output_dir, f"events_{shard_index:05d}.{fmt}")
+
+class ShardWriter:
+    """
+    Écrit les blocs d'un shard en csv, csv.gz ou parquet dans un fichier temporaire renommé à la fin.
+    Le CSV est toujours écrit par pandas (to_csv) : les écrivains pandas et pyarrow ne formatent pas les valeurs
+    de la même façon, et une même graine doit donner les mêmes octets dans tous les environnements.
+    pyarrow n'est requis que pour le format parquet.
+    """
+
+    def __init__(self, path: str, fmt: str):
+        self.path = path
+        self.fmt = fmt
+        self.tmp_path = path + '.tmp'
+        self.header = True
+        self.parquet_writer = None
+        self.pa = None
+        if fmt == 'parquet':
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise ImportError("Le format parquet nécessite pyarrow (pip install pyarrow)")
+            self.pa = pyarrow
+        self.handle = None
+        if fmt == 'csv.gz':
+            self.handle = gzip.open(self.tmp_path, 'wb', compresslevel=GZIP_LEVEL)
+        elif fmt == 'csv':
+            self.handle = open(self.tmp_path, 'wb')
+
+    def write(self, block: pd.DataFrame):
+        if self.fmt == 'parquet':
+            table = self.pa.Table.from_pandas(block, preserve_index=False)
+            if self.parquet_writer is None:
+                self.parquet_writer = self.pa.parquet.ParquetWriter(self.tmp_path, table.schema)
+            self.parquet_writer.write_table(table)
+        else:
+            block.to_csv(self.handle, mode='wb', header=self.header, index=False)
+        self.header = False
+
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        if self.handle is not None:
+            self.handle.close()
+        os.replace(self.tmp_path, self.path)
+
+def write_shard(task: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Écrit un shard (exécuté dans un worker). Le shard couvre une tranche de la période, de sorte que
+    la concaténation des shards dans l'ordre est triée par date, comme les fichiers sources.
+    """
+    n_events, path = task['n_events'], task['path']
+    generator = BlockGenerator(task['seed'], task['n_users'])
+    block_seeds = np.random.SeedSequence([task['seed'], 2, task['shard_index']]).spawn(
+        max(math.ceil(n_events / task['block_size']), 1))
+    t_start, t_end = task['t_start'], task['t_end']
+
+    started = time.perf_counter()
+    writer = ShardWriter(path, task['format'])
+    for block_index, block_start in enumerate(range(0, n_events, task['block_size'])):
+        size = min(task['block_size'], n_events - block_start)
+        # Chaque bloc couvre une sous-fenêtre proportionnelle à sa taille
+        b_start = t_start + (t_end - t_start) * block_start // n_events
+        b_end = t_start + (t_end - t_start) * (block_start + size) // n_events
+        writer.write(generator.generate(np.random.default_rng(block_seeds[block_index]), size, b_start, b_end))
+    writer.close()
+    return {'path': path, 'rows': n_events, 'bytes': os.path.getsize(path),
+            'seconds': time.perf_counter() - started}
+
+def generate_dataset(output_dir: str, n_events: int, n_shards: int = 1, workers: int = 1, fmt: str = 'csv',
+                     seed: int = 42, n_users: Optional[int] = None,
+                     block_size: int = BLOCK_SIZE) -> List[Dict[str, Any]]:
+    """
+    Génère n_events événements répartis en n_shards fichiers, écrits en parallèle par `workers` processus.
+    Returns:
+        Liste des shards écrits (chemin, lignes, octets, durée).
+    """
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Format non supporté : {fmt} (attendu : {OUTPUT_FORMATS})")
+    os.makedirs(output_dir, exist_ok=True)
+    n_users = n_users or default_n_users(n_events)
+    n_shards = max(min(n_shards, n_events), 1)
+
+    tasks = []
+    for shard_index in range(n_shards):
+        start = n_events * shard_index // n_shards
+        end = n_events * (shard_index + 1) // n_shards
+        tasks.append({
+            'shard_index': shard_index,
+            'n_events': end - start,
+            't_start': PERIOD_SECONDS * shard_index // n_shards,
+            't_end': PERIOD_SECONDS * (shard_index + 1) // n_shards,
+            'seed': seed,
+            'n_users': n_users,
+            'format': fmt,
+            'block_size': block_size,
+            'path': shard_path(output_dir, shard_index, fmt),
+        })
+
+    if workers <= 1:
+        return [write_shard(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(write_shard, tasks))
+
+def write_events_csv(output_path: str, n_events: int, seed: int = 42, block_size: int = BLOCK_SIZE) -> str:
+    """Écrit un unique fichier CSV de n_events événements (généré par blocs pour borner la mémoire)."""
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    write_shard({
+        'shard_index': 0,
+        'n_events': n_events,
+        't_start': 0,
+        't_end': PERIOD_SECONDS,
+        'seed': seed,
+        'n_users': default_n_users(n_events),
+        'format': 'csv',
+        'block_size': block_size,
+        'path': output_path,
+    })
+    return output_path
+
+# =============================================================================
+# POINT D'ENTRÉE
+# =============================================================================
+
+def parse_count(value: str) -> int:
+    """Convertit '300M', '500k', '2000' en entier."""
+    value = value.strip().upper()
+    factors = {'K': 1000, 'M': 1000000, 'G': 1000000000}
+    if value and value[-1] in factors:
+        return int(float(value[:-1]) * factors[value[-1]])
+    return int(value)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Générateur d'événements synthétiques pour les tests de charge.")
+    parser.add_argument('--events', default='10M', help="Nombre total d'événements (ex : 300M)")
+    parser.add_argument('--users', default=None, help="Nombre d'utilisateurs (défaut : événements / 20)")
+    parser.add_argument('--shards', type=int, default=None, help="Nombre de fichiers (défaut : 1 par tranche de 10M)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Processus d'écriture")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv', help="Format des shards")
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR, help="Dossier de sortie")
+    parser.add_argument('--seed', type=int, default=42, help="Graine (même graine = mêmes fichiers)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    n_events = parse_count(args.events)
+    n_users = parse_count(args.users) if args.users else None
+    n_shards = args.shards or max(math.ceil(n_events / 10000000), 1)
+    print(f"🧪 Génération de {n_events} événements en {n_shards} shard(s) {args.format} "
+          f"avec {args.workers} worker(s) dans {args.output_dir}...")
+    started = time.perf_counter()
+    shards = generate_dataset(args.output_dir, n_events, n_shards=n_shards, workers=args.workers,
+                              fmt=args.format, seed=args.seed, n_users=n_users)
+    elapsed = time.perf_counter() - started
+    total_bytes = sum(s['bytes'] for s in shards)
+    print(f"✅ {n_events} événements écrits en {elapsed:.1f} s ({n_events / elapsed:.0f} lignes/s, "
+          f"{total_bytes / (1024 ** 3):.2f} GB)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
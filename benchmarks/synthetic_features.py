@@ -0,0 +1,123 @@
+"""
+synthetic_features.py
+Génération déterministe de populations synthétiques au format de output/features_all_users.csv
+(une ligne de features par utilisateur), pour mesurer les étapes du modèle à grande échelle sans
+passer par l'ETL.
+
+La population mélange quelques profils (visiteurs occasionnels, acheteurs réguliers, gros acheteurs,
+explorateurs) ; chaque profil suit l'entonnoir view -> cart -> purchase (et remove_from_cart) avec ses
+propres taux, de sorte que le clustering retrouve une structure comparable aux données réelles.
+Les utilisateurs sont générés par blocs : même graine = même fichier, quelle que soit la taille de bloc.
+
+Usage (depuis la racine du projet) :
+    python -m benchmarks.synthetic_features --users 10M --output benchmarks/data/features_10M.csv
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+# =============================================================================
+# CONSTANTES DE CONFIGURATION
+# =============================================================================
+
+# Colonnes dans l'ordre de output/features_all_users.csv
+FEATURE_COLUMNS = ['user_id', 'cart', 'purchase', 'remove_from_cart', 'view', 'total_spent',
+                   'unique_categories', 'unique_brands', 'avg_purchase_price', 'conversion_rate']
+
+# Profils : part de la population, vues moyennes (log-normale), taux de l'entonnoir, prix moyen (log)
+PROFILES: List[Dict[str, float]] = [
+    {'share': 0.70, 'views_log_mean': 1.3, 'cart_rate': 0.03, 'purchase_rate': 0.20, 'price_log_mean': 3.0},
+    {'share': 0.18, 'views_log_mean': 2.2, 'cart_rate': 0.12, 'purchase_rate': 0.45, 'price_log_mean': 3.8},
+    {'share': 0.05, 'views_log_mean': 3.5, 'cart_rate': 0.10, 'purchase_rate': 0.50, 'price_log_mean': 5.2},
+    {'share': 0.07, 'views_log_mean': 3.8, 'cart_rate': 0.02, 'purchase_rate': 0.10, 'price_log_mean': 3.5},
+]
+VIEWS_LOG_SIGMA = 0.8
+PRICE_LOG_SIGMA = 0.6
+REMOVE_PER_CART = 0.25
+CATEGORY_PER_VIEW = 0.6
+N_BRANDS = 12
+
+BASE_USER_ID = 500000000
+BLOCK_SIZE = 1000000
+SEED = 42
+
+# =============================================================================
+# GÉNÉRATION
+# =============================================================================
+
+def parse_size(value: str) -> int:
+    """Convertit '1M', '500k', '2000' en nombre d'utilisateurs."""
+    value = value.strip().upper()
+    factors = {'K': 1000, 'M': 1000000, 'G': 1000000000}
+    if value and value[-1] in factors:
+        return int(float(value[:-1]) * factors[value[-1]])
+    return int(value)
+
+def generate_block(block_index: int, n_users: int, seed: int = SEED) -> pd.DataFrame:
+    """Features de `n_users` utilisateurs ; le bloc i dépend seulement de (seed, i)."""
+    rng = np.random.default_rng(np.random.SeedSequence([seed, block_index]))
+    shares = np.array([p['share'] for p in PROFILES])
+    profile = rng.choice(len(PROFILES), size=n_users, p=shares / shares.sum())
+
+    def per_profile(key: str) -> np.ndarray:
+        return np.array([p[key] for p in PROFILES])[profile]
+
+    view = 1 + rng.poisson(rng.lognormal(per_profile('views_log_mean'), VIEWS_LOG_SIGMA))
+    cart = rng.binomial(view, per_profile('cart_rate'))
+    purchase = rng.binomial(cart, per_profile('purchase_rate'))
+    remove = rng.binomial(cart, REMOVE_PER_CART)
+    avg_price = np.where(purchase > 0,
+                         np.round(rng.lognormal(per_profile('price_log_mean'), PRICE_LOG_SIGMA), 2), 0.0)
+    unique_categories = 1 + rng.binomial(view - 1, CATEGORY_PER_VIEW)
+    unique_brands = np.minimum(unique_categories, 1 + rng.binomial(N_BRANDS - 1, 1 - np.exp(-view / 20)))
+
+    start_id = BASE_USER_ID + block_index * BLOCK_SIZE
+    return pd.DataFrame({
+        'user_id': np.arange(start_id, start_id + n_users, dtype=np.int64),
+        'cart': cart,
+        'purchase': purchase,
+        'remove_from_cart': remove,
+        'view': view,
+        'total_spent': np.round(purchase * avg_price, 2),
+        'unique_categories': unique_categories,
+        'unique_brands': unique_brands,
+        'avg_purchase_price': avg_price,
+        'conversion_rate': purchase / view,
+    }, columns=FEATURE_COLUMNS)
+
+def write_features_csv(path: str, n_users: int, seed: int = SEED) -> str:
+    """Écrit une population de `n_users` utilisateurs, bloc par bloc (mémoire bornée par BLOCK_SIZE)."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    header = True
+    for block_index, start in enumerate(range(0, n_users, BLOCK_SIZE)):
+        block = generate_block(block_index, min(BLOCK_SIZE, n_users - start), seed)
+        block.to_csv(path, mode='w' if header else 'a', header=header, index=False)
+        header = False
+    return path
+
+# =============================================================================
+# POINT D'ENTRÉE
+# =============================================================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Génère une population synthétique de features utilisateurs.")
+    parser.add_argument('--users', default='1M', help="Nombre d'utilisateurs (ex. 100k, 10M)")
+    parser.add_argument('--output', required=True, help="Fichier CSV de sortie")
+    parser.add_argument('--seed', type=int, default=SEED, help="Graine (défaut : 42)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    n_users = parse_size(args.users)
+    start = time.perf_counter()
+    write_features_csv(args.output, n_users, args.seed)
+    print(f"{n_users} utilisateurs écrits dans {args.output} en {time.perf_counter() - start:.1f} s")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
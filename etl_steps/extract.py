@@ -9,8 +9,10 @@ import gzip
 import zipfile
 import tarfile
 import shutil
+import queue
+import threading
 from pathlib import Path
-from typing import List, Iterator, Optional, Tuple
+from typing import IO, Callable, List, Iterator, Optional, Tuple, Union
 
 # Configuration des dossiers
 EXTRACTED_CSV_DIR = "extracted_csv"
@@ -150,17 +152,82 @@ def extract_all_compressed_files() -> List[str]:
     print(f"\n✅ Extraction terminée : {len(csv_files)} fichier(s) CSV extrait(s)")
     return csv_files
 
-def extract_data_in_chunks(file_path: str, chunk_size: int = 100000) -> Iterator[pd.DataFrame]:
+def extract_data_in_chunks(file_path: Union[str, IO], chunk_size: int = 100000) -> Iterator[pd.DataFrame]:
     """
     Extrait les données d'un gros fichier CSV par morceaux (chunks).
     Args:
-        file_path: Chemin du fichier CSV.
+        file_path: Chemin du fichier CSV, ou fichier déjà ouvert (permet de suivre la position lue).
         chunk_size: Nombre de lignes par chunk.
     Returns:
         Un itérateur de DataFrames pandas.
     """
     return pd.read_csv(file_path, chunksize=chunk_size)
 
+def extract_data_adaptive(file_path: Union[str, IO], chunk_size_fn: Callable[[], int]) -> Iterator[pd.DataFrame]:
+    """
+    Extrait les données par chunks dont la taille est redemandée avant chaque lecture
+    (utilisé par le gouverneur de budget mémoire pour agrandir ou réduire les chunks en cours de route).
+    Args:
+        file_path: Chemin du fichier CSV, ou fichier déjà ouvert.
+        chunk_size_fn: Fonction retournant la taille du prochain chunk.
+    Returns:
+        Un itérateur de DataFrames pandas.
+    """
+    with pd.read_csv(file_path, chunksize=chunk_size_fn()) as reader:
+        while True:
+            try:
+                chunk = reader.get_chunk(chunk_size_fn())
+            except StopIteration:
+                return
+            if chunk.empty:
+                return
+            yield chunk
+
+def prefetch_chunks(chunks: Iterator[pd.DataFrame], depth: int = 1) -> Iterator[pd.DataFrame]:
+    """
+    Lit les chunks suivants dans un thread pendant le traitement du chunk courant
+    (le parseur C de pandas libère le GIL). Au plus `depth` chunks attendent en mémoire.
+    """
+    if depth <= 0:
+        yield from chunks
+        return
+
+    buffer: queue.Queue = queue.Queue(maxsize=depth)
+    done = object()
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def reader():
+        try:
+            for chunk in chunks:
+                if not put(chunk):
+                    return
+            put(done)
+        except BaseException as e:  # l'erreur est relancée dans le thread consommateur
+            put(e)
+
+    thread = threading.Thread(target=reader, name='chunk-prefetch', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join(timeout=1.0)
+
 def get_csv_columns(file_path: str) -> List[str]:
     """Retourne la liste des colonnes d'un fichier CSV sans tout charger en mémoire."""
     df = pd.read_csv(file_path, nrows=0)
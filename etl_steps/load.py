@@ -2,13 +2,117 @@
 load.py
 Étape 3 du pipeline ETL : Chargement des données transformées vers la destination (fichier, base, etc.).
 """
+import os
 import pandas as pd
+from typing import Callable, List, Optional
 from sqlalchemy import create_engine
 
 def save_to_csv(df: pd.DataFrame, output_path: str):
     """Enregistre le DataFrame transformé dans un fichier CSV."""
     df.to_csv(output_path, index=False)
 
+class FeatureAccumulator:
+    """
+    Accumule les features produites chunk par chunk. Sous contrainte mémoire, les features accumulées
+    sont déversées (spill) par ajout dans un CSV partiel au lieu d'attendre le concat final ;
+    ce fichier devient le fichier de sortie à la fin du traitement.
+    """
+
+    def __init__(self, output_path: str, columns: Optional[List[str]] = None):
+        self.output_path = output_path
+        self.partial_path = output_path + '.partial'
+        self.base_columns = columns or []
+        self.columns: Optional[List[str]] = None
+        self.frames: List[pd.DataFrame] = []
+        self.memory_bytes = 0
+        self.rows = 0
+        self.spilled_rows = 0
+        self.spills = 0
+
+    def add(self, df: pd.DataFrame):
+        self.frames.append(df)
+        self.memory_bytes += int(df.memory_usage(deep=True).sum())
+        self.rows += len(df)
+
+    def spill(self):
+        """Ajoute les features en mémoire au CSV partiel et libère la mémoire."""
+        if not self.frames:
+            return
+        batch = pd.concat(self.frames, ignore_index=True)
+        first_spill = self.columns is None
+        if first_spill:
+            # Les colonnes du fichier sont fixées au premier déversement
+            self.columns = [c for c in self.base_columns if c in batch.columns]
+            self.columns += [c for c in batch.columns if c not in self.columns]
+        else:
+            extra = [c for c in batch.columns if c not in self.columns]
+            if extra:
+                print(f"⚠️ Colonnes ignorées car absentes du fichier déjà écrit : {extra}")
+        batch.reindex(columns=self.columns).to_csv(
+            self.partial_path, mode='w' if first_spill else 'a', header=first_spill, index=False)
+        self.spilled_rows += len(batch)
+        self.spills += 1
+        self.frames = []
+        self.memory_bytes = 0
+
+    def finalize(self, save_fn: Callable[[pd.DataFrame, str], None] = save_to_csv) -> int:
+        """
+        Écrit le fichier de sortie : concat + save_fn si rien n'a été déversé, sinon complète
+        et renomme le CSV partiel. Retourne le nombre de lignes écrites.
+        """
+        if self.spilled_rows == 0:
+            if not self.frames:
+                return 0
+            df = pd.concat(self.frames, ignore_index=True)
+            self.frames = []
+            save_fn(df, self.output_path)
+            return len(df)
+        self.spill()
+        os.replace(self.partial_path, self.output_path)
+        return self.spilled_rows
+
+class ActivityAccumulator:
+    """
+    Activité par utilisateur (premier et dernier événement, nombre d'événements) cumulée sur tous les chunks :
+    un utilisateur peut apparaître dans plusieurs chunks, les lignes en attente sont donc réduites par
+    utilisateur dès qu'elles dépassent `compact_rows` (mémoire bornée par le nombre d'utilisateurs).
+    """
+
+    def __init__(self, output_path: str, compact_rows: int = 2000000):
+        self.output_path = output_path
+        self.compact_rows = compact_rows
+        self.frames: List[pd.DataFrame] = []
+        self.pending_rows = 0
+
+    def add(self, activity: pd.DataFrame):
+        if activity.empty:
+            return
+        self.frames.append(activity)
+        self.pending_rows += len(activity)
+        if self.pending_rows > self.compact_rows:
+            self.compact()
+
+    def compact(self):
+        if len(self.frames) <= 1:
+            return
+        combined = pd.concat(self.frames, ignore_index=True)
+        reduced = combined.groupby('user_id', sort=False).agg(
+            first_event=('first_event', 'min'), last_event=('last_event', 'max'), events=('events', 'sum'))
+        self.frames = [reduced.reset_index()]
+        self.pending_rows = len(self.frames[0])
+        # Seuil relevé si la réduction ne libère pas assez de place (beaucoup d'utilisateurs distincts)
+        self.compact_rows = max(self.compact_rows, 2 * self.pending_rows)
+
+    def finalize(self) -> int:
+        """Écrit une ligne par utilisateur, triée par user_id ; retourne le nombre d'utilisateurs."""
+        if not self.frames:
+            return 0
+        self.compact()
+        activity = self.frames[0].sort_values('user_id')
+        self.frames = []
+        activity.to_csv(self.output_path, index=False)
+        return len(activity)
+
 def save_to_database(df: pd.DataFrame, connection_string: str, table_name: str):
     """
     Enregistre le DataFrame transformé dans une base de données PostgreSQL (ex : ElephantSQL).
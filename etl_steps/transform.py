@@ -4,7 +4,7 @@ transform.py
 Version améliorée avec paramètres externalisés en constantes.
 """
 import pandas as pd
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 
 # =============================================================================
 # CONSTANTES DE CONFIGURATION - À MODIFIER SELON LES BESOINS
@@ -50,10 +50,23 @@ CLEAN_PRICE_OUTLIERS = True
 PRICE_MIN_THRESHOLD = 0.01
 PRICE_MAX_THRESHOLD = 10000.0
 
+# Bornes de prix par percentiles, sur demande (main_etl.py --price-bounds-from : sketch des prix d'un lancement
+# sur les mêmes fichiers, voir model_ia_steps/robust_stats.py) ; les seuils fixes ci-dessus restent les bornes
+# par défaut et des limites de validité
+PRICE_CLIP_PERCENTILES = (0.0, 99.99)
+
 # Paramètres de validation des données
 VALIDATE_EVENT_TYPES = True
 VALID_EVENT_TYPES = ['view', 'cart', 'remove_from_cart', 'purchase']
 
+# Colonnes produites par create_features, dans leur ordre de sortie (pivot_table trie les types d'événements)
+OUTPUT_FEATURE_COLUMNS = ['user_id'] + sorted(VALID_EVENT_TYPES) + [
+    'total_spent', 'unique_categories', 'unique_brands', 'avg_purchase_price', 'conversion_rate'
+]
+
+# Colonnes produites par user_activity (dates du premier et du dernier événement de chaque utilisateur)
+ACTIVITY_COLUMNS = ['user_id', 'first_event', 'last_event', 'events']
+
 # =============================================================================
 # FONCTIONS DE TRANSFORMATION
 # =============================================================================
@@ -68,9 +81,33 @@ def validate_data_structure(df: pd.DataFrame) -> bool:
         return False
     return True
 
-def clean_data(df: pd.DataFrame) -> pd.DataFrame:
+def record_drops(drop_counts: Optional[Dict[str, int]], rule: str, count: int):
+    """Cumule le nombre de lignes (ou d'utilisateurs) écartées, ou signalées, par une règle de nettoyage."""
+    if drop_counts is not None:
+        drop_counts[rule] = drop_counts.get(rule, 0) + int(count)
+
+def price_bounds_from_sketch(sketch, percentiles: Tuple[float, float] = PRICE_CLIP_PERCENTILES) -> Tuple[float, float]:
+    """
+    Bornes de prix à partir d'un sketch de quantiles (QuantileSketch) des prix observés,
+    restreintes aux seuils fixes PRICE_MIN_THRESHOLD / PRICE_MAX_THRESHOLD.
+    """
+    low, high = sketch.quantiles([percentiles[0] / 100, percentiles[1] / 100])
+    return max(PRICE_MIN_THRESHOLD, float(low)), min(PRICE_MAX_THRESHOLD, float(high))
+
+def clean_data(df: pd.DataFrame, drop_counts: Optional[Dict[str, int]] = None,
+               price_sketch=None, price_bounds: Optional[Tuple[float, float]] = None,
+               flag_counts: Optional[Dict[str, int]] = None) -> pd.DataFrame:
     """
     Nettoie les données brutes avec les paramètres configurés.
+    Args:
+        df: Chunk de données brutes.
+        drop_counts: Dictionnaire optionnel cumulant les lignes écartées par règle
+            (missing_critical, duplicates, price_outliers).
+        price_sketch: Sketch de quantiles optionnel (QuantileSketch) alimenté avec les prix du chunk
+            avant le filtrage des prix aberrants.
+        price_bounds: Bornes (min, max) des prix conservés ; par défaut les seuils fixes.
+        flag_counts: Dictionnaire optionnel cumulant les lignes conservées mais signalées par règle
+            (invalid_event_types).
     """
     df = df.copy()
     
@@ -85,6 +122,7 @@ def clean_data(df: pd.DataFrame) -> pd.DataFrame:
         initial_rows = len(df)
         df = df.dropna(subset=COLUMNS_TO_DROP_NA)
         dropped_rows = initial_rows - len(df)
+        record_drops(drop_counts, 'missing_critical', dropped_rows)
         if dropped_rows > 0:
             print(f"   - Supprimé {dropped_rows} lignes avec valeurs manquantes dans {COLUMNS_TO_DROP_NA}")
     
@@ -115,32 +153,44 @@ def clean_data(df: pd.DataFrame) -> pd.DataFrame:
         initial_rows = len(df)
         df = df.drop_duplicates(subset=DUPLICATE_SUBSET)
         removed_duplicates = initial_rows - len(df)
+        record_drops(drop_counts, 'duplicates', removed_duplicates)
         if removed_duplicates > 0:
             print(f"   - Supprimé {removed_duplicates} doublons")
     
+    # Distribution des prix (bornes du prochain lancement)
+    if price_sketch is not None and 'price' in df.columns:
+        price_sketch.update(df['price'].to_numpy())
+
     # Nettoyage des valeurs aberrantes pour le prix
     if CLEAN_PRICE_OUTLIERS and 'price' in df.columns:
         initial_rows = len(df)
+        price_min, price_max = price_bounds or (PRICE_MIN_THRESHOLD, PRICE_MAX_THRESHOLD)
         df = df[
-            (df['price'] >= PRICE_MIN_THRESHOLD) & 
-            (df['price'] <= PRICE_MAX_THRESHOLD)
+            (df['price'] >= price_min) & 
+            (df['price'] <= price_max)
         ]
         removed_outliers = initial_rows - len(df)
+        record_drops(drop_counts, 'price_outliers', removed_outliers)
         if removed_outliers > 0:
             print(f"   - Supprimé {removed_outliers} lignes avec prix aberrant")
     
-    # Validation des types d'événements
+    # Validation des types d'événements (les événements de type inconnu sont conservés et signalés)
     if VALIDATE_EVENT_TYPES and 'event_type' in df.columns:
-        invalid_events = df[~df['event_type'].isin(VALID_EVENT_TYPES)]
-        if len(invalid_events) > 0:
-            print(f"   - ⚠️ {len(invalid_events)} événements avec type invalide trouvés")
+        invalid_events = int((~df['event_type'].isin(VALID_EVENT_TYPES)).sum())
+        record_drops(flag_counts, 'invalid_event_types', invalid_events)
+        if invalid_events > 0:
+            print(f"   - ⚠️ {invalid_events} événements avec type invalide trouvés")
     
     print(f"✅ Nettoyage terminé : {len(df)} lignes restantes")
     return df
 
-def create_features(df: pd.DataFrame) -> pd.DataFrame:
+def create_features(df: pd.DataFrame, drop_counts: Optional[Dict[str, int]] = None) -> pd.DataFrame:
     """
     Crée les variables explicatives pour chaque utilisateur avec les paramètres configurés.
+    Args:
+        df: Données nettoyées.
+        drop_counts: Dictionnaire optionnel cumulant les utilisateurs écartés par règle
+            (inactive_users, below_min_events).
     """
     if not validate_data_structure(df):
         return pd.DataFrame()
@@ -198,6 +248,7 @@ def create_features(df: pd.DataFrame) -> pd.DataFrame:
         initial_users = len(features)
         features = features[features.sum(axis=1) >= MIN_USER_ACTIVITY]
         filtered_users = initial_users - len(features)
+        record_drops(drop_counts, 'inactive_users', filtered_users)
         if filtered_users > 0:
             print(f"   - Filtré {filtered_users} utilisateurs inactifs (< {MIN_USER_ACTIVITY} événements)")
     
@@ -206,12 +257,35 @@ def create_features(df: pd.DataFrame) -> pd.DataFrame:
         initial_users = len(features)
         features = features[features.sum(axis=1) >= MIN_EVENTS_THRESHOLD]
         filtered_users = initial_users - len(features)
+        record_drops(drop_counts, 'below_min_events', filtered_users)
         if filtered_users > 0:
             print(f"   - Filtré {filtered_users} utilisateurs (< {MIN_EVENTS_THRESHOLD} événements totaux)")
     
     print(f"✅ Features créées pour {len(features)} utilisateurs")
     return features.reset_index()
 
+def user_activity(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Premier et dernier événement, et nombre d'événements, de chaque utilisateur d'un chunk nettoyé
+    (cumulés sur tous les chunks par load.ActivityAccumulator ; base des labels de churn).
+    """
+    if df.empty or 'event_time' not in df.columns:
+        return pd.DataFrame(columns=ACTIVITY_COLUMNS)
+    activity = df.groupby('user_id')['event_time'].agg(first_event='min', last_event='max', events='count')
+    return activity.reset_index()
+
+def events_before(df: pd.DataFrame, until: Optional[pd.Timestamp]) -> pd.DataFrame:
+    """
+    Événements strictement antérieurs à `until` (Timestamp UTC ; None : tous les événements).
+    Fenêtre d'observation des features quand les labels de churn portent sur la période qui suit.
+    """
+    if until is None or df.empty or 'event_time' not in df.columns:
+        return df
+    times = df['event_time']
+    if times.dt.tz is None:
+        until = until.tz_convert(None)
+    return df[times < until]
+
 def get_transformation_summary(df_original: pd.DataFrame, df_cleaned: pd.DataFrame, df_features: pd.DataFrame) -> Dict[str, Any]:
     """
     Retourne un résumé des transformations effectuées.
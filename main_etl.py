@@ -1,33 +1,296 @@
 import os
-from etl_steps.extract import list_csv_files, extract_data_in_chunks
-from etl_steps.transform import clean_data, create_features
-from etl_steps.load import save_to_csv
+import json
+import time
+import argparse
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from etl_steps.extract import list_csv_files, extract_data_in_chunks, extract_data_adaptive, prefetch_chunks
+from etl_steps.transform import (clean_data, create_features, events_before, user_activity, price_bounds_from_sketch,
+                                 OUTPUT_FEATURE_COLUMNS, PRICE_MIN_THRESHOLD, PRICE_MAX_THRESHOLD)
+from etl_steps.load import save_to_csv, ActivityAccumulator, FeatureAccumulator
+from monitoring.profiling import RunProfiler, PROFILING_DIR, get_rss_bytes
+from monitoring.metrics import ProgressMetrics, METRICS_INTERVAL
+from monitoring.memory_governor import MemoryGovernor, parse_memory_size
+from model_ia_steps.robust_stats import (ColumnSketches, QuantileSketch, ROBUST_STATS_PATH, file_signature,
+                                         load_robust_stats, save_robust_stats)
 import pandas as pd
 
 DATASETS_DIR = 'datasets'
 OUTPUT_DIR = 'output'
 OUTPUT_CSV = os.path.join(OUTPUT_DIR, 'features_all_users.csv')
+# Premier et dernier événement de chaque utilisateur (labels de churn, voir model_ia_steps/churn.py)
+ACTIVITY_CSV = os.path.join(OUTPUT_DIR, 'user_activity.csv')
+# Fin de la fenêtre d'observation des features (--features-until), associée au fichier de features écrit
+FEATURES_WINDOW_PATH = os.path.join(OUTPUT_DIR, 'features_window.json')
 CHUNK_SIZE = 100000
+METRICS_FILE = os.path.join(OUTPUT_DIR, 'etl_metrics.prom')
+
+def parse_utc_timestamp(value):
+    """Date ou date-heure ISO 8601 (sans fuseau : UTC)."""
+    try:
+        timestamp = pd.Timestamp(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"date invalide : {value!r} (attendu : AAAA-MM-JJ[THH:MM:SS])")
+    return timestamp.tz_localize('UTC') if timestamp.tz is None else timestamp.tz_convert('UTC')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pipeline ETL : extraction, nettoyage et agrégation des événements par utilisateur.")
+    parser.add_argument('--profile', action='store_true',
+                        help="Capture les statistiques cProfile de chaque étape (fichiers .prof)")
+    parser.add_argument('--profile-dir', default=PROFILING_DIR,
+                        help=f"Dossier des rapports de profilage (défaut : {PROFILING_DIR})")
+    parser.add_argument('--trace-alloc', action='store_true',
+                        help="Active le suivi des allocations Python par étape (tracemalloc ; ralentit nettement "
+                             "le code pandas, à réserver au diagnostic)")
+    parser.add_argument('--metrics-file', default=METRICS_FILE,
+                        help=f"Fichier texte Prometheus mis à jour pendant l'exécution (défaut : {METRICS_FILE})")
+    parser.add_argument('--metrics-interval', type=float, default=METRICS_INTERVAL,
+                        help=f"Période d'écriture des métriques et de la ligne de progression en secondes (défaut : {METRICS_INTERVAL})")
+    parser.add_argument('--memory-budget', default=None,
+                        help="Budget mémoire (ex : 4G, 512M). Adapte taille des chunks, workers et préchargement "
+                             f"au lieu des chunks fixes de {CHUNK_SIZE} lignes")
+    parser.add_argument('--price-bounds-from', default=None, metavar='ROBUST_STATS_JSON',
+                        help="Borne les prix par les percentiles du sketch des prix de ce fichier (ex : "
+                             f"{ROBUST_STATS_PATH}), écrit par un lancement sur les mêmes fichiers d'entrée ; "
+                             "par défaut, seuils fixes")
+    parser.add_argument('--features-until', type=parse_utc_timestamp, default=None,
+                        help="Features calculées sur les seuls événements antérieurs à cette date (AAAA-MM-JJ, UTC) ; "
+                             "l'activité utilisée pour les labels de churn couvre toujours tous les événements")
+    return parser.parse_args()
+
+def datasets_signature(csv_files):
+    """Signature (taille, date de modification) de chaque fichier d'entrée : source du sketch des prix."""
+    return {path: file_signature(path) for path in csv_files}
+
+def load_price_bounds(path, csv_files):
+    """
+    Bornes de prix issues du sketch des prix sauvegardé dans `path` (--price-bounds-from) ; le sketch doit
+    avoir été rempli sur les fichiers d'entrée actuels, dans leur état actuel.
+    """
+    events = load_robust_stats(path).get('events')
+    if events is None or 'price' not in events.sketches or events.sketches['price'].count == 0:
+        raise ValueError(f"Aucun sketch des prix dans {path}")
+    if events.source != datasets_signature(csv_files):
+        raise ValueError(f"Le sketch des prix de {path} ne décrit pas les fichiers d'entrée actuels : "
+                         "relancer l'ETL sans --price-bounds-from pour le recalculer")
+    return price_bounds_from_sketch(events.sketches['price'])
+
+def record_price_bounds(price_bounds, source, profiler, metrics):
+    """Affiche les bornes de prix du lancement et les consigne dans le profil et les métriques."""
+    lower, upper = price_bounds or (PRICE_MIN_THRESHOLD, PRICE_MAX_THRESHOLD)
+    label = 'seuils fixes' if price_bounds is None else f"percentiles du sketch {source}"
+    print(f"📏 Bornes de prix ({label}) : [{lower:.2f}, {upper:.2f}]")
+    profiler.context['price_bounds'] = {'min': lower, 'max': upper, 'source': source or 'fixed'}
+    metrics.price_bounds = (lower, upper)
+
+def new_sketches():
+    """Sketches remplis pendant le traitement : prix des événements et features par utilisateur."""
+    return ColumnSketches(['price']), ColumnSketches([c for c in OUTPUT_FEATURE_COLUMNS if c != 'user_id'])
+
+def save_sketches(event_sketches, feature_sketches, csv_files):
+    """
+    Sauvegarde les sketches : celui des prix est associé aux fichiers d'entrée lus, ceux des features
+    au fichier de sortie qui vient d'être écrit.
+    """
+    event_sketches.source = datasets_signature(csv_files)
+    feature_sketches.source = file_signature(OUTPUT_CSV)
+    save_robust_stats({'events': event_sketches, 'features': feature_sketches}, ROBUST_STATS_PATH)
+    print(f"Sketches de quantiles sauvegardés dans {ROBUST_STATS_PATH}")
+
+def save_features_window(features_until):
+    """Associe au fichier de features la fin de sa fenêtre d'observation (None : tous les événements)."""
+    window = {'features_until': None if features_until is None else features_until.isoformat(),
+              'source': file_signature(OUTPUT_CSV)}
+    with open(FEATURES_WINDOW_PATH, 'w', encoding='utf-8') as f:
+        json.dump(window, f, indent=2)
+    if features_until is not None:
+        print(f"Features calculées sur les événements antérieurs au {features_until} ({FEATURES_WINDOW_PATH})")
+
+def save_activity(activity):
+    n_users = activity.finalize()
+    if n_users:
+        print(f"Activité de {n_users} utilisateurs sauvegardée dans {ACTIVITY_CSV}")
+
+def featurize_window(featurize, cleaned, features_until, drop_counts):
+    """
+    Features des événements antérieurs à features_until ; un chunk dont tous les événements suivent cette date
+    (fichiers sources triés par date) ne produit aucune feature mais reste compté dans l'activité.
+    """
+    observed = events_before(cleaned, features_until)
+    if observed.empty:
+        return pd.DataFrame(columns=OUTPUT_FEATURE_COLUMNS)
+    return featurize(observed, drop_counts=drop_counts)
+
+def process_chunk(chunk, price_bounds=None, features_until=None):
+    """
+    Nettoie un chunk et crée ses features (exécuté dans un worker quand le budget mémoire le permet) ;
+    avec features_until, seuls les événements antérieurs à cette date alimentent les features.
+    Returns:
+        (features, activité par utilisateur, lignes écartées par règle, lignes signalées par règle,
+        mesures par étape, pid, RSS du processus, sketch des prix)
+    """
+    drop_counts = {}
+    flag_counts = {}
+    timings = {}
+    price_sketch = QuantileSketch()
+    start, cpu = time.perf_counter(), time.process_time()
+    cleaned = clean_data(chunk, drop_counts=drop_counts, price_sketch=price_sketch, price_bounds=price_bounds,
+                         flag_counts=flag_counts)
+    timings['clean_data'] = (start, time.perf_counter() - start, time.process_time() - cpu, len(chunk), len(cleaned))
+    start, cpu = time.perf_counter(), time.process_time()
+    features = featurize_window(create_features, cleaned, features_until, drop_counts)
+    timings['create_features'] = (start, time.perf_counter() - start, time.process_time() - cpu, len(cleaned), len(features))
+    start, cpu = time.perf_counter(), time.process_time()
+    activity = user_activity(cleaned)
+    timings['user_activity'] = (start, time.perf_counter() - start, time.process_time() - cpu, len(cleaned), len(activity))
+    return features, activity, drop_counts, flag_counts, timings, os.getpid(), get_rss_bytes(), price_sketch
+
+def run_with_memory_budget(csv_files, budget, profiler, metrics, price_bounds=None, features_until=None):
+    """
+    Variante de la boucle ETL pilotée par le gouverneur mémoire : chunks dimensionnés sur le premier chunk
+    puis ajustés selon la RSS, workers et préchargement choisis pour tenir dans le budget, et features
+    déversées dans le fichier de sortie plutôt que d'accumuler au-delà de la part du budget qui leur revient.
+    """
+    governor = MemoryGovernor(budget)
+    accumulator = FeatureAccumulator(OUTPUT_CSV, columns=OUTPUT_FEATURE_COLUMNS)
+    event_sketches, feature_sketches = new_sketches()
+    activity = ActivityAccumulator(ACTIVITY_CSV)
+    executor = None
+
+    def handle_result(result, rows, handle):
+        features, chunk_activity, drop_counts, flag_counts, timings, pid, rss, price_sketch = result
+        event_sketches.sketches['price'].merge(price_sketch)
+        activity.add(chunk_activity)
+        for name, (start, wall, cpu, rows_in, rows_out) in timings.items():
+            profiler.add_external(name, start, wall, cpu, rows_in=rows_in, rows_out=rows_out,
+                                  rss_peak_bytes=rss, worker_pid=pid)
+        for rule, count in drop_counts.items():
+            metrics.drop_counts[rule] = metrics.drop_counts.get(rule, 0) + count
+        for rule, count in flag_counts.items():
+            metrics.flag_counts[rule] = metrics.flag_counts.get(rule, 0) + count
+        if not features.empty:
+            feature_sketches.update(features)
+            accumulator.add(features)
+        metrics.add_chunk(rows=rows, file_position=handle.tell(), rows_output=len(features))
+        governor.observe({pid: rss} if pid != os.getpid() else None)
+        if governor.should_spill(accumulator.memory_bytes):
+            with profiler.stage('spill_features') as record:
+                record['rows_in'] = sum(len(f) for f in accumulator.frames)
+                accumulator.spill()
+
+    try:
+        for csv_file in csv_files:
+            print(f"Traitement de {csv_file}...")
+            metrics.start_file(csv_file)
+            with open(csv_file, 'rb') as handle:
+                raw_chunks = extract_data_adaptive(handle, lambda: governor.chunk_size)
+                if governor.bytes_per_row is None:
+                    first = next(raw_chunks, None)
+                    if first is None:
+                        metrics.finish_file()
+                        continue
+                    governor.calibrate(first)
+                    print(f"🧮 Gouverneur mémoire : {governor.describe()}")
+                    if governor.workers > 1:
+                        executor = ProcessPoolExecutor(max_workers=governor.workers)
+                    raw_chunks = itertools.chain([first], raw_chunks)
+
+                chunks = profiler.wrap_iterator(prefetch_chunks(raw_chunks, governor.prefetch), 'extract_data_in_chunks')
+                if executor is None:
+                    for chunk in chunks:
+                        handle_result(process_chunk(chunk, price_bounds, features_until), len(chunk), handle)
+                else:
+                    pending = deque()
+                    for chunk in chunks:
+                        pending.append((executor.submit(process_chunk, chunk, price_bounds, features_until), len(chunk)))
+                        del chunk
+                        while len(pending) >= governor.workers:
+                            future, rows = pending.popleft()
+                            handle_result(future.result(), rows, handle)
+                    while pending:
+                        future, rows = pending.popleft()
+                        handle_result(future.result(), rows, handle)
+            metrics.finish_file()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if accumulator.rows == 0:
+        print("Aucune donnée utilisateur à sauvegarder.")
+        return
+    print(f"Nombre total d'utilisateurs traités : {accumulator.rows}")
+    if accumulator.spills:
+        print(f"   - {accumulator.spills} déversement(s) sur disque pendant le traitement")
+    accumulator.finalize(save_fn=profiler.wrap(save_to_csv))
+    print(f"Données sauvegardées dans {OUTPUT_CSV}")
+    save_sketches(event_sketches, feature_sketches, csv_files)
+    save_features_window(features_until)
+    save_activity(activity)
+    print(f"🧮 Gouverneur mémoire : {governor.describe()}, {governor.adjustments} ajustement(s), "
+          f"dernière RSS totale {governor.last_total_rss / (1024 ** 2):.0f} MB")
+
+def main(profile=False, profile_dir=PROFILING_DIR, trace_allocations=False,
+         metrics_file=METRICS_FILE, metrics_interval=METRICS_INTERVAL, memory_budget=None, features_until=None,
+         price_bounds_from=None):
+    profiler = RunProfiler('etl', output_dir=profile_dir, enable_cprofile=profile,
+                           trace_allocations=trace_allocations)
+    clean = profiler.wrap(clean_data)
+    featurize = profiler.wrap(create_features)
+    track_activity = profiler.wrap(user_activity)
+    save = profiler.wrap(save_to_csv)
 
-def main():
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     all_features = []
     csv_files = list_csv_files(DATASETS_DIR)
     print(f"Fichiers à traiter : {csv_files}")
+    price_bounds = load_price_bounds(price_bounds_from, csv_files) if price_bounds_from else None
+    metrics = ProgressMetrics(csv_files, textfile_path=metrics_file, interval=metrics_interval)
+    record_price_bounds(price_bounds, price_bounds_from, profiler, metrics)
+    metrics.start()
+    if memory_budget:
+        run_with_memory_budget(csv_files, parse_memory_size(memory_budget), profiler, metrics, price_bounds,
+                               features_until)
+        metrics.stop()
+        profiler.save()
+        return
+    event_sketches, feature_sketches = new_sketches()
+    activity = ActivityAccumulator(ACTIVITY_CSV)
     for csv_file in csv_files:
         print(f"Traitement de {csv_file}...")
-        for chunk in extract_data_in_chunks(csv_file, chunk_size=CHUNK_SIZE):
-            cleaned = clean_data(chunk)
-            features = create_features(cleaned)
-            if not features.empty:
-                all_features.append(features)
+        metrics.start_file(csv_file)
+        # Fichier ouvert ici pour suivre la position de lecture (octets traités, ETA)
+        with open(csv_file, 'rb') as handle:
+            chunks = profiler.wrap_iterator(extract_data_in_chunks(handle, chunk_size=CHUNK_SIZE), 'extract_data_in_chunks')
+            for chunk in chunks:
+                cleaned = clean(chunk, drop_counts=metrics.drop_counts,
+                                price_sketch=event_sketches.sketches['price'], price_bounds=price_bounds,
+                                flag_counts=metrics.flag_counts)
+                features = featurize_window(featurize, cleaned, features_until, metrics.drop_counts)
+                activity.add(track_activity(cleaned))
+                if not features.empty:
+                    feature_sketches.update(features)
+                    all_features.append(features)
+                metrics.add_chunk(rows=len(chunk), file_position=handle.tell(), rows_output=len(features))
+        metrics.finish_file()
     if all_features:
-        features_df = pd.concat(all_features, ignore_index=True)
+        with profiler.stage('concat_features') as record:
+            features_df = pd.concat(all_features, ignore_index=True)
+            record['rows_out'] = len(features_df)
         print(f"Nombre total d'utilisateurs traités : {len(features_df)}")
-        save_to_csv(features_df, OUTPUT_CSV)
+        save(features_df, OUTPUT_CSV)
         print(f"Données sauvegardées dans {OUTPUT_CSV}")
+        save_sketches(event_sketches, feature_sketches, csv_files)
+        save_features_window(features_until)
+        save_activity(activity)
     else:
         print("Aucune donnée utilisateur à sauvegarder.")
+    metrics.stop()
+    profiler.save()
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    args = parse_args()
+    main(profile=args.profile, profile_dir=args.profile_dir, trace_allocations=args.trace_alloc,
+         metrics_file=args.metrics_file, metrics_interval=args.metrics_interval,
+         memory_budget=args.memory_budget, features_until=args.features_until,
+         price_bounds_from=args.price_bounds_from)
@@ -1,21 +1,73 @@
-# Ce script exécute séquentiellement toutes les étapes du pipeline IA (exploration, prétraitement, PCA, clustering, analyse des clusters).
+# Ce script exécute séquentiellement toutes les étapes du pipeline IA (exploration, prétraitement, PCA, clustering,
+# suivi des migrations de segments, analyse des clusters).
 # À lancer après le pipeline ETL (main_etl.py).
-import subprocess
+# Option --profile : capture les statistiques cProfile de chaque étape (voir monitoring/profiling.py).
+# Option --dtype float32 : prétraitement, PCA et clustering en float32 (mémoire et bande passante divisées par deux).
+# Option --exclude-anomalies : détection des utilisateurs atypiques après l'exploration, exclus de l'ajustement
+# du prétraitement et du clustering (voir model_ia_steps/anomaly.py).
+import argparse
 import os
+from monitoring.profiling import RunProfiler, PROFILING_DIR
 
 steps = [
     'model_ia_steps/step1_load_explore.py',
     'model_ia_steps/step2_preprocess.py',
     'model_ia_steps/step3_pca.py',
     'model_ia_steps/step4_clustering.py',
+    'model_ia_steps/segment_history.py',
     'model_ia_steps/step5_analyse_clusters.py',
 ]
 
+# Étapes acceptant l'option --dtype
+dtype_steps = {
+    'model_ia_steps/step2_preprocess.py',
+    'model_ia_steps/step3_pca.py',
+    'model_ia_steps/step4_clustering.py',
+}
+
+# Détection des utilisateurs atypiques (ajustement puis scoring), insérée après l'exploration
+anomaly_commands = [
+    ('anomaly_fit', ['model_ia_steps/anomaly.py', 'fit']),
+    ('anomaly_score', ['model_ia_steps/anomaly.py', 'score']),
+]
+
+# Étapes acceptant l'option --exclude-anomalies
+anomaly_filtered_steps = {
+    'model_ia_steps/step2_preprocess.py',
+    'model_ia_steps/step4_clustering.py',
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pipeline IA : exécution séquentielle des étapes du modèle.")
+    parser.add_argument('--profile', action='store_true',
+                        help="Capture les statistiques cProfile de chaque étape (fichiers .prof)")
+    parser.add_argument('--profile-dir', default=PROFILING_DIR,
+                        help=f"Dossier des rapports de profilage (défaut : {PROFILING_DIR})")
+    parser.add_argument('--dtype', choices=['float64', 'float32'], default='float64',
+                        help="Type flottant du prétraitement, de la PCA et du clustering")
+    parser.add_argument('--exclude-anomalies', action='store_true',
+                        help="Signale les utilisateurs atypiques (forêt d'isolement) et les exclut de l'ajustement "
+                             "du prétraitement et du clustering")
+    return parser.parse_args()
+
 if __name__ == '__main__':
+    args = parse_args()
+    # Les étapes tournent dans des sous-processus : seules leurs ressources (rusage) sont mesurées ici
+    profiler = RunProfiler('model', output_dir=args.profile_dir, enable_cprofile=args.profile,
+                           trace_allocations=False)
+    commands = []
     for step in steps:
-        print(f"\n=== Exécution de {step} ===")
-        ret = subprocess.run(['python', step])
-        if ret.returncode != 0:
-            print(f"Erreur lors de l'exécution de {step}. Arrêt du pipeline.")
+        cmd = [step] + (['--dtype', args.dtype] if step in dtype_steps else [])
+        if args.exclude_anomalies and step in anomaly_filtered_steps:
+            cmd.append('--exclude-anomalies')
+        commands.append((os.path.splitext(os.path.basename(step))[0], cmd))
+    if args.exclude_anomalies:
+        commands[1:1] = anomaly_commands
+    for stage_name, cmd in commands:
+        print(f"\n=== Exécution de {' '.join(cmd)} ===")
+        returncode = profiler.run_subprocess(stage_name, ['python'] + cmd)
+        if returncode != 0:
+            print(f"Erreur lors de l'exécution de {cmd[0]}. Arrêt du pipeline.")
             break
-    print("\nPipeline IA terminé. Tous les fichiers de sortie sont dans le dossier 'model_ia_steps'.") 
\ No newline at end of file
+    profiler.save()
+    print("\nPipeline IA terminé. Tous les fichiers de sortie sont dans le dossier 'model_ia_steps'.")
@@ -0,0 +1,287 @@
+"""
+anomaly.py
+Détection des utilisateurs atypiques (robots, scrapers : des millions de vues) par forêt d'isolement.
+
+Le modèle (IsolationForest) est ajusté sur un échantillon uniforme de taille fixe de features_all_users.csv,
+tiré en une passe (variables en log1p : les comptages ont des queues très lourdes). Le seuil est le quantile
+1 - CONTAMINATION des scores de l'échantillon. Une forêt d'isolement ne sait pas extrapoler : au-delà des
+valeurs vues à l'ajustement, le score sature, et un robot à des millions de vues (atypique sur une seule
+variable) peut rester sous le seuil. Une ligne est donc aussi signalée dès qu'une variable dépasse
+EXTREME_FACTOR fois son percentile EXTREME_PERCENTILE sur l'échantillon. Le scoring parcourt ensuite tout le fichier par chunks,
+répartis sur un pool de processus (chaque worker charge le modèle une fois), et écrit pour chaque ligne,
+dans l'ordre du fichier de features, le score d'anomalie (entre 0 et 1, élevé = atypique) et le drapeau.
+
+Le fichier de drapeaux est aligné ligne à ligne sur les features : step2_preprocess et step4_clustering
+l'utilisent (--exclude-anomalies) pour écarter ces utilisateurs de l'ajustement du scaler et des centres,
+tout en leur attribuant une valeur normalisée et un cluster. Les durées d'ajustement et de scoring sont
+enregistrées dans anomaly_report.json.
+
+Usage :
+    python model_ia_steps/anomaly.py fit --contamination 0.001
+    python model_ia_steps/anomaly.py score --jobs 4
+"""
+import os
+import json
+import time
+import argparse
+import datetime
+import joblib
+import numpy as np
+import pandas as pd
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, Tuple
+from sklearn.ensemble import IsolationForest
+from threadpoolctl import threadpool_limits
+from streaming import CHUNK_SIZE, iter_csv_chunks, numeric_feature_columns
+
+FEATURES_CSV = os.path.join('output', 'features_all_users.csv')
+MODEL_PATH = os.path.join('model_ia_steps', 'anomaly_model.joblib')
+FLAGS_CSV = os.path.join('model_ia_steps', 'anomaly_flags.csv')
+REPORT_PATH = os.path.join('model_ia_steps', 'anomaly_report.json')
+
+# Version du format de l'artefact (à incrémenter à chaque changement incompatible)
+MODEL_VERSION = 1
+
+# Part attendue d'utilisateurs atypiques (fixe le seuil du drapeau)
+CONTAMINATION = 0.001
+
+# Taille de l'échantillon d'ajustement, nombre d'arbres et lignes tirées par arbre (256 : valeur de Liu et al.)
+FIT_SAMPLE_SIZE = 200000
+N_ESTIMATORS = 100
+MAX_SAMPLES = 256
+
+# Signalement univarié : variable supérieure à EXTREME_FACTOR fois son percentile EXTREME_PERCENTILE
+EXTREME_PERCENTILE = 99.9
+EXTREME_FACTOR = 10
+
+SEED = 42
+
+# Modèle chargé une fois par worker du scoring parallèle
+_worker_bundle = None
+_thread_limits = None
+
+
+# =============================================================================
+# MODÈLE
+# =============================================================================
+
+def model_inputs(features: pd.DataFrame, columns) -> np.ndarray:
+    """Variables dans l'ordre de l'ajustement, en log1p (valeurs négatives ramenées à 0, manquantes à 0)."""
+    X = features[list(columns)].to_numpy(dtype=np.float64)
+    return np.nan_to_num(np.log1p(np.maximum(X, 0)), nan=0.0).astype(np.float32)
+
+
+def anomaly_scores(bundle: Dict, X: np.ndarray) -> np.ndarray:
+    """Score d'anomalie s(x) de Liu et al. (entre 0 et 1, proche de 1 pour les points isolés rapidement)."""
+    return -bundle['model'].score_samples(X)
+
+
+def flag_rows(bundle: Dict, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(score d'anomalie, drapeau, drapeau univarié) de chaque ligne de X (déjà transformé par model_inputs)."""
+    scores = anomaly_scores(bundle, X)
+    extreme = (X > bundle['extreme_limits']).any(axis=1)
+    return scores, (scores >= bundle['threshold']) | extreme, extreme
+
+
+def fit_model(features_csv: str = FEATURES_CSV, chunk_size: int = CHUNK_SIZE, sample_size: int = FIT_SAMPLE_SIZE,
+              contamination: float = CONTAMINATION, n_estimators: int = N_ESTIMATORS, seed: int = SEED) -> Dict:
+    """
+    Échantillon uniforme de `sample_size` lignes tiré en une passe (priorités aléatoires, on garde les plus
+    petites), puis forêt d'isolement et seuil au quantile 1 - contamination des scores de l'échantillon ;
+    limites univariées au percentile EXTREME_PERCENTILE de log1p(x) plus log(EXTREME_FACTOR) (environ EXTREME_FACTOR
+    fois le percentile).
+    """
+    rng = np.random.default_rng(seed)
+    columns, sample, priorities, n_rows = None, None, np.empty(0), 0
+    for chunk in iter_csv_chunks(features_csv, chunk_size):
+        if columns is None:
+            columns = numeric_feature_columns(chunk)
+        X = model_inputs(chunk, columns)
+        sample = X if sample is None else np.vstack([sample, X])
+        priorities = np.concatenate([priorities, rng.random(len(X))])
+        if len(priorities) > sample_size:
+            keep = np.argpartition(priorities, sample_size)[:sample_size]
+            sample, priorities = sample[keep], priorities[keep]
+        n_rows += len(chunk)
+    if sample is None:
+        raise ValueError(f"{features_csv} ne contient aucune ligne")
+    model = IsolationForest(n_estimators=n_estimators, max_samples=min(MAX_SAMPLES, len(sample)), random_state=seed)
+    bundle = {'columns': columns, 'model': model.fit(sample)}
+    bundle.update({
+        'threshold': float(np.quantile(anomaly_scores(bundle, sample), 1 - contamination)),
+        'extreme_limits': (np.percentile(sample, EXTREME_PERCENTILE, axis=0) + np.log(EXTREME_FACTOR)
+                           ).astype(np.float32),
+        'contamination': contamination,
+        'n_rows': n_rows,
+        'n_fit': int(len(sample)),
+    })
+    return bundle
+
+
+def load_model(path: str = MODEL_PATH) -> Dict:
+    bundle = joblib.load(path)
+    if bundle.get('version') != MODEL_VERSION:
+        raise ValueError(f"Version de modèle {bundle.get('version')} non supportée (attendue : {MODEL_VERSION})")
+    return bundle
+
+
+# =============================================================================
+# SCORING
+# =============================================================================
+
+def _init_score_worker(model_path: str, n_threads: int):
+    global _worker_bundle, _thread_limits
+    _worker_bundle = load_model(model_path)
+    _thread_limits = threadpool_limits(limits=n_threads)
+
+
+def _score_block(features: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    return flag_rows(_worker_bundle, model_inputs(features, _worker_bundle['columns']))
+
+
+def _write_flags(user_ids: np.ndarray, result, output_csv: str, header: bool) -> np.ndarray:
+    """Écrit les drapeaux d'un chunk ; retourne (lignes signalées, dont signalements univariés)."""
+    scores, flagged, extreme = result
+    pd.DataFrame({
+        'user_id': user_ids,
+        'anomaly_score': np.round(scores, 4),
+        'anomaly': flagged.astype(np.int8),
+    }).to_csv(output_csv, mode='w' if header else 'a', header=header, index=False)
+    return np.array([flagged.sum(), extreme.sum()])
+
+
+def score_csv(bundle: Dict, input_csv: str = FEATURES_CSV, output_csv: str = FLAGS_CSV,
+              chunk_size: int = CHUNK_SIZE, jobs: int = 1, model_path: str = MODEL_PATH) -> Tuple[int, int, int]:
+    """
+    Score et drapeau de chaque ligne, écrits chunk par chunk dans l'ordre du fichier d'entrée.
+    Avec jobs > 1, les chunks sont scorés par un pool de processus (au plus 2·jobs chunks en vol,
+    la lecture du chunk suivant recouvre le scoring des précédents).
+    Returns:
+        (nombre de lignes, lignes signalées, dont signalements univariés)
+    """
+    header, n_rows, counts = True, 0, np.zeros(2, dtype=np.int64)
+    if jobs <= 1:
+        for chunk in iter_csv_chunks(input_csv, chunk_size):
+            result = flag_rows(bundle, model_inputs(chunk, bundle['columns']))
+            counts += _write_flags(chunk['user_id'].to_numpy(), result, output_csv, header)
+            header = False
+            n_rows += len(chunk)
+        return n_rows, int(counts[0]), int(counts[1])
+
+    n_threads = max(1, (os.cpu_count() or 1) // jobs)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_score_worker,
+                             initargs=(model_path, n_threads)) as executor:
+        pending = deque()
+        for chunk in iter_csv_chunks(input_csv, chunk_size):
+            pending.append((executor.submit(_score_block, chunk[bundle['columns']]), chunk['user_id'].to_numpy()))
+            while len(pending) > 2 * jobs or (pending and pending[0][0].done()):
+                future, user_ids = pending.popleft()
+                counts += _write_flags(user_ids, future.result(), output_csv, header)
+                header = False
+                n_rows += len(user_ids)
+        while pending:
+            future, user_ids = pending.popleft()
+            counts += _write_flags(user_ids, future.result(), output_csv, header)
+            header = False
+            n_rows += len(user_ids)
+    return n_rows, int(counts[0]), int(counts[1])
+
+
+# =============================================================================
+# DRAPEAUX (step2_preprocess, step4_clustering)
+# =============================================================================
+
+def _check_alignment(user_ids, flag_ids, flags_csv: str, start: int):
+    if len(flag_ids) != len(user_ids) or not np.array_equal(np.asarray(user_ids, dtype=np.float64),
+                                                            np.asarray(flag_ids, dtype=np.float64)):
+        raise ValueError(f"{flags_csv} ne correspond pas aux features à partir de la ligne {start} : "
+                         "relancer anomaly.py score sur le fichier de features actuel")
+
+
+def load_anomaly_mask(user_ids, flags_csv: str = FLAGS_CSV) -> np.ndarray:
+    """Masque des lignes signalées, après vérification que les drapeaux suivent les user_id donnés ligne à ligne."""
+    flags = pd.read_csv(flags_csv, usecols=['user_id', 'anomaly'])
+    _check_alignment(user_ids, flags['user_id'].to_numpy(), flags_csv, 0)
+    return flags['anomaly'].to_numpy().astype(bool)
+
+
+def with_anomaly_flags(chunks: Iterator[pd.DataFrame], flags_csv: str = FLAGS_CSV,
+                       chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[pd.DataFrame, np.ndarray]]:
+    """
+    (chunk, masque des lignes signalées) pour des chunks de `chunk_size` lignes lus dans l'ordre du fichier
+    de features : les drapeaux sont lus en parallèle, par chunks de même taille, et vérifiés ligne à ligne.
+    """
+    flag_chunks = iter_csv_chunks(flags_csv, chunk_size, usecols=['user_id', 'anomaly'])
+    start = 0
+    for chunk in chunks:
+        flags = next(flag_chunks, None)
+        flag_ids = np.empty(0) if flags is None else flags['user_id'].to_numpy()
+        _check_alignment(chunk['user_id'].to_numpy(), flag_ids, flags_csv, start)
+        yield chunk, flags['anomaly'].to_numpy().astype(bool)
+        start += len(chunk)
+    if next(flag_chunks, None) is not None:
+        raise ValueError(f"{flags_csv} contient plus de lignes que les features : relancer anomaly.py score")
+
+
+def update_report(section: str, values: Dict, path: str = REPORT_PATH):
+    """Complète anomaly_report.json (sections fit et score)."""
+    report = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+    report[section] = values
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+
+# =============================================================================
+# POINT D'ENTRÉE
+# =============================================================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Détection des utilisateurs atypiques (forêt d'isolement).")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    fit = subparsers.add_parser('fit', help=f"Ajuste le modèle sur un échantillon de {FEATURES_CSV}")
+    fit.add_argument('--input', default=FEATURES_CSV, help="CSV des features par utilisateur")
+    fit.add_argument('--sample-size', type=int, default=FIT_SAMPLE_SIZE, help="Échantillon d'ajustement")
+    fit.add_argument('--contamination', type=float, default=CONTAMINATION,
+                     help="Part d'utilisateurs signalés sur l'échantillon (fixe le seuil)")
+    fit.add_argument('--n-estimators', type=int, default=N_ESTIMATORS, help="Nombre d'arbres")
+    fit.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Lignes par chunk")
+    score = subparsers.add_parser('score', help=f"Score toutes les lignes de {FEATURES_CSV}")
+    score.add_argument('--input', default=FEATURES_CSV, help="CSV des features par utilisateur")
+    score.add_argument('--output', default=FLAGS_CSV, help="CSV des scores et drapeaux")
+    score.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help="Processus de scoring (1 = séquentiel)")
+    score.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Lignes par chunk")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == 'fit':
+        start = time.perf_counter()
+        bundle = fit_model(args.input, args.chunk_size, args.sample_size, args.contamination, args.n_estimators)
+        fit_s = time.perf_counter() - start
+        bundle.update({'version': MODEL_VERSION, 'created_at': datetime.datetime.now().isoformat(timespec='seconds')})
+        joblib.dump(bundle, MODEL_PATH)
+        update_report('fit', {'rows': bundle['n_rows'], 'n_fit': bundle['n_fit'], 'fit_s': round(fit_s, 3),
+                              'contamination': bundle['contamination'], 'threshold': bundle['threshold']})
+        print(f"Forêt d'isolement ajustée en {fit_s:.1f} s sur {bundle['n_fit']} lignes ({bundle['n_rows']} lues), "
+              f"seuil {bundle['threshold']:.4f}, sauvegardée dans {MODEL_PATH}")
+        return
+
+    bundle = load_model(MODEL_PATH)
+    start = time.perf_counter()
+    n_rows, n_flagged, n_extreme = score_csv(bundle, args.input, args.output, args.chunk_size, args.jobs)
+    score_s = time.perf_counter() - start
+    update_report('score', {'rows': n_rows, 'flagged': n_flagged, 'extreme': n_extreme, 'jobs': args.jobs,
+                            'score_s': round(score_s, 3),
+                            'rows_per_s': round(n_rows / score_s, 1) if score_s > 0 else None})
+    print(f"{n_rows} lignes scorées en {score_s:.1f} s ({n_rows / max(score_s, 1e-9):.0f} lignes/s, "
+          f"{args.jobs} processus) : {n_flagged} utilisateurs signalés, dont {n_extreme} sur une variable "
+          f"extrême, résultats dans {args.output}")
+    print(f"Rapport mis à jour : {REPORT_PATH}")
+
+if __name__ == '__main__':
+    main()
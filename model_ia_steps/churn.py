@@ -0,0 +1,375 @@
+"""
+churn.py
+Prédiction du churn (aucune activité pendant au moins CHURN_DAYS jours) à partir des features par utilisateur.
+
+Les features doivent être calculées sur une fenêtre d'observation qui s'arrête à une date limite
+(python main_etl.py --features-until AAAA-MM-JJ, enregistrée dans output/features_window.json), sans quoi
+le label serait déjà visible dans les features. Les labels viennent de output/user_activity.csv, écrit par
+l'ETL sur tous les événements : un utilisateur a churné s'il n'a aucun événement entre la date limite et le
+dernier événement observé, période qui doit couvrir au moins CHURN_DAYS jours. Les lignes de
+features_all_users.csv sont rattachées à leur label par recherche dichotomique dans l'activité triée par
+user_id, chunk par chunk.
+
+Deux modèles, sans charger toute la population :
+- hgb : HistGradientBoostingClassifier sur un échantillon uniforme de taille fixe, tiré en une passe ;
+- sgd : régression logistique (SGDClassifier) ajustée par partial_fit sur tous les chunks
+  (variables en log1p, standardisées avec les moments cumulés à la première passe).
+L'ETL écrit une ligne par utilisateur et par chunk traité : modèle et évaluation travaillent sur ces lignes.
+Une part des utilisateurs (TEST_PERCENT %, choisie par hachage du user_id : toutes les lignes d'un même
+utilisateur sont du même côté) est réservée à l'évaluation (ROC-AUC, précision, rappel, F1).
+Le scoring parcourt ensuite tout le fichier par chunks, puis écrit une probabilité par utilisateur
+(moyenne des probabilités de ses lignes), triée par user_id.
+Les durées d'entraînement et de scoring sont enregistrées dans churn_report.json.
+
+Usage :
+    python main_etl.py --features-until 2019-11-01
+    python model_ia_steps/churn.py train --model hgb
+    python model_ia_steps/churn.py score
+"""
+import os
+import json
+import time
+import argparse
+import datetime
+import joblib
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterator, Tuple
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import f1_score, precision_score, recall_score, roc_auc_score
+from streaming import CHUNK_SIZE, RunningMoments, iter_csv_chunks, numeric_feature_columns
+from robust_stats import file_signature
+
+FEATURES_CSV = os.path.join('output', 'features_all_users.csv')
+ACTIVITY_CSV = os.path.join('output', 'user_activity.csv')
+WINDOW_PATH = os.path.join('output', 'features_window.json')
+MODEL_PATH = os.path.join('model_ia_steps', 'churn_model.joblib')
+SCORES_CSV = os.path.join('model_ia_steps', 'churn_scores.csv')
+REPORT_PATH = os.path.join('model_ia_steps', 'churn_report.json')
+
+# Version du format de l'artefact (à incrémenter à chaque changement incompatible)
+MODEL_VERSION = 1
+
+# Inactivité (en jours) à partir de laquelle un utilisateur est considéré comme churné :
+# durée minimale de la période de labels qui suit la fenêtre d'observation des features
+CHURN_DAYS = 30
+
+MODELS = ['hgb', 'sgd']
+
+# Taille de l'échantillon d'entraînement (hgb) et de l'échantillon d'évaluation (tous modèles)
+TRAIN_SAMPLE_SIZE = 1000000
+EVAL_SAMPLE_SIZE = 200000
+
+# Part des utilisateurs réservée à l'évaluation (en %)
+TEST_PERCENT = 20
+
+# Seuil de probabilité du label prédit (classes équilibrées à l'entraînement)
+THRESHOLD = 0.5
+
+SEED = 42
+
+
+# =============================================================================
+# LABELS
+# =============================================================================
+
+def load_activity(path: str = ACTIVITY_CSV) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (user_id triés, date du dernier événement en datetime64[s]) de chaque utilisateur ; lu par chunks
+    pour que seuls les deux tableaux restent en mémoire (pas les dates en texte).
+    """
+    ids, dates = [], []
+    for chunk in iter_csv_chunks(path, CHUNK_SIZE, usecols=['user_id', 'last_event']):
+        last_event = pd.to_datetime(chunk['last_event'], utc=True).dt.tz_localize(None)
+        ids.append(chunk['user_id'].to_numpy(dtype=np.float64))
+        dates.append(last_event.to_numpy(dtype='datetime64[s]'))
+    user_ids = np.concatenate(ids) if ids else np.empty(0)
+    last_events = np.concatenate(dates) if dates else np.empty(0, dtype='datetime64[s]')
+    order = np.argsort(user_ids, kind='stable')
+    return user_ids[order], last_events[order]
+
+
+def features_cutoff(features_csv: str = FEATURES_CSV, window_path: str = WINDOW_PATH) -> np.datetime64:
+    """
+    Fin de la fenêtre d'observation des features (UTC), lue dans le fichier écrit par l'ETL ;
+    erreur si les features couvrent tous les événements ou si le fichier ne décrit pas `features_csv`.
+    """
+    window = {}
+    if os.path.exists(window_path):
+        with open(window_path, 'r', encoding='utf-8') as f:
+            window = json.load(f)
+    if not window.get('features_until'):
+        raise ValueError(f"Aucune fenêtre d'observation dans {window_path} : les features couvrent la période des "
+                         "labels. Relancer l'ETL avec --features-until AAAA-MM-JJ (au moins "
+                         f"{CHURN_DAYS} jours avant le dernier événement)")
+    if not os.path.exists(features_csv) or window.get('source') != file_signature(features_csv):
+        raise ValueError(f"{window_path} ne décrit pas {features_csv} dans son état actuel : relancer l'ETL")
+    return np.datetime64(pd.Timestamp(window['features_until']).tz_convert(None), 's')
+
+
+def label_period(last_event: np.ndarray, cutoff: np.datetime64, churn_days: int = CHURN_DAYS) -> np.datetime64:
+    """Fin de la période de labels (dernier événement observé) ; erreur si elle couvre moins de churn_days jours."""
+    reference = last_event.max() if len(last_event) else cutoff
+    if reference - cutoff < np.timedelta64(churn_days, 'D'):
+        raise ValueError(f"Période de labels trop courte : du {cutoff} au {reference}, moins de {churn_days} jours "
+                         "(avancer --features-until de l'ETL)")
+    return reference
+
+
+def row_labels(user_ids: np.ndarray, activity_ids: np.ndarray, activity_last: np.ndarray,
+               cutoff: np.datetime64) -> np.ndarray:
+    """Label de chaque ligne : 1 churné (aucun événement depuis cutoff), 0 actif, -1 utilisateur absent de l'activité."""
+    user_ids = np.asarray(user_ids, dtype=np.float64)
+    if not len(activity_ids):
+        return np.full(len(user_ids), -1, dtype=np.int8)
+    positions = np.minimum(np.searchsorted(activity_ids, user_ids), len(activity_ids) - 1)
+    found = activity_ids[positions] == user_ids
+    return np.where(found, (activity_last[positions] < cutoff).astype(np.int8), -1).astype(np.int8)
+
+
+def holdout_mask(user_ids: np.ndarray, test_percent: int = TEST_PERCENT) -> np.ndarray:
+    """Lignes réservées à l'évaluation, choisies par hachage multiplicatif du user_id (stable d'un run à l'autre)."""
+    keys = np.asarray(user_ids, dtype=np.float64).astype(np.uint64)
+    with np.errstate(over='ignore'):
+        hashed = (keys * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(32)
+    return (hashed % np.uint64(100)) < np.uint64(test_percent)
+
+
+def iter_labelled_chunks(features_csv: str, activity: Tuple[np.ndarray, np.ndarray], cutoff: np.datetime64,
+                         chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[pd.DataFrame, np.ndarray, np.ndarray]]:
+    """(variables, labels, masque d'évaluation) de chaque chunk, sans les lignes d'utilisateurs sans label."""
+    for chunk in iter_csv_chunks(features_csv, chunk_size):
+        user_ids = chunk['user_id'].to_numpy()
+        labels = row_labels(user_ids, activity[0], activity[1], cutoff)
+        known = labels >= 0
+        features = chunk.drop(columns=['user_id'])[known]
+        yield features, labels[known], holdout_mask(user_ids[known])
+
+
+# =============================================================================
+# MODÈLES
+# =============================================================================
+
+def model_inputs(features: pd.DataFrame, bundle: Dict) -> np.ndarray:
+    """Matrice d'entrée du modèle (variables dans l'ordre de l'entraînement, transformation du mode sgd)."""
+    X = features[bundle['columns']].to_numpy(dtype=np.float64)
+    transform = bundle.get('transform')
+    if transform is not None:
+        X = (np.log1p(np.maximum(X, 0)) - transform['mean']) / transform['scale']
+        X = np.nan_to_num(X, nan=0.0)
+    return X.astype(np.float32)
+
+
+def predict_proba(bundle: Dict, features: pd.DataFrame) -> np.ndarray:
+    return bundle['model'].predict_proba(model_inputs(features, bundle))[:, 1]
+
+
+class _BottomKSample:
+    """Échantillon uniforme de taille fixe : on garde les lignes de plus petites priorités aléatoires."""
+
+    def __init__(self, size: int, rng: np.random.Generator):
+        self.size, self.rng = size, rng
+        self.X, self.y, self.priorities = None, None, np.empty(0)
+
+    def add(self, X: np.ndarray, y: np.ndarray):
+        if not len(X):
+            return
+        self.X = X if self.X is None else np.vstack([self.X, X])
+        self.y = y if self.y is None else np.concatenate([self.y, y])
+        self.priorities = np.concatenate([self.priorities, self.rng.random(len(X))])
+        if len(self.priorities) > self.size:
+            keep = np.argpartition(self.priorities, self.size)[:self.size]
+            self.X, self.y, self.priorities = self.X[keep], self.y[keep], self.priorities[keep]
+
+
+def evaluate(bundle: Dict, X: np.ndarray, y: np.ndarray) -> Dict:
+    """Métriques sur l'échantillon d'évaluation (X déjà transformé par model_inputs)."""
+    if X is None or len(np.unique(y)) < 2:
+        return {'n_eval': 0 if X is None else int(len(X))}
+    proba = bundle['model'].predict_proba(X)[:, 1]
+    predicted = (proba >= bundle['threshold']).astype(np.int8)
+    return {
+        'n_eval': int(len(y)),
+        'churn_rate': float(y.mean()),
+        'roc_auc': float(roc_auc_score(y, proba)),
+        'precision': float(precision_score(y, predicted, zero_division=0)),
+        'recall': float(recall_score(y, predicted, zero_division=0)),
+        'f1': float(f1_score(y, predicted, zero_division=0)),
+    }
+
+
+def train_hgb(features_csv: str, activity, cutoff, chunk_size: int = CHUNK_SIZE,
+              sample_size: int = TRAIN_SAMPLE_SIZE, seed: int = SEED) -> Tuple[Dict, Dict]:
+    """HistGradientBoosting sur un échantillon uniforme tiré en une passe."""
+    rng = np.random.default_rng(seed)
+    train, test = _BottomKSample(sample_size, rng), _BottomKSample(EVAL_SAMPLE_SIZE, rng)
+    bundle = {'kind': 'hgb', 'columns': None, 'transform': None, 'threshold': THRESHOLD}
+    n_rows = 0
+    for features, labels, holdout in iter_labelled_chunks(features_csv, activity, cutoff, chunk_size):
+        if bundle['columns'] is None:
+            bundle['columns'] = numeric_feature_columns(features)
+        X = model_inputs(features, bundle)
+        train.add(X[~holdout], labels[~holdout])
+        test.add(X[holdout], labels[holdout])
+        n_rows += len(features)
+    if train.X is None or len(np.unique(train.y)) < 2:
+        raise ValueError("Pas assez de lignes labellisées (il faut des utilisateurs churnés et actifs)")
+    model = HistGradientBoostingClassifier(class_weight='balanced', early_stopping=True, random_state=seed)
+    bundle['model'] = model.fit(train.X, train.y)
+    bundle.update({'n_rows': n_rows, 'n_train': int(len(train.y))})
+    return bundle, evaluate(bundle, test.X, test.y)
+
+
+def train_sgd(features_csv: str, activity, cutoff, chunk_size: int = CHUNK_SIZE, seed: int = SEED) -> Tuple[Dict, Dict]:
+    """
+    Régression logistique ajustée sur tous les chunks :
+    passe 1 : moments de log1p(variables) et effectifs des classes ; passe 2 : partial_fit (poids équilibrés).
+    """
+    moments, class_counts, n_rows = None, np.zeros(2), 0
+    for features, labels, holdout in iter_labelled_chunks(features_csv, activity, cutoff, chunk_size):
+        if moments is None:
+            columns = numeric_feature_columns(features)
+            moments = RunningMoments(columns)
+        moments.update(np.log1p(np.maximum(features[columns].to_numpy(dtype=np.float64), 0))[~holdout])
+        class_counts += np.bincount(labels[~holdout], minlength=2)
+        n_rows += len(features)
+    if moments is None or class_counts.min() == 0:
+        raise ValueError("Pas assez de lignes labellisées (il faut des utilisateurs churnés et actifs)")
+    scale = moments.std(ddof=0)
+    bundle = {'kind': 'sgd', 'columns': columns, 'threshold': THRESHOLD,
+              'transform': {'mean': moments.mean, 'scale': np.where(scale > 0, scale, 1.0)}}
+    class_weights = class_counts.sum() / (2 * class_counts)
+
+    rng = np.random.default_rng(seed)
+    model = SGDClassifier(loss='log_loss', alpha=1e-4, random_state=seed)
+    test = _BottomKSample(EVAL_SAMPLE_SIZE, rng)
+    for features, labels, holdout in iter_labelled_chunks(features_csv, activity, cutoff, chunk_size):
+        X = model_inputs(features, bundle)
+        test.add(X[holdout], labels[holdout])
+        order = rng.permutation(np.flatnonzero(~holdout))
+        if len(order):
+            model.partial_fit(X[order], labels[order], classes=[0, 1], sample_weight=class_weights[labels[order]])
+    bundle['model'] = model
+    bundle.update({'n_rows': n_rows, 'n_train': int(class_counts.sum())})
+    return bundle, evaluate(bundle, test.X, test.y)
+
+
+# =============================================================================
+# SCORING
+# =============================================================================
+
+def user_scores(user_ids: np.ndarray, proba: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(user_id triés, probabilité moyenne, nombre de lignes) de chaque utilisateur."""
+    order = np.argsort(user_ids, kind='stable')
+    user_ids = user_ids[order]
+    if not len(user_ids):
+        return user_ids, np.empty(0), np.empty(0, dtype=np.int64)
+    starts = np.flatnonzero(np.concatenate([[True], user_ids[1:] != user_ids[:-1]]))
+    rows = np.diff(np.append(starts, len(user_ids)))
+    return user_ids[starts], np.add.reduceat(proba[order].astype(np.float64), starts) / rows, rows
+
+
+def score_csv(bundle: Dict, input_csv: str = FEATURES_CSV, output_csv: str = SCORES_CSV,
+              chunk_size: int = CHUNK_SIZE) -> Tuple[int, int]:
+    """
+    Probabilité et label de churn de chaque utilisateur (moyenne des probabilités de ses lignes, une par chunk
+    de l'ETL), triés par user_id ; seuls user_id et probabilités de toutes les lignes restent en mémoire.
+    Retourne (lignes scorées, utilisateurs).
+    """
+    ids, probas = [], []
+    for chunk in iter_csv_chunks(input_csv, chunk_size):
+        ids.append(chunk['user_id'].to_numpy(dtype=np.int64))
+        probas.append(predict_proba(bundle, chunk).astype(np.float32))
+    n_rows = sum(len(p) for p in probas)
+    user_ids, proba, rows = user_scores(np.concatenate(ids) if ids else np.empty(0, dtype=np.int64),
+                                        np.concatenate(probas) if probas else np.empty(0, dtype=np.float32))
+    del ids, probas
+    for start in range(0, max(len(user_ids), 1), chunk_size):
+        block = slice(start, start + chunk_size)
+        pd.DataFrame({
+            'user_id': user_ids[block],
+            'churn_probability': np.round(proba[block], 4),
+            'churn': (proba[block] >= bundle['threshold']).astype(np.int8),
+            'rows': rows[block],
+        }).to_csv(output_csv, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+    return n_rows, len(user_ids)
+
+
+def update_report(section: str, values: Dict, path: str = REPORT_PATH):
+    """Complète churn_report.json (sections train et score)."""
+    report = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+    report[section] = values
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+
+# =============================================================================
+# POINT D'ENTRÉE
+# =============================================================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Prédiction du churn à partir des features par utilisateur.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    train = subparsers.add_parser('train', help=f"Entraîne le modèle sur {FEATURES_CSV} et {ACTIVITY_CSV}")
+    train.add_argument('--model', choices=MODELS, default='hgb',
+                       help="hgb : gradient boosting sur un échantillon ; sgd : logistique incrémentale sur tous les chunks")
+    train.add_argument('--input', default=FEATURES_CSV, help="CSV des features par utilisateur")
+    train.add_argument('--activity', default=ACTIVITY_CSV, help="CSV de l'activité par utilisateur (ETL)")
+    train.add_argument('--window', default=WINDOW_PATH,
+                       help="Fenêtre d'observation des features (écrite par main_etl.py --features-until)")
+    train.add_argument('--churn-days', type=int, default=CHURN_DAYS,
+                       help="Inactivité (jours) définissant le churn : durée minimale de la période de labels")
+    train.add_argument('--sample-size', type=int, default=TRAIN_SAMPLE_SIZE, help="Échantillon d'entraînement (hgb)")
+    train.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Lignes par chunk")
+    score = subparsers.add_parser('score', help=f"Score tous les utilisateurs de {FEATURES_CSV}")
+    score.add_argument('--input', default=FEATURES_CSV, help="CSV des features par utilisateur")
+    score.add_argument('--output', default=SCORES_CSV, help="CSV des scores (une ligne par utilisateur)")
+    score.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Lignes par chunk")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == 'train':
+        cutoff = features_cutoff(args.input, args.window)
+        activity = load_activity(args.activity)
+        reference = label_period(activity[1], cutoff, args.churn_days)
+        print(f"Churn : features antérieures au {cutoff}, aucune activité du {cutoff} au {reference}")
+        start = time.perf_counter()
+        if args.model == 'hgb':
+            bundle, metrics = train_hgb(args.input, activity, cutoff, args.chunk_size, args.sample_size)
+        else:
+            bundle, metrics = train_sgd(args.input, activity, cutoff, args.chunk_size)
+        train_s = time.perf_counter() - start
+        bundle.update({'version': MODEL_VERSION, 'churn_days': args.churn_days, 'features_until': str(cutoff),
+                       'reference_date': str(reference),
+                       'metrics': metrics, 'created_at': datetime.datetime.now().isoformat(timespec='seconds')})
+        joblib.dump(bundle, MODEL_PATH)
+        update_report('train', {'model': args.model, 'rows': bundle['n_rows'], 'n_train': bundle['n_train'],
+                                'train_s': round(train_s, 3), 'features_until': str(cutoff),
+                                'reference_date': str(reference),
+                                'churn_days': args.churn_days, 'metrics': metrics})
+        print(f"Modèle {args.model} entraîné en {train_s:.1f} s sur {bundle['n_train']} lignes "
+              f"({bundle['n_rows']} lignes labellisées), sauvegardé dans {MODEL_PATH}")
+        print("Évaluation : " + ", ".join(f"{k} {v:.4f}" if isinstance(v, float) else f"{k} {v}"
+                                          for k, v in metrics.items()))
+        return
+
+    bundle = joblib.load(MODEL_PATH)
+    if bundle.get('version') != MODEL_VERSION:
+        raise ValueError(f"Version de modèle {bundle.get('version')} non supportée (attendue : {MODEL_VERSION})")
+    start = time.perf_counter()
+    n_rows, n_users = score_csv(bundle, args.input, args.output, args.chunk_size)
+    score_s = time.perf_counter() - start
+    update_report('score', {'rows': n_rows, 'users': n_users, 'score_s': round(score_s, 3),
+                            'rows_per_s': round(n_rows / score_s, 1) if score_s > 0 else None})
+    print(f"{n_rows} lignes scorées en {score_s:.1f} s ({n_rows / max(score_s, 1e-9):.0f} lignes/s), "
+          f"{n_users} utilisateurs dans {args.output}")
+    print(f"Rapport mis à jour : {REPORT_PATH}")
+
+if __name__ == '__main__':
+    main()
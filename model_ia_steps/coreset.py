@@ -0,0 +1,101 @@
+"""
+coreset.py
+Coreset pondéré pour KMeans, construit en une passe sur un CSV lu par chunks.
+
+Chaque chunk est résumé par un coreset « léger » (Bachem et al., 2018) : les points sont tirés avec la
+probabilité q(x) = ½·w(x)/W + ½·w(x)·d(x, μ)² / Σ w·d², puis repondérés par w(x) / (m·q(x)), ce qui
+préserve le coût KMeans de toute solution à ε près (erreur additive ε·coût(μ)) avec m = O(d·k·log k / ε²)
+points. Les résumés sont combinés par fusion-réduction (deux coresets de même niveau sont fusionnés puis
+réduits), si bien que la mémoire reste en O(m·log(n/m)) quel que soit le nombre d'utilisateurs.
+"""
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from streaming import CHUNK_SIZE, iter_csv_chunks
+
+# Nombre de points pondérés conservés
+CORESET_SIZE = 50000
+
+
+def lightweight_coreset(X, weights=None, size: int = CORESET_SIZE, rng=None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Réduit l'ensemble pondéré (X, weights) à au plus `size` points pondérés (tirage avec remise ;
+    les points tirés plusieurs fois sont fusionnés et leurs poids additionnés).
+    """
+    X = np.asarray(X, dtype=np.float64)
+    weights = np.ones(len(X)) if weights is None else np.asarray(weights, dtype=np.float64)
+    if len(X) <= size:
+        return X, weights
+    rng = rng if rng is not None else np.random.default_rng(42)
+    total = weights.sum()
+    mean = weights @ X / total
+    sq_dist = ((X - mean) ** 2).sum(axis=1)
+    weighted_cost = weights @ sq_dist
+    q = 0.5 * weights / total
+    q += 0.5 * weights * sq_dist / weighted_cost if weighted_cost > 0 else 0.5 * weights / total
+    q /= q.sum()
+    idx = rng.choice(len(X), size=size, replace=True, p=q)
+    unique, counts = np.unique(idx, return_counts=True)
+    return X[unique], counts * weights[unique] / (size * q[unique])
+
+
+class StreamingCoreset:
+    """
+    Coreset construit par fusion-réduction au fil des chunks.
+
+    Usage :
+        builder = StreamingCoreset(50000)
+        for chunk in chunks:
+            builder.add(chunk)
+        points, weights = builder.result()
+    """
+
+    def __init__(self, size: int = CORESET_SIZE, random_state: int = 42):
+        self.size = size
+        self.rng = np.random.default_rng(random_state)
+        self.buckets: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        self.n_points = 0
+
+    def add(self, X) -> 'StreamingCoreset':
+        X = np.asarray(X, dtype=np.float64)
+        if len(X) == 0:
+            return self
+        self.n_points += len(X)
+        carry = lightweight_coreset(X, None, self.size, self.rng)
+        level = 0
+        while level in self.buckets:
+            points, weights = self.buckets.pop(level)
+            carry = lightweight_coreset(np.vstack([points, carry[0]]), np.concatenate([weights, carry[1]]),
+                                        self.size, self.rng)
+            level += 1
+        self.buckets[level] = carry
+        return self
+
+    def result(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Coreset final (au plus `size` points) et poids associés ; la somme des poids estime n."""
+        if not self.buckets:
+            return np.empty((0, 0)), np.empty(0)
+        parts: List[Tuple[np.ndarray, np.ndarray]] = list(self.buckets.values())
+        points = np.vstack([p for p, _ in parts])
+        weights = np.concatenate([w for _, w in parts])
+        return lightweight_coreset(points, weights, self.size, self.rng)
+
+
+def build_coreset_from_csv(path: str, columns, size: int = CORESET_SIZE, chunk_size: int = CHUNK_SIZE,
+                           random_state: int = 42, exclude: Optional[np.ndarray] = None
+                           ) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Une passe sur le CSV (colonnes `columns` seulement). `exclude` : masque des lignes du fichier
+    laissées hors du coreset (ex : utilisateurs signalés par anomaly.py).
+    Returns:
+        (points, poids, nombre de lignes lues)
+    """
+    builder = StreamingCoreset(size, random_state)
+    n_rows = 0
+    for chunk in iter_csv_chunks(path, chunk_size, usecols=list(columns)):
+        X = chunk[list(columns)].to_numpy(dtype=np.float64)
+        if exclude is not None:
+            X = X[~exclude[n_rows:n_rows + len(chunk)]]
+        builder.add(X)
+        n_rows += len(chunk)
+    points, weights = builder.result()
+    return points, weights, n_rows
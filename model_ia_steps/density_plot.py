@@ -0,0 +1,118 @@
+"""
+density_plot.py
+Graphiques de projection en densité pour les grandes populations.
+
+Au lieu de dessiner un point par utilisateur (plt.scatter), les points sont comptés dans une grille 2D
+(un histogramme par cluster) alimentée chunk par chunk : la mémoire ne dépend que du nombre de cases, et
+l'image est rendue en une seule opération imshow. Sans clusters, chaque case est colorée selon le
+logarithme de son effectif ; avec clusters, chaque case prend la couleur du cluster majoritaire et une
+intensité croissante avec l'effectif total, de sorte que les petits groupes restent visibles.
+"""
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.patches import Patch
+from typing import List, Optional, Tuple
+
+# Nombre de cases par axe
+PLOT_BINS = 300
+
+# Quantiles écartés de chaque côté pour le cadrage (les points extrêmes sortent du cadre)
+EXTENT_QUANTILE = 0.001
+
+# Marge ajoutée autour du cadrage, en part de l'étendue
+EXTENT_MARGIN = 0.05
+
+# Nombre maximal de points utilisés pour calculer le cadrage
+EXTENT_SAMPLE_SIZE = 1000000
+
+# Intensité minimale d'une case non vide (graphique par cluster)
+MIN_INTENSITY = 0.25
+
+
+def plot_extent(x, y, quantile: float = EXTENT_QUANTILE, margin: float = EXTENT_MARGIN,
+                sample_size: int = EXTENT_SAMPLE_SIZE) -> Tuple[float, float, float, float]:
+    """Cadrage (xmin, xmax, ymin, ymax) robuste aux valeurs extrêmes, calculé sur un échantillon."""
+    points = np.column_stack([np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)])
+    points = points[np.isfinite(points).all(axis=1)]
+    if len(points) > sample_size:
+        points = points[np.random.default_rng(42).choice(len(points), size=sample_size, replace=False)]
+    if len(points) == 0:
+        return (-1.0, 1.0, -1.0, 1.0)
+    low, high = np.quantile(points, [quantile, 1 - quantile], axis=0)
+    span = high - low
+    span[span == 0] = 1.0
+    low, high = low - margin * span, high + margin * span
+    return (float(low[0]), float(high[0]), float(low[1]), float(high[1]))
+
+
+class DensityGrid:
+    """
+    Effectifs par case et par label, cumulés chunk par chunk.
+
+    Le cadrage est fixé au premier appel de add() s'il n'est pas fourni ; les points hors cadre
+    sont comptés dans `outside` et ne sont pas dessinés.
+    """
+
+    def __init__(self, n_labels: int = 1, bins: int = PLOT_BINS, extent=None):
+        self.n_labels = n_labels
+        self.bins = bins
+        self.extent = extent
+        self.counts = np.zeros((n_labels, bins, bins), dtype=np.int64)
+        self.outside = 0
+
+    def add(self, x, y, labels=None) -> 'DensityGrid':
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if len(x) == 0:
+            return self
+        if self.extent is None:
+            self.extent = plot_extent(x, y)
+        xmin, xmax, ymin, ymax = self.extent
+        ix = np.floor((x - xmin) / (xmax - xmin) * self.bins)
+        iy = np.floor((y - ymin) / (ymax - ymin) * self.bins)
+        inside = (ix >= 0) & (ix < self.bins) & (iy >= 0) & (iy < self.bins)
+        self.outside += int(len(x) - inside.sum())
+        cells = ix[inside].astype(np.int64) * self.bins + iy[inside].astype(np.int64)
+        if labels is not None:
+            cells += np.asarray(labels, dtype=np.int64)[inside] * self.bins * self.bins
+        self.counts += np.bincount(cells, minlength=self.counts.size).reshape(self.counts.shape)
+        return self
+
+    @property
+    def n_points(self) -> int:
+        return int(self.counts.sum()) + self.outside
+
+    def image(self, colors) -> np.ndarray:
+        """Image RGB (lignes = axe y) : couleur du label majoritaire, intensité log de l'effectif total."""
+        total = self.counts.sum(axis=0)
+        dominant = self.counts.argmax(axis=0)
+        intensity = np.log1p(total) / np.log1p(max(total.max(), 1))
+        intensity = np.where(total > 0, MIN_INTENSITY + (1 - MIN_INTENSITY) * intensity, 0.0)
+        rgb = 1 - intensity[..., None] * (1 - np.asarray(colors)[dominant])
+        return rgb.transpose(1, 0, 2)
+
+    def save(self, path: str, title: str, xlabel: str = 'PC1', ylabel: str = 'PC2',
+             label_names: Optional[List[str]] = None):
+        plt.figure(figsize=(8,6))
+        if self.n_labels == 1:
+            # Cases vides laissées en blanc
+            density = np.ma.masked_equal(np.log1p(self.counts[0]), 0)
+            plt.imshow(density.T, origin='lower', extent=self.extent, aspect='auto', cmap='viridis',
+                       interpolation='nearest')
+            plt.colorbar(label='Utilisateurs par case (log)')
+        else:
+            colors = plt.get_cmap('tab10' if self.n_labels <= 10 else 'tab20')(np.arange(self.n_labels))[:, :3]
+            plt.imshow(self.image(colors), origin='lower', extent=self.extent, aspect='auto',
+                       interpolation='nearest')
+            names = label_names or [f'Cluster {label}' for label in range(self.n_labels)]
+            sizes = self.counts.sum(axis=(1, 2))
+            plt.legend(handles=[Patch(color=colors[label], label=f'{names[label]} ({sizes[label]})')
+                                for label in range(self.n_labels)])
+        plt.xlabel(xlabel)
+        plt.ylabel(ylabel)
+        plt.title(title)
+        plt.tight_layout()
+        plt.savefig(path)
+        plt.close()
+        if self.outside:
+            print(f"{self.outside} points sur {self.n_points} hors du cadre du graphique")
@@ -0,0 +1,139 @@
+"""
+k_search.py
+Recherche adaptative du nombre de clusters pour l'étape 4 : seul le premier k est ajusté avec
+l'initialisation complète (n_init=10) ; chaque k+1 part de la solution à k dont le cluster de plus forte
+inertie est scindé en deux le long de son axe principal. La recherche s'arrête dès que le score silhouette
+est nettement passé par son maximum.
+"""
+import numpy as np
+from typing import Callable, Dict, Optional
+
+# Baisse de silhouette (par rapport au meilleur score) à partir de laquelle un k est jugé au-delà du pic
+SILHOUETTE_TOLERANCE = 0.02
+
+# Nombre de k consécutifs au-delà du pic avant l'arrêt de la recherche
+PATIENCE = 2
+
+# Nombre maximal de points utilisés pour estimer l'axe principal du cluster scindé
+SPLIT_SAMPLE_SIZE = 100000
+
+
+def cluster_inertias(X, centers, labels, weights=None) -> np.ndarray:
+    """Inertie (somme, pondérée par `weights` s'il est fourni, des distances au carré au centre) de chaque cluster."""
+    X = np.asarray(X)
+    sq_dist = ((X - centers[labels]) ** 2).sum(axis=1)
+    if weights is not None:
+        sq_dist = sq_dist * np.asarray(weights, dtype=np.float64)
+    return np.bincount(labels, weights=sq_dist, minlength=len(centers))
+
+
+def split_cluster_centers(X, centers, labels, weights=None, random_state=42) -> np.ndarray:
+    """
+    Centres initiaux pour k+1 clusters : le cluster de plus forte inertie est remplacé par deux centres
+    placés de part et d'autre de son centre, le long de son axe principal (écart sqrt(2λ/π), comme une
+    bissection de k-means sur une gaussienne). Avec `weights` (poids d'un coreset), inertie, moyenne et
+    covariance du cluster sont pondérées : chaque point compte pour les utilisateurs qu'il représente.
+    """
+    X = np.asarray(X)
+    w = np.ones(len(X)) if weights is None else np.asarray(weights, dtype=np.float64)
+    counts = np.bincount(labels, minlength=len(centers))
+    inertias = np.where(counts >= 2, cluster_inertias(X, centers, labels, w), -1.0)
+    target = int(np.argmax(inertias))
+    members, member_weights = X[labels == target], w[labels == target]
+    if len(members) > SPLIT_SAMPLE_SIZE:
+        rng = np.random.default_rng(random_state)
+        keep = rng.choice(len(members), size=SPLIT_SAMPLE_SIZE, replace=False)
+        members, member_weights = members[keep], member_weights[keep]
+    centered = members - np.average(members, axis=0, weights=member_weights)
+    # Covariance pondérée (poids de fréquence) ; sans poids, estimateur sans biais habituel
+    total = member_weights.sum()
+    covariance = (centered * member_weights[:, None]).T @ centered / max(total - 1, 1)
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    offset = eigenvectors[:, -1] * np.sqrt(2 * max(eigenvalues[-1], 0.0) / np.pi)
+    new_centers = np.delete(centers, target, axis=0)
+    return np.vstack([new_centers, centers[target] - offset, centers[target] + offset])
+
+
+class AdaptiveKSearch:
+    """
+    Recherche du k maximisant le score silhouette, avec centres initialisés à chaud et arrêt anticipé.
+
+    Usage :
+        search = AdaptiveKSearch(fit_fn, score_fn, range(2, 11)).run(X)
+        search.best_k, search.best_model, search.best_labels
+
+    fit_fn(k, init) ajuste un modèle à k clusters (init=None : initialisation complète, sinon tableau des
+    centres) et retourne (modèle, labels de X, inertie) ; score_fn(modèle, labels) retourne le score silhouette.
+    """
+
+    def __init__(self, fit_fn: Callable, score_fn: Callable, K_range,
+                 tolerance: float = SILHOUETTE_TOLERANCE, patience: int = PATIENCE, refine_best: bool = True):
+        self.fit_fn = fit_fn
+        self.score_fn = score_fn
+        self.K_range = list(K_range)
+        self.tolerance = tolerance
+        self.patience = patience
+        self.refine_best = refine_best
+        self.results: Dict[int, dict] = {}
+        self.full_fits = 0
+        self.warm_fits = 0
+        self.best_k: Optional[int] = None
+
+    def _fit(self, k, init=None):
+        model, labels, inertia = self.fit_fn(k, init)
+        if init is None:
+            self.full_fits += 1
+        else:
+            self.warm_fits += 1
+        return model, labels, inertia
+
+    def run(self, X, weights=None) -> 'AdaptiveKSearch':
+        """Parcourt K_range ; `weights` (poids des points de X, ex : coreset) oriente la scission des clusters."""
+        previous = None
+        beyond_peak = 0
+        for k in self.K_range:
+            init = None
+            if previous is not None and k == len(previous['model'].cluster_centers_) + 1:
+                init = split_cluster_centers(X, previous['model'].cluster_centers_, previous['labels'], weights)
+            model, labels, inertia = self._fit(k, init)
+            silhouette = self.score_fn(model, labels)
+            previous = self.results[k] = {'model': model, 'labels': labels, 'inertia': inertia,
+                                          'silhouette': silhouette, 'warm': init is not None}
+            print(f"k={k} : inertie {inertia:.6g}, silhouette {silhouette:.4f}")
+
+            best = max(r['silhouette'] for r in self.results.values())
+            beyond_peak = beyond_peak + 1 if silhouette < best - self.tolerance else 0
+            if beyond_peak >= self.patience:
+                print(f"Arrêt de la recherche à k={k} : silhouette au-delà du pic depuis {beyond_peak} valeurs de k")
+                break
+
+        self.best_k = max(self.results, key=lambda k: self.results[k]['silhouette'])
+        if self.refine_best and self.results[self.best_k]['warm']:
+            # Confirmation par une initialisation complète ; la solution de plus faible inertie est conservée
+            model, labels, inertia = self._fit(self.best_k)
+            if inertia < self.results[self.best_k]['inertia']:
+                self.results[self.best_k].update({'model': model, 'labels': labels, 'inertia': inertia,
+                                                  'silhouette': self.score_fn(model, labels)})
+        print(f"Recherche adaptative : {len(self.results)} valeurs de k évaluées, "
+              f"{self.full_fits} ajustement(s) complet(s), {self.warm_fits} initialisé(s) à chaud")
+        return self
+
+    @property
+    def evaluated_k(self):
+        return sorted(self.results)
+
+    @property
+    def inertias(self):
+        return [self.results[k]['inertia'] for k in self.evaluated_k]
+
+    @property
+    def silhouettes(self):
+        return [self.results[k]['silhouette'] for k in self.evaluated_k]
+
+    @property
+    def best_model(self):
+        return self.results[self.best_k]['model']
+
+    @property
+    def best_labels(self):
+        return self.results[self.best_k]['labels']
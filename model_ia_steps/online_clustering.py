@@ -0,0 +1,188 @@
+"""
+online_clustering.py
+Mise à jour quotidienne des segments sans réajustement complet (k-means en flux avec oubli).
+
+Les utilisateurs nouveaux ou modifiés du jour sont projetés avec la chaîne du modèle persisté
+(segment_model.joblib), puis les centres sont mis à jour par mini-lots : chaque centre est la moyenne
+pondérée de son état précédent et des utilisateurs qui lui sont affectés. Avant chaque mise à jour,
+les poids accumulés sont multipliés par le facteur d'oubli (--decay) : un poids de 1 n'oublie rien,
+un poids de 0,9 donne un horizon d'environ dix mises à jour. Le coût est proportionnel au nombre
+d'utilisateurs reçus.
+
+Chaque mise à jour rapporte la dérive des centres (déplacement depuis la mise à jour précédente et depuis
+le dernier ajustement complet, rapporté à la distance au centre de référence le plus proche). Au-delà de
+--refit-threshold, un réajustement complet (main_model.py) est recommandé.
+
+Usage :
+    python model_ia_steps/online_clustering.py --input utilisateurs_du_jour.csv --decay 0.9
+"""
+import os
+import json
+import argparse
+import datetime
+import joblib
+import numpy as np
+from typing import Dict, Optional
+from segment_model import BUNDLE_PATH, SegmentModel, load_bundle
+from streaming import CHUNK_SIZE, iter_csv_chunks
+
+DRIFT_LOG_PATH = os.path.join('model_ia_steps', 'online_drift.jsonl')
+
+# Facteur d'oubli appliqué aux poids des centres avant chaque mise à jour
+DECAY = 0.9
+
+# Utilisateurs par mini-lot (affectation puis mise à jour des centres)
+BATCH_SIZE = 4096
+
+# Dérive (en part de la distance au centre de référence le plus proche) déclenchant un réajustement complet
+REFIT_THRESHOLD = 0.25
+
+
+class OnlineKMeans:
+    """
+    Centres KMeans mis à jour par mini-lots avec facteur d'oubli.
+
+    counts[c] est le poids effectif du centre c ; pour un mini-lot dont n_c points de moyenne m_c
+    sont affectés à c : centre_c <- (counts_c * centre_c + n_c * m_c) / (counts_c + n_c).
+    """
+
+    def __init__(self, centers, counts=None, decay: float = DECAY, reference_centers=None):
+        self.centers = np.array(centers, dtype=np.float64)
+        k = len(self.centers)
+        self.counts = np.ones(k) if counts is None else np.asarray(counts, dtype=np.float64).copy()
+        self.decay = decay
+        self.reference_centers = (self.centers.copy() if reference_centers is None
+                                  else np.asarray(reference_centers, dtype=np.float64))
+
+    @classmethod
+    def from_bundle(cls, bundle: Dict, decay: float = DECAY) -> 'OnlineKMeans':
+        """État en ligne du modèle persisté ; initialisé à partir de l'ajustement complet s'il n'existe pas."""
+        online = bundle.get('online')
+        if online is not None:
+            return cls(bundle['centers'], online['counts'], decay, online['reference_centers'])
+        sizes = bundle.get('cluster_sizes')
+        if sizes is None:
+            sizes = np.full(len(bundle['centers']), (bundle.get('n_users') or len(bundle['centers'])) / len(bundle['centers']))
+        return cls(bundle['centers'], sizes, decay)
+
+    def predict(self, P) -> np.ndarray:
+        sq_distances = (P ** 2).sum(axis=1)[:, None] - 2 * P @ self.centers.T + (self.centers ** 2).sum(axis=1)
+        return sq_distances.argmin(axis=1)
+
+    def partial_fit(self, P, batch_size: int = BATCH_SIZE) -> np.ndarray:
+        """
+        Une mise à jour (par exemple un jour de données) : oubli appliqué une fois, puis mini-lots successifs.
+        Returns:
+            Nombre d'utilisateurs affectés à chaque centre.
+        """
+        P = np.asarray(P, dtype=np.float64)
+        k, d = self.centers.shape
+        self.counts *= self.decay
+        assigned = np.zeros(k, dtype=np.int64)
+        for start in range(0, len(P), batch_size):
+            batch = P[start:start + batch_size]
+            labels = self.predict(batch)
+            n_b = np.bincount(labels, minlength=k)
+            sums = np.stack([np.bincount(labels, weights=batch[:, j], minlength=k) for j in range(d)], axis=1)
+            updated = n_b > 0
+            total = self.counts[updated] + n_b[updated]
+            self.centers[updated] = (self.counts[updated, None] * self.centers[updated] + sums[updated]) / total[:, None]
+            self.counts[updated] = total
+            assigned += n_b
+        return assigned
+
+    def drift_report(self, previous_centers, refit_threshold: float = REFIT_THRESHOLD) -> Dict:
+        """Déplacement des centres depuis la mise à jour précédente et depuis l'ajustement complet."""
+        reference = self.reference_centers
+        separation = np.sqrt(((reference[:, None, :] - reference[None, :, :]) ** 2).sum(axis=2))
+        np.fill_diagonal(separation, np.inf)
+        nearest = separation.min(axis=1) if len(reference) > 1 else np.ones(len(reference))
+        shift = np.linalg.norm(self.centers - previous_centers, axis=1)
+        drift = np.linalg.norm(self.centers - reference, axis=1)
+        drift_ratio = drift / nearest
+        return {
+            'shift': shift.round(6).tolist(),
+            'drift': drift.round(6).tolist(),
+            'drift_ratio': drift_ratio.round(6).tolist(),
+            'max_drift_ratio': float(drift_ratio.max()),
+            'refit_recommended': bool(drift_ratio.max() > refit_threshold),
+        }
+
+    def to_bundle(self, bundle: Dict, n_updates: int) -> Dict:
+        bundle = dict(bundle)
+        bundle['centers'] = self.centers.copy()
+        bundle['online'] = {
+            'counts': self.counts.copy(),
+            'reference_centers': self.reference_centers.copy(),
+            'decay': self.decay,
+            'updates': n_updates,
+            'updated_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        }
+        return bundle
+
+
+def update_from_csv(input_csv: str, bundle_path: str = BUNDLE_PATH, decay: float = DECAY,
+                    batch_size: int = BATCH_SIZE, refit_threshold: float = REFIT_THRESHOLD,
+                    chunk_size: int = CHUNK_SIZE, dry_run: bool = False) -> Optional[Dict]:
+    """
+    Met à jour les centres du modèle persisté avec les utilisateurs du CSV (features brutes),
+    ajoute le rapport de dérive à DRIFT_LOG_PATH et réécrit le modèle (sauf dry_run).
+    """
+    bundle = load_bundle(bundle_path)
+    model = SegmentModel(bundle)
+    online = OnlineKMeans.from_bundle(bundle, decay)
+    previous_centers = online.centers.copy()
+    assigned = np.zeros(len(online.centers), dtype=np.int64)
+    for chunk in iter_csv_chunks(input_csv, chunk_size):
+        assigned += online.partial_fit(model.transform(chunk), batch_size)
+    if assigned.sum() == 0:
+        print(f"Aucun utilisateur dans {input_csv}")
+        return None
+
+    n_updates = (bundle.get('online') or {}).get('updates', 0) + 1
+    report = online.drift_report(previous_centers, refit_threshold)
+    report.update({
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'input': input_csv,
+        'update': n_updates,
+        'n_users': int(assigned.sum()),
+        'assigned': assigned.tolist(),
+        'decay': decay,
+    })
+    print(f"Mise à jour n°{n_updates} : {report['n_users']} utilisateurs, répartition {report['assigned']}")
+    for c, (shift, ratio) in enumerate(zip(report['shift'], report['drift_ratio'])):
+        print(f"   centre {c} : déplacement {shift:.4f}, dérive depuis l'ajustement complet {ratio:.1%}")
+    if report['refit_recommended']:
+        print(f"⚠️ Dérive maximale {report['max_drift_ratio']:.1%} > {refit_threshold:.0%} : "
+              "réajustement complet recommandé (python main_model.py)")
+
+    if not dry_run:
+        joblib.dump(online.to_bundle(bundle, n_updates), bundle_path)
+        with open(DRIFT_LOG_PATH, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(report) + '\n')
+        print(f"Centres mis à jour dans {bundle_path}, rapport de dérive ajouté à {DRIFT_LOG_PATH}")
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Mise à jour en ligne des centres de segmentation (k-means en flux).")
+    parser.add_argument('--input', required=True, help="CSV de features des utilisateurs nouveaux ou modifiés")
+    parser.add_argument('--model', default=BUNDLE_PATH, help=f"Artefact du modèle (défaut : {BUNDLE_PATH})")
+    parser.add_argument('--decay', type=float, default=DECAY, help="Facteur d'oubli appliqué avant la mise à jour (0-1]")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Utilisateurs par mini-lot")
+    parser.add_argument('--refit-threshold', type=float, default=REFIT_THRESHOLD,
+                        help="Dérive (part de la distance au centre voisin) au-delà de laquelle un réajustement est recommandé")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Lignes lues par chunk")
+    parser.add_argument('--dry-run', action='store_true', help="Calcule le rapport de dérive sans modifier le modèle")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not 0 < args.decay <= 1:
+        raise SystemExit("--decay doit être compris dans ]0, 1]")
+    update_from_csv(args.input, args.model, args.decay, args.batch_size, args.refit_threshold,
+                    args.chunk_size, args.dry_run)
+
+if __name__ == '__main__':
+    main()
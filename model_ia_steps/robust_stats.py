@@ -0,0 +1,252 @@
+"""
+robust_stats.py
+Statistiques robustes en flux, partagées par l'ETL (clean_data) et le prétraitement (step2_preprocess) :
+quantiles approchés par histogramme à cases logarithmiques (sketch de type DDSketch), remplis pendant
+une passe qui lit déjà les données.
+
+Chaque valeur x est comptée dans la case ceil(log_gamma(|x|)), avec gamma = (1 + a) / (1 - a) : tout
+quantile est estimé à une erreur relative a près, y compris dans les queues de distribution (là où sont
+les bornes de troncature). Les compteurs s'additionnent, la fusion de sketches (chunks, workers) est donc
+exacte et ne dépend pas de l'ordre des données.
+
+Le fichier output/robust_stats.json est écrit par l'ETL : prix des événements, avec la signature des
+fichiers d'entrée lus (bornes de clean_data d'un lancement suivant sur les mêmes fichiers, sur demande :
+main_etl.py --price-bounds-from), et features par utilisateur, avec la signature du fichier de features
+écrit (bornes de step2_preprocess sans passe supplémentaire).
+"""
+import json
+import math
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+ROBUST_STATS_PATH = os.path.join('output', 'robust_stats.json')
+
+# Version du format du fichier (à incrémenter si son contenu change)
+STATS_VERSION = 1
+
+# Erreur relative des quantiles estimés (0.5 % : environ 4 000 cases pour couvrir 1e-9 à 1e9)
+RELATIVE_ACCURACY = 0.005
+
+# Valeurs absolues en dessous de ce seuil comptées comme zéro (le logarithme n'est pas défini en 0)
+MIN_INDEXABLE = 1e-9
+
+
+class _BucketStore:
+    """Compteurs de cases contigus (tableau numpy) à partir de l'indice `offset`, étendus à la demande."""
+
+    def __init__(self, offset: int = 0, counts: Optional[np.ndarray] = None):
+        self.offset = offset
+        self.counts = np.zeros(0, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+
+    def add_indices(self, indices: np.ndarray):
+        if indices.size:
+            low = int(indices.min())
+            self.add_counts(low, np.bincount(indices - low))
+
+    def add_counts(self, offset: int, counts: np.ndarray):
+        if not len(counts):
+            return
+        if not len(self.counts):
+            self.offset, self.counts = offset, counts.astype(np.int64, copy=True)
+            return
+        low = min(self.offset, offset)
+        high = max(self.offset + len(self.counts), offset + len(counts))
+        if low != self.offset or high != self.offset + len(self.counts):
+            extended = np.zeros(high - low, dtype=np.int64)
+            extended[self.offset - low:self.offset - low + len(self.counts)] = self.counts
+            self.offset, self.counts = low, extended
+        self.counts[offset - self.offset:offset - self.offset + len(counts)] += counts
+
+    def nonzero(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(indices, compteurs) des cases non vides, par indice croissant."""
+        positions = np.flatnonzero(self.counts)
+        return positions + self.offset, self.counts[positions]
+
+    def to_dict(self) -> Dict:
+        return {'offset': int(self.offset), 'counts': self.counts.tolist()}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> '_BucketStore':
+        return cls(int(data['offset']), np.asarray(data['counts'], dtype=np.int64))
+
+
+class QuantileSketch:
+    """
+    Sketch de quantiles d'une variable : cases logarithmiques pour les valeurs positives et négatives,
+    compteur de zéros, min et max exacts. Les valeurs manquantes et infinies sont ignorées.
+    """
+
+    def __init__(self, relative_accuracy: float = RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = _BucketStore()
+        self.negative = _BucketStore()
+        self.zero_count = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _indices(self, magnitudes: np.ndarray) -> np.ndarray:
+        return np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64)
+
+    def _values(self, indices: np.ndarray) -> np.ndarray:
+        """Valeur représentative de chaque case (erreur relative au plus relative_accuracy)."""
+        return 2 * np.power(self.gamma, indices.astype(np.float64)) / (self.gamma + 1)
+
+    def update(self, values) -> 'QuantileSketch':
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[np.isfinite(values)]
+        if not values.size:
+            return self
+        positive = values[values > MIN_INDEXABLE]
+        negative = -values[values < -MIN_INDEXABLE]
+        self.positive.add_indices(self._indices(positive))
+        self.negative.add_indices(self._indices(negative))
+        self.zero_count += int(values.size - positive.size - negative.size)
+        self.count += int(values.size)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        return self
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Fusion de sketches de précisions différentes "
+                             f"({self.relative_accuracy} et {other.relative_accuracy})")
+        self.positive.add_counts(other.positive.offset, other.positive.counts)
+        self.negative.add_counts(other.negative.offset, other.negative.counts)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantiles(self, qs: Sequence[float]) -> np.ndarray:
+        """Quantiles (q entre 0 et 1) ; q=0 et q=1 renvoient le min et le max exacts. NaN si le sketch est vide."""
+        qs = np.asarray(qs, dtype=np.float64)
+        if self.count == 0:
+            return np.full(qs.shape, np.nan)
+        negative_indices, negative_counts = self.negative.nonzero()
+        positive_indices, positive_counts = self.positive.nonzero()
+        # Cases par valeur croissante : négatives (indice décroissant), zéro, positives
+        values = np.concatenate([-self._values(negative_indices[::-1]), [0.0], self._values(positive_indices)])
+        counts = np.concatenate([negative_counts[::-1], [self.zero_count], positive_counts])
+        cumulative = np.cumsum(counts)
+        ranks = np.clip(qs, 0, 1) * (self.count - 1)
+        positions = np.minimum(np.searchsorted(cumulative, ranks, side='right'), len(values) - 1)
+        result = np.clip(values[positions], self.min, self.max)
+        result[qs <= 0] = self.min
+        result[qs >= 1] = self.max
+        return result
+
+    def quantile(self, q: float) -> float:
+        return float(self.quantiles([q])[0])
+
+    def to_dict(self) -> Dict:
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'count': self.count,
+            'zero_count': self.zero_count,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            'positive': self.positive.to_dict(),
+            'negative': self.negative.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'QuantileSketch':
+        sketch = cls(float(data['relative_accuracy']))
+        sketch.count = int(data['count'])
+        sketch.zero_count = int(data['zero_count'])
+        if sketch.count:
+            sketch.min, sketch.max = float(data['min']), float(data['max'])
+        sketch.positive = _BucketStore.from_dict(data['positive'])
+        sketch.negative = _BucketStore.from_dict(data['negative'])
+        return sketch
+
+
+class ColumnSketches:
+    """
+    Un QuantileSketch par colonne. `source` identifie les données décrites, quand elles sont exactement
+    connues : signature (taille, date de modification) du fichier de features écrit par l'ETL, ou de
+    chacun des fichiers d'entrée pour les prix des événements.
+    """
+
+    def __init__(self, columns: List[str], relative_accuracy: float = RELATIVE_ACCURACY):
+        self.columns = list(columns)
+        self.sketches = {col: QuantileSketch(relative_accuracy) for col in self.columns}
+        self.source: Optional[Dict] = None
+
+    def update(self, df: pd.DataFrame) -> 'ColumnSketches':
+        """Ajoute un chunk (les colonnes absentes du chunk sont ignorées)."""
+        for col in self.columns:
+            if col in df.columns:
+                self.sketches[col].update(df[col].to_numpy())
+        return self
+
+    def merge(self, other: 'ColumnSketches') -> 'ColumnSketches':
+        for col, sketch in other.sketches.items():
+            if col not in self.sketches:
+                self.columns.append(col)
+                self.sketches[col] = QuantileSketch(sketch.relative_accuracy)
+            self.sketches[col].merge(sketch)
+        return self
+
+    def n_rows(self) -> int:
+        return max((sketch.count for sketch in self.sketches.values()), default=0)
+
+    def quantiles(self, q: float, columns: Optional[List[str]] = None) -> pd.Series:
+        columns = self.columns if columns is None else columns
+        return pd.Series([self.sketches[col].quantile(q) for col in columns], index=columns, dtype=np.float64)
+
+    def clip_bounds(self, percentiles: Tuple[float, float],
+                    columns: Optional[List[str]] = None) -> Tuple[pd.Series, pd.Series]:
+        """Bornes de troncature (percentiles entre 0 et 100) par colonne."""
+        low, high = percentiles
+        return self.quantiles(low / 100, columns), self.quantiles(high / 100, columns)
+
+    def matches(self, path: str) -> bool:
+        """Vrai si les sketches décrivent le fichier `path` dans son état actuel."""
+        return self.source is not None and os.path.exists(path) and file_signature(path) == self.source
+
+    def to_dict(self) -> Dict:
+        return {'source': self.source, 'columns': {col: s.to_dict() for col, s in self.sketches.items()}}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ColumnSketches':
+        sketches = cls([])
+        for col, sketch in data['columns'].items():
+            sketches.columns.append(col)
+            sketches.sketches[col] = QuantileSketch.from_dict(sketch)
+        sketches.source = data.get('source')
+        return sketches
+
+
+def file_signature(path: str) -> Dict:
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def save_robust_stats(groups: Dict[str, ColumnSketches], path: str = ROBUST_STATS_PATH):
+    """Sauvegarde des groupes de sketches (ex : {'events': ..., 'features': ...})."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    data = {'version': STATS_VERSION, 'groups': {name: group.to_dict() for name, group in groups.items()}}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+
+def load_robust_stats(path: str = ROBUST_STATS_PATH) -> Dict[str, ColumnSketches]:
+    """Groupes de sketches sauvegardés ({} si le fichier est absent, illisible ou d'une autre version)."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get('version') != STATS_VERSION:
+        return {}
+    return {name: ColumnSketches.from_dict(group) for name, group in data['groups'].items()}
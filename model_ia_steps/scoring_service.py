@@ -0,0 +1,318 @@
+"""
+scoring_service.py
+Service HTTP local d'affectation des utilisateurs à leur segment.
+
+Le modèle de segmentation persisté (segment_model.joblib) est chargé une seule fois au démarrage.
+Les requêtes concurrentes sont regroupées en micro-lots : un thread unique prend la première requête en
+file et toutes celles arrivées pendant le calcul du lot précédent (jusqu'à --max-batch utilisateurs), puis
+calcule tous les segments du lot en un seul produit matriciel. Une requête seule part sans attendre ;
+--max-wait-ms (0 par défaut) ajoute une attente d'autres requêtes lorsque plusieurs arrivent ensemble.
+
+Routes :
+    POST /segments   {"users": [{"user_id": ..., "view": ..., ...}, ...]}  ou  {"features": [[...], ...]}
+                     -> {"segments": [{"user_id": ..., "cluster": ...}, ...]}
+    GET  /stats      latences p50/p90/p99, débit et taille moyenne des lots (JSON)
+    GET  /metrics    mêmes indicateurs au format texte Prometheus
+    GET  /health
+
+Usage :
+    python model_ia_steps/scoring_service.py --port 8080
+"""
+import json
+import queue
+import argparse
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from segment_model import BUNDLE_PATH, SegmentModel
+
+HOST = '127.0.0.1'
+PORT = 8080
+
+# Taille maximale d'un micro-lot (utilisateurs) et attente maximale après la première requête, seulement si
+# d'autres requêtes attendaient déjà (0 : les lots se forment pendant le calcul du lot précédent ; une attente
+# n'a fait qu'augmenter les latences au test de charge, jusqu'à 32 clients)
+MAX_BATCH_ROWS = 4096
+MAX_WAIT_MS = 0.0
+
+# Nombre de requêtes récentes conservées pour le calcul des percentiles
+LATENCY_WINDOW = 10000
+
+METRICS_PREFIX = 'mspr_scoring'
+
+
+class LatencyStats:
+    """Latences des dernières requêtes (fenêtre glissante) et compteurs cumulés, partagés entre threads."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.users = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.latency_sum = 0.0
+
+    def record_request(self, seconds: float, users: int, error: bool = False):
+        with self.lock:
+            self.requests += 1
+            self.errors += int(error)
+            self.users += users
+            self.latency_sum += seconds
+            self.latencies.append(seconds)
+
+    def record_batch(self, n_requests: int):
+        with self.lock:
+            self.batches += 1
+            self.batched_requests += n_requests
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            latencies = np.array(self.latencies)
+            elapsed = max(time.time() - self.started, 1e-9)
+            stats = {
+                'requests': self.requests,
+                'errors': self.errors,
+                'users': self.users,
+                'batches': self.batches,
+                'mean_requests_per_batch': self.batched_requests / self.batches if self.batches else 0.0,
+                'requests_per_s': self.requests / elapsed,
+                'latency_sum_s': self.latency_sum,
+                'uptime_s': elapsed,
+            }
+        for q in (50, 90, 99):
+            stats[f'p{q}_ms'] = float(np.percentile(latencies, q) * 1000) if len(latencies) else 0.0
+        return stats
+
+    def render_prometheus(self) -> str:
+        stats = self.snapshot()
+        lines = [
+            f"# HELP {METRICS_PREFIX}_request_latency_seconds Latence des requêtes /segments (fenêtre glissante).",
+            f"# TYPE {METRICS_PREFIX}_request_latency_seconds summary",
+        ]
+        for q in (50, 90, 99):
+            lines.append(f'{METRICS_PREFIX}_request_latency_seconds{{quantile="{q / 100:g}"}} {stats[f"p{q}_ms"] / 1000}')
+        lines += [
+            f"{METRICS_PREFIX}_request_latency_seconds_sum {stats['latency_sum_s']}",
+            f"{METRICS_PREFIX}_request_latency_seconds_count {stats['requests']}",
+            f"# TYPE {METRICS_PREFIX}_errors_total counter",
+            f"{METRICS_PREFIX}_errors_total {stats['errors']}",
+            f"# TYPE {METRICS_PREFIX}_users_total counter",
+            f"{METRICS_PREFIX}_users_total {stats['users']}",
+            f"# TYPE {METRICS_PREFIX}_batches_total counter",
+            f"{METRICS_PREFIX}_batches_total {stats['batches']}",
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+class MicroBatcher:
+    """
+    Regroupe les matrices de features soumises par les threads HTTP et les affecte en un seul appel
+    à SegmentModel.assign_segments ; chaque soumission reçoit un Future avec ses propres labels.
+    """
+
+    def __init__(self, model: SegmentModel, stats: LatencyStats, max_rows: int = MAX_BATCH_ROWS,
+                 max_wait_ms: float = MAX_WAIT_MS):
+        self.model = model
+        self.stats = stats
+        self.max_rows = max_rows
+        self.max_wait = max_wait_ms / 1000
+        self.queue: queue.Queue = queue.Queue()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self.thread.start()
+
+    def submit(self, X: np.ndarray) -> Future:
+        future: Future = Future()
+        self.queue.put((X, future))
+        if self.stop_event.is_set():
+            self._fail_pending()
+        return future
+
+    def stop(self):
+        """Arrête le thread de calcul ; les soumissions encore en file reçoivent une erreur."""
+        self.stop_event.set()
+        self.thread.join(timeout=1)
+        self._fail_pending()
+
+    def _fail_pending(self):
+        while True:
+            try:
+                _, future = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            future.set_exception(RuntimeError("Service de segmentation arrêté"))
+
+    def _collect(self):
+        """
+        Attend une première soumission puis prend celles déjà en file ; si la file était vide, le lot part
+        aussitôt. Sinon (requêtes concurrentes), le lot est complété jusqu'à max_rows ou max_wait.
+        """
+        try:
+            batch = [self.queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        rows = len(batch[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while rows < self.max_rows:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.perf_counter()
+                if len(batch) == 1 or remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            batch.append(item)
+            rows += len(item[0])
+        return batch
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            try:
+                labels = self.model.assign_segments(np.concatenate([X for X, _ in batch]))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for X, future in batch:
+                future.set_result(labels[offset:offset + len(X)])
+                offset += len(X)
+            self.stats.record_batch(len(batch))
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'SegmentScoring/1.0'
+    # Réponses envoyées en un seul segment TCP (pas d'attente Nagle / ACK retardé)
+    disable_nagle_algorithm = True
+    wbufsize = 65536
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: str, content_type: str = 'application/json'):
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_json(self, status: int, data: dict):
+        self._send(status, json.dumps(data))
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok', 'n_clusters': self.server.model.n_clusters,
+                                  'model_version': self.server.model.bundle['version']})
+        elif self.path == '/stats':
+            self._send_json(200, self.server.stats.snapshot())
+        elif self.path == '/metrics':
+            self._send(200, self.server.stats.render_prometheus(), 'text/plain; version=0.0.4')
+        else:
+            self._send_json(404, {'error': f"Route inconnue : {self.path}"})
+
+    def do_POST(self):
+        if self.path != '/segments':
+            self._send_json(404, {'error': f"Route inconnue : {self.path}"})
+            return
+        start = time.perf_counter()
+        n_users = 0
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            user_ids, X = self.server.parse_payload(payload)
+            n_users = len(X)
+            labels = self.server.batcher.submit(X).result()
+        except (ValueError, KeyError, TypeError) as e:
+            self.server.stats.record_request(time.perf_counter() - start, n_users, error=True)
+            self._send_json(400, {'error': str(e)})
+            return
+        except Exception as e:
+            self.server.stats.record_request(time.perf_counter() - start, n_users, error=True)
+            self._send_json(500, {'error': f"Erreur interne : {e}"})
+            return
+        segments = [{'user_id': uid, 'cluster': int(label)} for uid, label in zip(user_ids, labels)]
+        self._send_json(200, {'segments': segments})
+        self.server.stats.record_request(time.perf_counter() - start, n_users)
+
+
+class ScoringServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, model: SegmentModel, max_batch_rows: int = MAX_BATCH_ROWS,
+                 max_wait_ms: float = MAX_WAIT_MS):
+        super().__init__(address, ScoringHandler)
+        self.model = model
+        self.stats = LatencyStats()
+        self.batcher = MicroBatcher(model, self.stats, max_batch_rows, max_wait_ms)
+
+    def parse_payload(self, payload: dict):
+        """
+        Retourne (identifiants, matrice float32) ; les variables absentes ou nulles sont traitées comme
+        manquantes (NaN). La matrice est construite directement depuis les objets JSON, sans DataFrame.
+        """
+        columns = self.model.columns
+        if 'users' in payload:
+            users = payload['users']
+            if not isinstance(users, list) or not all(isinstance(user, dict) for user in users):
+                raise ValueError("'users' doit être une liste d'objets")
+            X = np.array([[user.get(c) for c in columns] for user in users], dtype=np.float32)
+            return [user.get('user_id') for user in users], X.reshape(len(users), len(columns))
+        if 'features' in payload:
+            X = np.asarray(payload['features'], dtype=np.float32)
+            if X.ndim != 2 or X.shape[1] != len(columns):
+                raise ValueError(f"{len(columns)} variables attendues : {columns}")
+            user_ids = payload.get('user_ids')
+            if user_ids is None:
+                return [None] * len(X), X
+            if not isinstance(user_ids, list) or len(user_ids) != len(X):
+                raise ValueError(f"'user_ids' doit être une liste de {len(X)} identifiants, un par ligne de 'features'")
+            return user_ids, X
+        raise ValueError("Champ 'users' ou 'features' attendu")
+
+    def server_close(self):
+        self.batcher.stop()
+        super().server_close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Service HTTP d'affectation des utilisateurs aux segments.")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--model', default=BUNDLE_PATH, help=f"Artefact du modèle (défaut : {BUNDLE_PATH})")
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH_ROWS, help="Utilisateurs maximum par micro-lot")
+    parser.add_argument('--max-wait-ms', type=float, default=MAX_WAIT_MS,
+                        help="Attente maximale (ms) pour compléter un micro-lot quand plusieurs requêtes "
+                             f"arrivent ensemble (défaut : {MAX_WAIT_MS})")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    model = SegmentModel.load(args.model)
+    server = ScoringServer((args.host, args.port), model, args.max_batch, args.max_wait_ms)
+    print(f"Service de segmentation ({model.n_clusters} segments) à l'écoute sur http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""
+segment_history.py
+Suivi des migrations de segments entre deux clusterings successifs (à lancer après step4_clustering).
+
+Les numéros de clusters de KMeans sont arbitraires et changent d'un run à l'autre. Chaque run reçoit donc des
+identifiants de segments stables : les nouveaux centres sont appariés aux centres du run précédent par
+l'algorithme hongrois (linear_sum_assignment, coût = distance entre centres), un centre apparié hérite du
+segment de son homologue, un centre en surnombre reçoit un nouvel identifiant. Les centres sont comparés
+dans l'espace des variables d'origine (la PCA et le scaler peuvent changer entre deux runs), standardisé
+avec le scaler du run courant.
+
+La matrice de transition se calcule sans joindre deux CSV de 10M lignes : le segment de chaque utilisateur
+est conservé dans un instantané compact (user_id entiers triés et segments en int16, fichier .npz), et le
+run courant y est rattaché par fusion triée (recherche dichotomique des identifiants triés). Les utilisateurs
+présents sur plusieurs lignes gardent le segment de leur première ligne.
+
+L'historique (segment_history.jsonl, une ligne par run : appariement, centres, effectifs, matrice de
+transition avec nouveaux utilisateurs et départs) reste de quelques kilo-octets par run ; la dernière
+matrice est aussi écrite en CSV pour les analystes.
+
+Usage :
+    python model_ia_steps/segment_history.py
+"""
+import os
+import json
+import argparse
+import datetime
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional, Tuple
+from scipy.optimize import linear_sum_assignment
+from segment_model import BUNDLE_PATH, load_bundle
+from streaming import CHUNK_SIZE, iter_csv_chunks
+
+CLUSTERS_CSV = os.path.join('model_ia_steps', 'features_clusters.csv')
+HISTORY_PATH = os.path.join('model_ia_steps', 'segment_history.jsonl')
+SNAPSHOT_PATH = os.path.join('model_ia_steps', 'segment_snapshot.npz')
+TRANSITIONS_CSV = os.path.join('model_ia_steps', 'segment_transitions.csv')
+
+
+# =============================================================================
+# APPARIEMENT DES CENTRES
+# =============================================================================
+
+def raw_centers(bundle: Dict) -> np.ndarray:
+    """Centres du modèle ramenés dans l'espace des variables d'origine (PCA puis standardisation inversées)."""
+    standardized = bundle['centers'] @ bundle['pca_components'] + bundle['pca_mean']
+    return standardized * bundle['scaler_scale'] + bundle['scaler_mean']
+
+
+def match_segments(previous_centers: np.ndarray, previous_segments, centers: np.ndarray,
+                   scale: np.ndarray, next_segment: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Appariement hongrois des nouveaux centres aux centres précédents (distance en unités de `scale`) ;
+    les centres non appariés reçoivent les identifiants à partir de `next_segment` (jamais réutilisés).
+    Returns:
+        (segment de chaque nouveau centre, distance au centre apparié, NaN pour un nouveau segment)
+    """
+    previous_segments = np.asarray(previous_segments, dtype=np.int64)
+    scale = np.where(scale > 0, scale, 1.0)
+    cost = np.sqrt((((centers[:, None, :] - previous_centers[None, :, :]) / scale) ** 2).sum(axis=2))
+    rows, cols = linear_sum_assignment(cost)
+    segments = np.full(len(centers), -1, dtype=np.int64)
+    distances = np.full(len(centers), np.nan)
+    segments[rows] = previous_segments[cols]
+    distances[rows] = cost[rows, cols]
+    unmatched = np.flatnonzero(segments < 0)
+    segments[unmatched] = next_segment + np.arange(len(unmatched))
+    return segments, distances
+
+
+# =============================================================================
+# AFFECTATIONS PAR UTILISATEUR
+# =============================================================================
+
+def read_assignments(path: str = CLUSTERS_CSV, chunk_size: int = CHUNK_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (user_id entiers triés et uniques, cluster de chacun) lus par chunks ; seuls les deux tableaux restent
+    en mémoire. Un utilisateur présent sur plusieurs lignes garde le cluster de sa première ligne.
+    """
+    ids, clusters = [], []
+    for chunk in iter_csv_chunks(path, chunk_size, usecols=['user_id', 'cluster']):
+        chunk = chunk.dropna()
+        ids.append(chunk['user_id'].to_numpy(dtype=np.int64))
+        clusters.append(chunk['cluster'].to_numpy(dtype=np.int16))
+    user_ids = np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+    labels = np.concatenate(clusters) if clusters else np.empty(0, dtype=np.int16)
+    order = np.argsort(user_ids, kind='stable')
+    user_ids, labels = user_ids[order], labels[order]
+    first = np.ones(len(user_ids), dtype=bool)
+    first[1:] = user_ids[1:] != user_ids[:-1]
+    return user_ids[first], labels[first]
+
+
+def transition_counts(previous: Tuple[np.ndarray, np.ndarray], current: Tuple[np.ndarray, np.ndarray],
+                      segments: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Fusion triée des deux instantanés (user_id triés) : chaque identifiant courant est cherché par dichotomie
+    dans les identifiants précédents.
+    Returns:
+        (matrice précédent x courant sur la liste `segments`, nouveaux utilisateurs par segment courant,
+         utilisateurs partis par segment précédent)
+    """
+    previous_ids, previous_segments = previous
+    current_ids, current_segments = current
+    n = len(segments)
+    previous_index = np.searchsorted(segments, previous_segments)
+    current_index = np.searchsorted(segments, current_segments)
+    if len(previous_ids):
+        positions = np.minimum(np.searchsorted(previous_ids, current_ids), len(previous_ids) - 1)
+        found = previous_ids[positions] == current_ids
+    else:
+        positions, found = np.zeros(len(current_ids), dtype=np.int64), np.zeros(len(current_ids), dtype=bool)
+    matrix = np.bincount(previous_index[positions[found]] * n + current_index[found], minlength=n * n).reshape(n, n)
+    new_users = np.bincount(current_index[~found], minlength=n)
+    kept = np.zeros(len(previous_ids), dtype=bool)
+    kept[positions[found]] = True
+    departed = np.bincount(previous_index[~kept], minlength=n)
+    return matrix, new_users, departed
+
+
+def load_snapshot(path: str = SNAPSHOT_PATH) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as snapshot:
+        return snapshot['user_ids'], snapshot['segments']
+
+
+def save_snapshot(user_ids: np.ndarray, segments: np.ndarray, path: str = SNAPSHOT_PATH):
+    np.savez(path, user_ids=user_ids, segments=segments.astype(np.int16))
+
+
+# =============================================================================
+# HISTORIQUE
+# =============================================================================
+
+def last_entry(path: str = HISTORY_PATH) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    entry = None
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+    return entry
+
+
+def record_run(clusters_csv: str = CLUSTERS_CSV, bundle_path: str = BUNDLE_PATH,
+               chunk_size: int = CHUNK_SIZE, force: bool = False) -> Optional[Dict]:
+    """
+    Apparie les segments du run courant au run précédent, calcule la matrice de transition,
+    puis ajoute l'entrée à l'historique et remplace l'instantané.
+    """
+    bundle = load_bundle(bundle_path)
+    previous = last_entry(HISTORY_PATH)
+    if previous is not None and previous.get('model_created_at') == bundle['created_at'] and not force:
+        print(f"Run du {bundle['created_at']} déjà enregistré dans {HISTORY_PATH} (--force pour le réenregistrer)")
+        return None
+
+    centers = raw_centers(bundle)
+    if previous is None:
+        segments, distances = np.arange(len(centers)), np.full(len(centers), np.nan)
+    elif previous['columns'] != bundle['columns']:
+        raise ValueError(f"Variables différentes de celles du run précédent ({previous['columns']}) : "
+                         f"centres non comparables, déplacer {HISTORY_PATH} pour démarrer un nouvel historique")
+    else:
+        segments, distances = match_segments(np.asarray(previous['centers']), previous['segments'],
+                                             centers, bundle['scaler_scale'], previous['next_segment'])
+    user_ids, clusters = read_assignments(clusters_csv, chunk_size)
+    if len(clusters) and clusters.max() >= len(centers):
+        raise ValueError(f"{clusters_csv} contient des clusters absents de {bundle_path} : relancer step4_clustering")
+    current = (user_ids, segments[clusters].astype(np.int16))
+
+    entry = {
+        'run': 1 if previous is None else previous['run'] + 1,
+        'recorded_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'model_created_at': bundle['created_at'],
+        'n_users': int(len(user_ids)),
+        'columns': bundle['columns'],
+        'segments': segments.tolist(),
+        'next_segment': int(max(segments.max() + 1, 0 if previous is None else previous['next_segment'])),
+        'match_distance': [None if np.isnan(d) else round(float(d), 6) for d in distances],
+        'centers': np.round(centers, 6).tolist(),
+        'sizes': np.bincount(clusters, minlength=len(centers)).tolist(),
+        'transitions': None,
+    }
+    snapshot = load_snapshot(SNAPSHOT_PATH)
+    if previous is not None and snapshot is not None:
+        all_segments = np.union1d(previous['segments'], segments)
+        matrix, new_users, departed = transition_counts(snapshot, current, all_segments)
+        n_common = int(matrix.sum())
+        entry['transitions'] = {
+            'segments': all_segments.tolist(),
+            'counts': matrix.tolist(),
+            'new_users': new_users.tolist(),
+            'departed': departed.tolist(),
+            'n_common': n_common,
+            'stayed_share': float(np.trace(matrix) / n_common) if n_common else None,
+        }
+        write_transitions_csv(entry['transitions'])
+
+    save_snapshot(*current, path=SNAPSHOT_PATH)
+    with open(HISTORY_PATH, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry) + '\n')
+    return entry
+
+
+def write_transitions_csv(transitions: Dict, path: str = TRANSITIONS_CSV):
+    """Matrice lisible : une ligne par segment précédent (+ nouveaux), une colonne par segment courant (+ partis)."""
+    labels = [f"segment_{s}" for s in transitions['segments']]
+    table = pd.DataFrame(transitions['counts'], index=labels, columns=labels)
+    table['partis'] = transitions['departed']
+    table.loc['nouveaux'] = transitions['new_users'] + [0]
+    table.to_csv(path, index_label='precedent')
+
+
+# =============================================================================
+# POINT D'ENTRÉE
+# =============================================================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Suivi des migrations de segments entre deux clusterings.")
+    parser.add_argument('--clusters', default=CLUSTERS_CSV, help=f"Affectations du run courant (défaut : {CLUSTERS_CSV})")
+    parser.add_argument('--model', default=BUNDLE_PATH, help=f"Artefact du run courant (défaut : {BUNDLE_PATH})")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Lignes lues par chunk")
+    parser.add_argument('--force', action='store_true', help="Enregistre le run même s'il est déjà dans l'historique")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    entry = record_run(args.clusters, args.model, args.chunk_size, args.force)
+    if entry is None:
+        return
+    print(f"Run n°{entry['run']} : {entry['n_users']} utilisateurs, {len(entry['segments'])} segments")
+    for cluster, (segment, distance, size) in enumerate(zip(entry['segments'], entry['match_distance'],
+                                                             entry['sizes'])):
+        origin = "nouveau segment" if distance is None else f"distance au centre précédent {distance:.3f}"
+        print(f"   cluster {cluster} -> segment {segment} ({size} utilisateurs, {origin})")
+    transitions = entry['transitions']
+    if transitions is None:
+        print(f"Premier run : segments initialisés, instantané sauvegardé dans {SNAPSHOT_PATH}")
+    else:
+        stayed = transitions['stayed_share']
+        print(f"{transitions['n_common']} utilisateurs présents aux deux runs"
+              + (f", {stayed:.1%} dans le même segment" if stayed is not None else "")
+              + f" ; {sum(transitions['new_users'])} nouveaux, {sum(transitions['departed'])} partis")
+        print(f"Matrice de transition sauvegardée dans {TRANSITIONS_CSV}")
+    print(f"Historique complété : {HISTORY_PATH}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""
+segment_model.py
+Modèle de segmentation persisté et API de scoring par lots.
+
+La chaîne ajustée par les étapes 2 à 4 (troncature, StandardScaler, imputation par la moyenne, PCA,
+centres KMeans) est sauvegardée dans un artefact versionné unique. Au chargement, elle est réduite à
+des opérations float32 : remplacement des NaN, troncature, puis un seul produit matriciel
+(variables x clusters) dont l'argmax donne le segment, sans passer par les objets scikit-learn.
+
+Usage :
+    from segment_model import assign_segments
+    labels = assign_segments(features_df)
+
+    python model_ia_steps/segment_model.py --input nouveaux_utilisateurs.csv --output segments.csv
+"""
+import os
+import json
+import argparse
+import datetime
+import joblib
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional
+from streaming import CHUNK_SIZE, iter_csv_chunks
+
+BUNDLE_PATH = os.path.join('model_ia_steps', 'segment_model.joblib')
+PREPROCESS_PARAMS_PATH = os.path.join('model_ia_steps', 'preprocess_params.json')
+PCA_MODEL_PATH = os.path.join('model_ia_steps', 'pca_model.joblib')
+
+# Version du format de l'artefact (à incrémenter à chaque changement incompatible)
+BUNDLE_VERSION = 1
+
+# Lignes traitées par bloc lors du scoring (les tableaux intermédiaires restent dans le cache)
+SCORING_BLOCK_SIZE = 65536
+
+
+def build_bundle(preprocess_params: Dict, projection: Dict, centers, n_users: Optional[int] = None,
+                 cluster_sizes=None) -> Dict:
+    """Assemble les paramètres des étapes 2 (troncature, scaler), 3 (imputation, PCA) et 4 (centres)."""
+    if list(projection['columns']) != list(preprocess_params['columns']):
+        raise ValueError("Les colonnes de la PCA ne correspondent pas à celles du prétraitement")
+    return {
+        'version': BUNDLE_VERSION,
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'n_users': n_users,
+        'columns': list(preprocess_params['columns']),
+        'clip_lower': np.asarray(preprocess_params['clip_lower'], dtype=np.float64),
+        'clip_upper': np.asarray(preprocess_params['clip_upper'], dtype=np.float64),
+        'scaler_mean': np.asarray(preprocess_params['scaler_mean'], dtype=np.float64),
+        'scaler_scale': np.asarray(preprocess_params['scaler_scale'], dtype=np.float64),
+        'impute_means': np.asarray(projection['impute_means'], dtype=np.float64),
+        'pca_mean': np.asarray(projection['mean'], dtype=np.float64),
+        'pca_components': np.asarray(projection['components'], dtype=np.float64),
+        'centers': np.asarray(centers, dtype=np.float64),
+        'cluster_sizes': None if cluster_sizes is None else np.asarray(cluster_sizes, dtype=np.int64),
+        'sources': {'preprocess_mode': preprocess_params.get('mode'), 'pca_solver': projection.get('solver')},
+    }
+
+
+def export_bundle(centers, n_users: Optional[int] = None, cluster_sizes=None,
+                  path: str = BUNDLE_PATH) -> Optional[Dict]:
+    """
+    Construit l'artefact à partir des paramètres sauvegardés par les étapes 2 et 3 et des centres KMeans,
+    puis l'écrit dans `path`. Retourne None si un des fichiers de paramètres est absent.
+    """
+    if not (os.path.exists(PREPROCESS_PARAMS_PATH) and os.path.exists(PCA_MODEL_PATH)):
+        print(f"⚠️ {PREPROCESS_PARAMS_PATH} ou {PCA_MODEL_PATH} introuvable : modèle de segmentation non sauvegardé")
+        return None
+    with open(PREPROCESS_PARAMS_PATH, encoding='utf-8') as f:
+        preprocess_params = json.load(f)
+    bundle = build_bundle(preprocess_params, joblib.load(PCA_MODEL_PATH), centers, n_users, cluster_sizes)
+    joblib.dump(bundle, path)
+    print(f"Modèle de segmentation (version {BUNDLE_VERSION}) sauvegardé dans {path}")
+    return bundle
+
+
+def load_bundle(path: str = BUNDLE_PATH) -> Dict:
+    bundle = joblib.load(path)
+    if bundle.get('version') != BUNDLE_VERSION:
+        raise ValueError(f"Version de modèle {bundle.get('version')} incompatible (attendue : {BUNDLE_VERSION})")
+    return bundle
+
+
+class SegmentModel:
+    """
+    Chaîne de scoring compilée en float32.
+
+    Les valeurs manquantes sont remplacées par la valeur brute équivalente à la moyenne d'imputation,
+    puis tronquées. La standardisation et la PCA étant affines, la projection vaut x @ W + b ; la distance
+    au carré à un centre c s'écrit ||p||² - 2 p·c + ||c||², donc le centre le plus proche est
+    argmax(x @ G + h) avec G = 2 W Cᵀ et h = 2 b Cᵀ - ||c||².
+    """
+
+    def __init__(self, bundle: Dict):
+        self.bundle = bundle
+        self.columns = list(bundle['columns'])
+        self.n_clusters = len(bundle['centers'])
+        scale = bundle['scaler_scale']
+        components = bundle['pca_components']
+        centers = bundle['centers']
+
+        weights = (components / scale).T
+        bias = -((bundle['scaler_mean'] / scale + bundle['pca_mean']) @ components.T)
+        self.fill = (bundle['impute_means'] * scale + bundle['scaler_mean']).astype(np.float32)
+        self.lower = bundle['clip_lower'].astype(np.float32)
+        self.upper = bundle['clip_upper'].astype(np.float32)
+        self.weights = weights.astype(np.float32)
+        self.bias = bias.astype(np.float32)
+        self.gain = (2 * weights @ centers.T).astype(np.float32)
+        self.offset = (2 * bias @ centers.T - (centers ** 2).sum(axis=1)).astype(np.float32)
+
+    @classmethod
+    def load(cls, path: str = BUNDLE_PATH) -> 'SegmentModel':
+        return cls(load_bundle(path))
+
+    def _matrix(self, features) -> np.ndarray:
+        if isinstance(features, pd.DataFrame):
+            features = features[self.columns].to_numpy(dtype=np.float32)
+        features = np.asarray(features)
+        if features.ndim != 2 or features.shape[1] != len(self.columns):
+            raise ValueError(f"{len(self.columns)} variables attendues : {self.columns}")
+        return features
+
+    def _prepare_block(self, block) -> np.ndarray:
+        block = np.array(block, dtype=np.float32)
+        np.copyto(block, np.broadcast_to(self.fill, block.shape), where=np.isnan(block))
+        return np.clip(block, self.lower, self.upper, out=block)
+
+    def transform(self, features, block_size: int = SCORING_BLOCK_SIZE) -> np.ndarray:
+        """Coordonnées PCA (float32) des utilisateurs."""
+        X = self._matrix(features)
+        out = np.empty((len(X), self.weights.shape[1]), dtype=np.float32)
+        for start in range(0, len(X), block_size):
+            block = self._prepare_block(X[start:start + block_size])
+            np.matmul(block, self.weights, out=out[start:start + block_size])
+            out[start:start + block_size] += self.bias
+        return out
+
+    def assign_segments(self, features, block_size: int = SCORING_BLOCK_SIZE) -> np.ndarray:
+        """Segment (indice du centre KMeans le plus proche) de chaque utilisateur."""
+        X = self._matrix(features)
+        labels = np.empty(len(X), dtype=np.int32)
+        for start in range(0, len(X), block_size):
+            scores = self._prepare_block(X[start:start + block_size]) @ self.gain
+            scores += self.offset
+            labels[start:start + block_size] = scores.argmax(axis=1)
+        return labels
+
+    def assign_csv(self, input_csv: str, output_csv: str, chunk_size: int = CHUNK_SIZE) -> int:
+        """Affecte les utilisateurs d'un CSV de features par chunks ; écrit user_id et cluster."""
+        n_rows = 0
+        header = True
+        for chunk in iter_csv_chunks(input_csv, chunk_size):
+            result = pd.DataFrame({'cluster': self.assign_segments(chunk)})
+            if 'user_id' in chunk.columns:
+                result.insert(0, 'user_id', chunk['user_id'].to_numpy())
+            result.to_csv(output_csv, mode='w' if header else 'a', header=header, index=False)
+            header = False
+            n_rows += len(chunk)
+        return n_rows
+
+
+_models: Dict[str, SegmentModel] = {}
+
+
+def assign_segments(features, bundle_path: str = BUNDLE_PATH) -> np.ndarray:
+    """Affecte un lot d'utilisateurs (DataFrame de features brutes ou tableau) à leur segment."""
+    if bundle_path not in _models:
+        _models[bundle_path] = SegmentModel.load(bundle_path)
+    return _models[bundle_path].assign_segments(features)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Affecte de nouveaux utilisateurs aux segments du modèle sauvegardé.")
+    parser.add_argument('--input', required=True, help="CSV de features utilisateurs (format output/features_all_users.csv)")
+    parser.add_argument('--output', required=True, help="CSV de sortie (user_id, cluster)")
+    parser.add_argument('--model', default=BUNDLE_PATH, help=f"Artefact du modèle (défaut : {BUNDLE_PATH})")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Lignes lues par chunk")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    model = SegmentModel.load(args.model)
+    start = datetime.datetime.now()
+    n_rows = model.assign_csv(args.input, args.output, args.chunk_size)
+    elapsed = (datetime.datetime.now() - start).total_seconds()
+    print(f"{n_rows} utilisateurs affectés en {elapsed:.1f} s, résultats dans {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+silhouette.py
+Estimation du score silhouette sur de grandes populations segmentées :
+- silhouette simplifiée (distances aux centres) en O(n·k) sur tous les points ;
+- échantillonnage stratifié par cluster (les petits clusters restent représentés, avec repondération) ;
+- moyenne de plusieurs échantillons bootstrap, avec un intervalle de confiance.
+"""
+import numpy as np
+from scipy import stats
+from sklearn.metrics import silhouette_samples, silhouette_score
+from typing import Dict
+
+# Méthodes disponibles : 'sampled' (silhouette_score sur un échantillon aléatoire, méthode d'origine),
+# 'simplified' (silhouette par les centres, tous les points), 'stratified' (échantillons stratifiés bootstrap)
+METHODS = ['sampled', 'simplified', 'stratified']
+
+# Taille de chaque échantillon
+SAMPLE_SIZE = 10000
+
+# Nombre minimal de points tirés par cluster (méthode stratified)
+MIN_PER_CLUSTER = 200
+
+# Nombre d'échantillons bootstrap et niveau de l'intervalle de confiance
+N_BOOTSTRAP = 5
+CONFIDENCE = 0.95
+
+# Lignes traitées à la fois par la silhouette simplifiée (matrice de distances chunk x k)
+CHUNK_SIZE = 200000
+
+
+def simplified_silhouette(X, labels, centers, chunk_size: int = CHUNK_SIZE) -> float:
+    """
+    Silhouette simplifiée : a = distance au centre de son cluster, b = distance au centre le plus proche
+    parmi les autres, s = (b - a) / max(a, b). Coût O(n·k), calculée par chunks sur tous les points.
+    """
+    X = np.asarray(X)
+    labels = np.asarray(labels)
+    centers = np.asarray(centers, dtype=X.dtype if X.dtype == np.float32 else np.float64)
+    center_norms = (centers ** 2).sum(axis=1)
+    total = 0.0
+    for start in range(0, len(X), chunk_size):
+        block = X[start:start + chunk_size]
+        block_labels = labels[start:start + chunk_size]
+        sq_distances = (block ** 2).sum(axis=1)[:, None] - 2 * block @ centers.T + center_norms[None, :]
+        distances = np.sqrt(np.maximum(sq_distances, 0))
+        rows = np.arange(len(block))
+        a = distances[rows, block_labels]
+        distances[rows, block_labels] = np.inf
+        b = distances.min(axis=1)
+        denominator = np.maximum(a, b)
+        total += np.divide(b - a, denominator, out=np.zeros_like(a), where=denominator > 0).sum()
+    return float(total / max(len(X), 1))
+
+
+def stratified_indices(labels, sample_size: int = SAMPLE_SIZE, min_per_cluster: int = MIN_PER_CLUSTER,
+                       rng=None):
+    """
+    Indices d'un échantillon stratifié par cluster : chaque cluster reçoit une part proportionnelle
+    à son effectif, avec au moins `min_per_cluster` points (ou tout le cluster s'il est plus petit).
+    Returns:
+        (indices, poids) ; le poids d'un point vaut effectif du cluster / points tirés dans le cluster.
+    """
+    rng = rng if rng is not None else np.random.default_rng(42)
+    labels = np.asarray(labels)
+    clusters, counts = np.unique(labels, return_counts=True)
+    indices, weights = [], []
+    for cluster, count in zip(clusters, counts):
+        members = np.flatnonzero(labels == cluster)
+        n_take = min(count, max(min_per_cluster, int(round(sample_size * count / len(labels)))))
+        chosen = rng.choice(members, size=n_take, replace=False)
+        indices.append(chosen)
+        weights.append(np.full(n_take, count / n_take))
+    return np.concatenate(indices), np.concatenate(weights)
+
+
+def bootstrap_silhouette(X, labels, sample_size: int = SAMPLE_SIZE, n_bootstrap: int = N_BOOTSTRAP,
+                         min_per_cluster: int = MIN_PER_CLUSTER, confidence: float = CONFIDENCE,
+                         random_state: int = 42) -> Dict[str, float]:
+    """
+    Silhouette moyenne sur `n_bootstrap` échantillons stratifiés indépendants (moyenne pondérée par
+    l'effectif des clusters), avec un intervalle de confiance de Student sur la moyenne des réplicats.
+    """
+    X = np.asarray(X)
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(random_state)
+    scores = []
+    for _ in range(n_bootstrap):
+        idx, weights = stratified_indices(labels, sample_size, min_per_cluster, rng)
+        values = silhouette_samples(X[idx], labels[idx])
+        scores.append(float(np.average(values, weights=weights)))
+    scores = np.array(scores)
+    mean = float(scores.mean())
+    if len(scores) > 1:
+        half_width = float(stats.t.ppf(0.5 + confidence / 2, len(scores) - 1) * scores.std(ddof=1) / np.sqrt(len(scores)))
+    else:
+        half_width = float('nan')
+    return {'mean': mean, 'ci_low': mean - half_width, 'ci_high': mean + half_width,
+            'std': float(scores.std(ddof=1)) if len(scores) > 1 else float('nan'), 'n_bootstrap': len(scores)}
+
+
+def estimate_silhouette(X, labels, method: str = 'sampled', centers=None, sample_size: int = SAMPLE_SIZE,
+                        random_state: int = 42) -> Dict[str, float]:
+    """
+    Estimation du score silhouette selon `method`.
+    Returns:
+        {'mean': score, 'ci_low': ..., 'ci_high': ...} (bornes NaN quand la méthode n'en fournit pas).
+    """
+    if method == 'simplified':
+        if centers is None:
+            raise ValueError("La silhouette simplifiée nécessite les centres des clusters")
+        score = simplified_silhouette(X, labels, centers)
+    elif method == 'stratified':
+        return bootstrap_silhouette(X, labels, sample_size, random_state=random_state)
+    elif method == 'sampled':
+        score = float(silhouette_score(X, labels, sample_size=sample_size, random_state=random_state))
+    else:
+        raise ValueError(f"Méthode de silhouette inconnue : {method}")
+    return {'mean': score, 'ci_low': float('nan'), 'ci_high': float('nan')}
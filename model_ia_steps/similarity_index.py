@@ -0,0 +1,317 @@
+"""
+similarity_index.py
+Index de plus proches voisins sur l'espace PCA (features_pca.csv) pour les requêtes « clients similaires ».
+
+Index à listes inversées (IVF) : un KMeans grossier (n_lists centres, ajusté sur un échantillon)
+partitionne les utilisateurs, et les vecteurs sont rangés sur disque liste par liste. Une requête
+calcule sa distance aux centres, puis compare exactement ses coordonnées aux seuls utilisateurs des
+`nprobe` listes les plus proches (recherche approchée). Avec nprobe=None, la recherche est exacte : les
+listes sont parcourues par borne inférieure croissante (distance au centre moins rayon de la liste)
+jusqu'à ce qu'aucune liste restante ne puisse contenir un voisin plus proche que le k-ième trouvé.
+
+L'index est un dossier de fichiers .npy (vecteurs float32, user_id, bornes des listes, centres) plus
+un fichier meta.json ; au chargement, les tableaux sont ouverts en memmap : seules les listes sondées
+sont lues, et plusieurs processus partagent les mêmes pages.
+
+Usage :
+    python model_ia_steps/similarity_index.py build
+    python model_ia_steps/similarity_index.py query --user-id 512345678 --k 10
+
+    from similarity_index import SimilarityIndex
+    index = SimilarityIndex.load()
+    ids, distances = index.search_by_user_id([512345678, 512345679], k=10)
+"""
+import os
+import json
+import argparse
+import datetime
+import numpy as np
+import pandas as pd
+from typing import Optional, Tuple
+from sklearn.cluster import MiniBatchKMeans
+
+INPUT_CSV = os.path.join('model_ia_steps', 'features_pca.csv')
+INDEX_DIR = os.path.join('model_ia_steps', 'similarity_index')
+
+# Version du format de l'index (à incrémenter à chaque changement incompatible)
+INDEX_VERSION = 1
+
+# Nombre de listes par défaut : N_LISTS_FACTOR * racine du nombre d'utilisateurs, borné
+N_LISTS_FACTOR = 1
+MAX_LISTS = 16384
+
+# Utilisateurs tirés pour ajuster le quantificateur grossier
+TRAIN_SAMPLE_SIZE = 200000
+
+# Listes sondées par requête (compromis rappel / latence)
+NPROBE = 8
+
+# Requêtes traitées ensemble, et taille maximale (en cases) de la matrice de distances aux centres
+# lors de la construction
+QUERY_BLOCK_SIZE = 1024
+ASSIGN_BLOCK_CELLS = 2 ** 24
+
+
+def default_n_lists(n_users: int) -> int:
+    return int(min(MAX_LISTS, max(1, N_LISTS_FACTOR * np.sqrt(n_users))))
+
+
+def _squared_distances(queries, vectors, vector_norms=None) -> np.ndarray:
+    """Distances euclidiennes au carré (requêtes x vecteurs), via ||q||² - 2 q·v + ||v||²."""
+    if vector_norms is None:
+        vector_norms = (vectors ** 2).sum(axis=1)
+    distances = (queries ** 2).sum(axis=1)[:, None] - 2 * queries @ vectors.T + vector_norms
+    return np.maximum(distances, 0, out=distances)
+
+
+def _nearest_centroids(X, centroids, block_cells: int = ASSIGN_BLOCK_CELLS) -> np.ndarray:
+    norms = (centroids ** 2).sum(axis=1)
+    block_size = max(1, block_cells // len(centroids))
+    lists = np.empty(len(X), dtype=np.int64)
+    for start in range(0, len(X), block_size):
+        lists[start:start + block_size] = _squared_distances(X[start:start + block_size], centroids, norms).argmin(axis=1)
+    return lists
+
+
+def build_index(vectors, user_ids, index_dir: str = INDEX_DIR, n_lists: Optional[int] = None,
+                columns=None, random_state: int = 42) -> dict:
+    """Construit l'index à partir d'une matrice de coordonnées (une ligne par utilisateur) et l'écrit dans index_dir."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    user_ids = np.asarray(user_ids)
+    # user_id entiers relus en flottants (500000003.0 dans les CSV des étapes) : stockés en int64, comparaisons exactes
+    if user_ids.dtype.kind == 'f' and np.isfinite(user_ids).all() and np.array_equal(user_ids, np.round(user_ids)):
+        user_ids = user_ids.astype(np.int64)
+    n, d = vectors.shape
+    n_lists = min(n_lists or default_n_lists(n), n)
+
+    rng = np.random.default_rng(random_state)
+    train = vectors[rng.choice(n, size=min(n, TRAIN_SAMPLE_SIZE), replace=False)]
+    quantizer = MiniBatchKMeans(n_clusters=n_lists, random_state=random_state, batch_size=4096, n_init=1)
+    centroids = quantizer.fit(train).cluster_centers_.astype(np.float32)
+    lists = _nearest_centroids(vectors, centroids)
+    order = np.argsort(lists, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=n_lists))])
+    # Rayon de chaque liste (distance maximale d'un membre à son centre), pour la recherche exacte
+    radii = np.zeros(n_lists, dtype=np.float32)
+    spread = np.sqrt(((vectors - centroids[lists]) ** 2).sum(axis=1))
+    np.maximum.at(radii, lists, spread)
+
+    os.makedirs(index_dir, exist_ok=True)
+    sorted_ids = user_ids[order]
+    np.save(os.path.join(index_dir, 'vectors.npy'), vectors[order])
+    np.save(os.path.join(index_dir, 'user_ids.npy'), sorted_ids)
+    # user_id triés et permutation associée : recherche dichotomique d'un utilisateur dans l'index
+    id_order = np.argsort(sorted_ids, kind='stable')
+    np.save(os.path.join(index_dir, 'id_order.npy'), id_order)
+    np.save(os.path.join(index_dir, 'sorted_ids.npy'), sorted_ids[id_order])
+    np.save(os.path.join(index_dir, 'offsets.npy'), offsets)
+    np.save(os.path.join(index_dir, 'centroids.npy'), centroids)
+    np.save(os.path.join(index_dir, 'radii.npy'), radii)
+    meta = {
+        'version': INDEX_VERSION,
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'n_users': int(n),
+        'dim': int(d),
+        'n_lists': int(n_lists),
+        'columns': list(columns) if columns is not None else [f'PC{i+1}' for i in range(d)],
+        'largest_list': int(np.diff(offsets).max()),
+    }
+    with open(os.path.join(index_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def build_index_from_csv(input_csv: str = INPUT_CSV, index_dir: str = INDEX_DIR,
+                         n_lists: Optional[int] = None) -> dict:
+    columns = [c for c in pd.read_csv(input_csv, nrows=0).columns if c != 'user_id']
+    df = pd.read_csv(input_csv, dtype={c: np.float32 for c in columns})
+    return build_index(df[columns].to_numpy(), df['user_id'].to_numpy(), index_dir, n_lists, columns)
+
+
+class SimilarityIndex:
+    """Index IVF ouvert en memmap (voir le docstring du module)."""
+
+    def __init__(self, index_dir: str = INDEX_DIR, mmap_mode: Optional[str] = 'r'):
+        with open(os.path.join(index_dir, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('version') != INDEX_VERSION:
+            raise ValueError(f"Version d'index {self.meta.get('version')} incompatible (attendue : {INDEX_VERSION})")
+
+        def load(name):
+            return np.load(os.path.join(index_dir, f'{name}.npy'), mmap_mode=mmap_mode)
+
+        self.vectors = load('vectors')
+        self.user_ids = load('user_ids')
+        self.id_order = load('id_order')
+        self.sorted_ids = load('sorted_ids')
+        self.offsets = np.asarray(load('offsets'))
+        self.centroids = np.asarray(load('centroids'))
+        self.radii = np.asarray(load('radii'))
+        self.n_lists = len(self.centroids)
+
+    @classmethod
+    def load(cls, index_dir: str = INDEX_DIR) -> 'SimilarityIndex':
+        return cls(index_dir)
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def rows_of(self, user_ids) -> np.ndarray:
+        """Ligne de l'index de chaque user_id (première occurrence) ; -1 si l'utilisateur est absent."""
+        user_ids = np.asarray(user_ids)
+        positions = np.minimum(np.searchsorted(self.sorted_ids, user_ids), len(self.sorted_ids) - 1)
+        found = self.sorted_ids[positions] == user_ids
+        return np.where(found, self.id_order[positions], -1)
+
+    def search(self, queries, k: int = 10, nprobe: Optional[int] = NPROBE,
+               block_size: int = QUERY_BLOCK_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        k plus proches voisins de chaque vecteur requête (coordonnées PCA) ; nprobe=None : recherche exacte.
+        Returns:
+            (user_id des voisins, distances euclidiennes), deux tableaux requêtes x k triés par distance
+            croissante ; les cases sans voisin valent -1 / inf.
+        """
+        rows, distances = self._search_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)), k, nprobe, block_size)
+        return self._ids(rows), distances
+
+    def search_by_user_id(self, user_ids, k: int = 10, nprobe: Optional[int] = NPROBE,
+                          block_size: int = QUERY_BLOCK_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+        """k utilisateurs les plus proches de chaque user_id (l'utilisateur lui-même est exclu)."""
+        user_ids = np.atleast_1d(np.asarray(user_ids))
+        rows = self.rows_of(user_ids)
+        if (rows < 0).any():
+            raise KeyError(f"user_id absents de l'index : {user_ids[rows < 0][:10].tolist()}")
+        queries = np.asarray(self.vectors[rows])
+        # Un utilisateur peut occuper plusieurs lignes : on demande assez de voisins pour les écarter
+        duplicates = int((np.searchsorted(self.sorted_ids, user_ids, side='right')
+                          - np.searchsorted(self.sorted_ids, user_ids, side='left')).max())
+        found_rows, distances = self._search_rows(queries, k + duplicates, nprobe, block_size)
+        found_ids = self._ids(found_rows)
+        keep = found_ids != user_ids[:, None]
+        # Les voisins conservés restent triés : tri stable sur le masque inversé
+        order = np.argsort(~keep, axis=1, kind='stable')[:, :k]
+        ids = np.take_along_axis(np.where(keep, found_ids, -1), order, axis=1)
+        return ids, np.take_along_axis(np.where(keep, distances, np.inf), order, axis=1)
+
+    def _ids(self, rows) -> np.ndarray:
+        ids = np.asarray(self.user_ids[np.maximum(rows, 0).ravel()]).reshape(rows.shape)
+        return np.where(rows >= 0, ids, -1)
+
+    def _search_rows(self, queries, k, nprobe, block_size):
+        rows = np.full((len(queries), k), -1, dtype=np.int64)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        for start in range(0, len(queries), block_size):
+            block = queries[start:start + block_size]
+            block_rows, block_distances = self._search_block(block, k, nprobe)
+            rows[start:start + len(block)] = block_rows
+            distances[start:start + len(block)] = block_distances
+        return rows, np.sqrt(distances)
+
+    def _search_block(self, queries, k, nprobe):
+        """
+        Recherche d'un bloc de requêtes, par tours de `nprobe` listes (un seul tour en recherche approchée ;
+        en recherche exacte, tours de NPROBE listes jusqu'à ce que la borne de la liste suivante dépasse
+        le k-ième voisin de chaque requête).
+        """
+        n_queries = len(queries)
+        centroid_distances = np.sqrt(_squared_distances(queries, self.centroids))
+        exact = nprobe is None
+        if exact:
+            nprobe = min(NPROBE, self.n_lists)
+            bounds = np.maximum(centroid_distances - self.radii, 0)
+            order = np.argsort(bounds, axis=1)
+        elif nprobe < self.n_lists:
+            order = np.argpartition(centroid_distances, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            order = np.broadcast_to(np.arange(self.n_lists), (n_queries, self.n_lists))
+        best_rows = np.full((n_queries, k), -1, dtype=np.int64)
+        best_distances = np.full((n_queries, k), np.inf, dtype=np.float32)
+        active = np.arange(n_queries)
+        for start in range(0, order.shape[1], nprobe):
+            self._scan_lists(queries, active, order[active, start:start + nprobe], best_rows, best_distances)
+            following = start + nprobe
+            if not exact or following >= self.n_lists:
+                break
+            # Marge relative : les distances des candidats sont calculées en float32
+            next_bound = bounds[active, order[active, following]]
+            active = active[next_bound ** 2 <= best_distances[active, -1] * (1 + 1e-4)]
+            if len(active) == 0:
+                break
+
+        # Distances finales recalculées directement sur les k voisins retenus
+        found = best_rows >= 0
+        neighbours = np.asarray(self.vectors[np.maximum(best_rows, 0).ravel()]).reshape(n_queries, k, -1)
+        exact_distances = ((neighbours - queries[:, None, :]) ** 2).sum(axis=2)
+        best_distances = np.where(found, exact_distances, np.inf).astype(np.float32)
+        keep = np.argsort(best_distances, axis=1, kind='stable')
+        return np.take_along_axis(best_rows, keep, axis=1), np.take_along_axis(best_distances, keep, axis=1)
+
+    def _scan_lists(self, queries, active, probes, best_rows, best_distances):
+        """
+        Parcourt les listes sondées une à une : chaque liste est comparée en un seul produit matriciel à
+        toutes les requêtes actives qui la sondent, et ses k meilleurs candidats sont fusionnés avec ceux
+        déjà trouvés (best_rows / best_distances sont mis à jour en place).
+        """
+        k = best_rows.shape[1]
+        query_of_probe = np.repeat(active, probes.shape[1])
+        probe_lists = probes.ravel()
+        order = np.argsort(probe_lists, kind='stable')
+        list_ids, starts = np.unique(probe_lists[order], return_index=True)
+        for list_id, group in zip(list_ids, np.split(query_of_probe[order], starts[1:])):
+            begin, end = self.offsets[list_id], self.offsets[list_id + 1]
+            if begin == end:
+                continue
+            # Distances calculées sur les résidus (écarts au centre de la liste) : normes faibles, donc peu
+            # d'erreur d'arrondi en float32 dans le développement du carré
+            centroid = self.centroids[list_id]
+            distances = _squared_distances(queries[group] - centroid, np.asarray(self.vectors[begin:end]) - centroid)
+            if end - begin > k:
+                top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+                distances = np.take_along_axis(distances, top, axis=1)
+                candidates = top + begin
+            else:
+                candidates = np.broadcast_to(np.arange(begin, end), distances.shape)
+            merged_distances = np.concatenate([best_distances[group], distances], axis=1)
+            merged_rows = np.concatenate([best_rows[group], candidates], axis=1)
+            keep = np.argsort(merged_distances, axis=1, kind='stable')[:, :k]
+            best_distances[group] = np.take_along_axis(merged_distances, keep, axis=1)
+            best_rows[group] = np.take_along_axis(merged_rows, keep, axis=1)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Index de similarité entre utilisateurs (espace PCA).")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help=f"Construit l'index à partir de {INPUT_CSV}")
+    build.add_argument('--input', default=INPUT_CSV, help="CSV des coordonnées PCA (user_id, PC1, ...)")
+    build.add_argument('--index-dir', default=INDEX_DIR, help=f"Dossier de l'index (défaut : {INDEX_DIR})")
+    build.add_argument('--n-lists', type=int, default=None,
+                       help=f"Nombre de listes (défaut : {N_LISTS_FACTOR} x racine du nombre d'utilisateurs)")
+    query = subparsers.add_parser('query', help="Clients les plus proches d'un ou plusieurs user_id")
+    query.add_argument('--user-id', type=int, nargs='+', required=True, help="user_id à interroger")
+    query.add_argument('--index-dir', default=INDEX_DIR, help=f"Dossier de l'index (défaut : {INDEX_DIR})")
+    query.add_argument('--k', type=int, default=10, help="Nombre de voisins")
+    query.add_argument('--nprobe', type=int, default=NPROBE, help="Listes sondées (recherche approchée)")
+    query.add_argument('--exact', action='store_true', help="Recherche exacte (ignore --nprobe)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == 'build':
+        start = datetime.datetime.now()
+        meta = build_index_from_csv(args.input, args.index_dir, args.n_lists)
+        elapsed = (datetime.datetime.now() - start).total_seconds()
+        print(f"Index de {meta['n_users']} utilisateurs ({meta['n_lists']} listes, dimension {meta['dim']}) "
+              f"construit en {elapsed:.1f} s dans {args.index_dir}")
+        return
+    index = SimilarityIndex.load(args.index_dir)
+    user_ids = np.asarray(args.user_id, dtype=index.user_ids.dtype)
+    ids, distances = index.search_by_user_id(user_ids, args.k, None if args.exact else args.nprobe)
+    for user_id, neighbours, dists in zip(user_ids, ids, distances):
+        print(f"Utilisateurs proches de {user_id} :")
+        for neighbour, dist in zip(neighbours, dists):
+            if neighbour >= 0:
+                print(f"   {neighbour} (distance {dist:.4f})")
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,202 @@
 import pandas as pd
+import numpy as np
 import os
+import io
+import json
+import time
+import hashlib
+import argparse
+from streaming import CHUNK_SIZE, RunningMoments, iter_csv_chunks, numeric_feature_columns
 
 INPUT_CSV = os.path.join('output', 'features_all_users.csv')
 REPORT_PATH = os.path.join('model_ia_steps', 'exploration_report.txt')
 
+# Version du format du profil en cache (à incrémenter si son contenu change)
+PROFILE_VERSION = 1
+
+# Quantiles du profil, estimés sur un échantillon uniforme de taille fixe (mémoire bornée)
+QUANTILES = [0.25, 0.5, 0.75]
+QUANTILE_SAMPLE_SIZE = 200000
+SEED = 42
+
+# Lignes affichées dans l'aperçu
+HEAD_ROWS = 5
+
+# Taille des blocs lus pour calculer l'empreinte du fichier
+HASH_BLOCK_SIZE = 8 * 2**20
+
+
+def profile_cache_path(path):
+    """Le profil est mis en cache à côté du fichier de features (features_all_users.profile.json)."""
+    return os.path.splitext(path)[0] + '.profile.json'
+
+
+class _HashingReader(io.RawIOBase):
+    """Fichier binaire dont les octets lus alimentent une empreinte : le profil et le hash en une seule lecture."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.digest = hashlib.blake2b(digest_size=32)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self.raw.readinto(buffer)
+        if n:
+            self.digest.update(memoryview(buffer)[:n])
+        return n
+
+    def hexdigest(self):
+        # Octets restants après la dernière ligne lue par pandas (normalement aucun)
+        for block in iter(lambda: self.raw.read(HASH_BLOCK_SIZE), b''):
+            self.digest.update(block)
+        return self.digest.hexdigest()
+
+
+def file_hash(path):
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def compute_profile(path, chunk_size=CHUNK_SIZE, sample_size=QUANTILE_SAMPLE_SIZE, seed=SEED):
+    """
+    Profil du fichier en une passe par chunks : nombre de lignes, valeurs manquantes, et pour chaque variable
+    numérique (hors user_id) effectif, moyenne, écart-type, min, max, quantiles approchés et valeurs négatives.
+    Les quantiles sont calculés sur un échantillon uniforme de `sample_size` lignes (priorités aléatoires,
+    on garde les plus petites), exacts tant que la population ne dépasse pas l'échantillon.
+    """
+    rng = np.random.default_rng(seed)
+    n_rows, head, columns, num_cols = 0, None, None, None
+    moments, missing, negatives = None, None, None
+    sample, priorities = None, None
+    with open(path, 'rb') as raw:
+        reader = _HashingReader(raw)
+        stream = io.BufferedReader(reader, HASH_BLOCK_SIZE)
+        for chunk in iter_csv_chunks(stream, chunk_size):
+            if moments is None:
+                head = chunk.head(HEAD_ROWS)
+                columns = list(chunk.columns)
+                num_cols = numeric_feature_columns(chunk)
+                moments = RunningMoments(num_cols)
+                missing = np.zeros(len(columns), dtype=np.int64)
+                negatives = np.zeros(len(num_cols), dtype=np.int64)
+                sample = np.empty((0, len(num_cols)))
+                priorities = np.empty(0)
+            values = chunk[num_cols].to_numpy(dtype=np.float64)
+            n_rows += len(chunk)
+            moments.update(values)
+            missing += chunk.isnull().sum().to_numpy()
+            negatives += (values < 0).sum(axis=0)
+
+            sample = np.vstack([sample, values])
+            priorities = np.concatenate([priorities, rng.random(len(values))])
+            if len(priorities) > sample_size:
+                keep = np.argpartition(priorities, sample_size)[:sample_size]
+                sample, priorities = sample[keep], priorities[keep]
+        digest = reader.hexdigest()
+
+    if moments is None:
+        raise ValueError(f"{path} ne contient aucune ligne")
+    with np.errstate(all='ignore'):
+        quantiles = np.nanquantile(sample, QUANTILES, axis=0)
+    mean, std = moments.mean_series(), moments.std()
+    stats = {}
+    for i, col in enumerate(num_cols):
+        stats[col] = {
+            'count': int(moments.count[i]),
+            'mean': float(mean.iloc[i]),
+            'std': float(std[i]),
+            'min': float(moments.min[i]) if moments.count[i] else float('nan'),
+        }
+        stats[col].update({f"{q:.0%}": float(quantiles[j, i]) for j, q in enumerate(QUANTILES)})
+        stats[col]['max'] = float(moments.max[i]) if moments.count[i] else float('nan')
+        stats[col]['negatives'] = int(negatives[i])
+
+    stat = os.stat(path)
+    return {
+        'version': PROFILE_VERSION,
+        'file_hash': digest,
+        'file_size': stat.st_size,
+        'file_mtime_ns': stat.st_mtime_ns,
+        'n_rows': n_rows,
+        'columns': columns,
+        'head': head.to_string(),
+        'missing': {col: int(n) for col, n in zip(columns, missing)},
+        'stats': stats,
+        'quantile_sample_size': int(min(sample_size, n_rows)),
+    }
+
+
+def load_cached_profile(path, cache_path):
+    """
+    Profil en cache s'il correspond au contenu actuel du fichier : même taille et même date de modification
+    (immédiat), sinon même empreinte (une lecture du fichier, sans analyse CSV). None sinon.
+    """
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if profile.get('version') != PROFILE_VERSION:
+        return None
+    stat = os.stat(path)
+    if stat.st_size != profile.get('file_size'):
+        return None
+    if stat.st_mtime_ns == profile.get('file_mtime_ns'):
+        return profile
+    if file_hash(path) != profile.get('file_hash'):
+        return None
+    # Fichier réécrit à l'identique : on met à jour la date pour que le prochain contrôle soit immédiat
+    profile['file_mtime_ns'] = stat.st_mtime_ns
+    save_profile(profile, cache_path)
+    return profile
+
+
+def save_profile(profile, cache_path):
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump(profile, f, indent=2)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Étape 1 : profil des features (une passe par chunks, mis en cache).")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Lignes par chunk")
+    parser.add_argument('--refresh', action='store_true', help="Recalcule le profil même s'il est en cache")
+    return parser.parse_args()
+
 
 def main():
+    args = parse_args()
+    cache_path = profile_cache_path(INPUT_CSV)
+    start = time.perf_counter()
+    profile = None if args.refresh else load_cached_profile(INPUT_CSV, cache_path)
+    if profile is not None:
+        print(f"Profil repris du cache {cache_path} ({time.perf_counter() - start:.2f} s)")
+    else:
+        profile = compute_profile(INPUT_CSV, args.chunk_size)
+        save_profile(profile, cache_path)
+        print(f"Profil calculé en {time.perf_counter() - start:.1f} s et mis en cache dans {cache_path}")
+
     # Chargement des données
-    df = pd.read_csv(INPUT_CSV)
-    print(f"Données chargées : {df.shape[0]} lignes, {df.shape[1]} colonnes")
-    print(df.head())
+    print(f"Données : {profile['n_rows']} lignes, {len(profile['columns'])} colonnes")
+    print(profile['head'])
 
-    # Statistiques descriptives
-    desc = df.describe(include='all')
+    # Statistiques descriptives (quantiles approchés au-delà de quantile_sample_size lignes)
+    desc = pd.DataFrame(profile['stats']).drop(index='negatives')
     print(desc)
 
     # Valeurs manquantes
-    missing = df.isnull().sum()
+    missing = pd.Series(profile['missing'])
     print("Valeurs manquantes par colonne :")
     print(missing)
 
     # Valeurs aberrantes (exemple : valeurs négatives sur des colonnes qui ne devraient pas l'être)
-    outliers = {}
-    for col in df.select_dtypes(include=['number']).columns:
-        if (df[col] < 0).any():
-            outliers[col] = (df[col] < 0).sum()
+    outliers = {col: s['negatives'] for col, s in profile['stats'].items() if s['negatives'] > 0}
     if outliers:
         print("Colonnes avec valeurs négatives :", outliers)
     else:
@@ -32,10 +204,10 @@ def main():
 
     # Sauvegarde d'un rapport d'exploration
     with open(REPORT_PATH, 'w', encoding='utf-8') as f:
-        f.write(f"Dimensions : {df.shape}\n\n")
+        f.write(f"Dimensions : ({profile['n_rows']}, {len(profile['columns'])})\n\n")
         f.write("Aperçu :\n")
-        f.write(str(df.head()))
-        f.write("\n\nStatistiques descriptives :\n")
+        f.write(profile['head'])
+        f.write(f"\n\nStatistiques descriptives (quantiles sur un échantillon de {profile['quantile_sample_size']} lignes) :\n")
         f.write(str(desc))
         f.write("\n\nValeurs manquantes :\n")
         f.write(str(missing))
@@ -44,4 +216,4 @@ def main():
     print(f"Rapport d'exploration sauvegardé dans {REPORT_PATH}")
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
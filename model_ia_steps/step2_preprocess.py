@@ -1,34 +1,168 @@
 import pandas as pd
 import os
+import json
+import argparse
 from sklearn.preprocessing import StandardScaler
+from streaming import CHUNK_SIZE, DTYPES, feature_dtypes, iter_csv_chunks, numeric_feature_columns
+from robust_stats import ROBUST_STATS_PATH, ColumnSketches, load_robust_stats
+from anomaly import FLAGS_CSV, load_anomaly_mask, with_anomaly_flags
 
 INPUT_CSV = os.path.join('output', 'features_all_users.csv')
 OUTPUT_CSV = os.path.join('model_ia_steps', 'features_normalized.csv')
+PARAMS_PATH = os.path.join('model_ia_steps', 'preprocess_params.json')
 
+# Troncature des valeurs extrêmes aux percentiles CLIP_PERCENTILES de chaque variable (sketches de robust_stats.py)
+CLIP_PERCENTILES = (0.1, 99.9)
 
-def main():
+
+def etl_clip_bounds(num_cols):
+    """
+    Bornes de troncature issues des sketches remplis par l'ETL pendant l'écriture des features,
+    s'ils décrivent le fichier d'entrée actuel (sinon None : les sketches sont remplis ici).
+    """
+    features = load_robust_stats(ROBUST_STATS_PATH).get('features')
+    if features is None or not features.matches(INPUT_CSV) or not set(num_cols) <= set(features.columns):
+        return None
+    print(f"Bornes de troncature issues des sketches de l'ETL ({ROBUST_STATS_PATH})")
+    return features.clip_bounds(CLIP_PERCENTILES, num_cols)
+
+
+def fit_chunks(chunk_size, dtypes, exclude_anomalies=False):
+    """Chunks servant à l'ajustement (bornes, scaler), sans les lignes signalées par anomaly.py si demandé."""
+    chunks = iter_csv_chunks(INPUT_CSV, chunk_size, dtype=dtypes)
+    if not exclude_anomalies:
+        yield from chunks
+        return
+    for chunk, flagged in with_anomaly_flags(chunks, FLAGS_CSV, chunk_size):
+        yield chunk[~flagged]
+
+
+def save_params(num_cols, lower, upper, scaler, mode, clip_source, n_excluded=0):
+    """Sauvegarde les bornes de troncature et les paramètres du StandardScaler."""
+    params = {
+        'mode': mode,
+        'columns': list(num_cols),
+        'clip_percentiles': list(CLIP_PERCENTILES),
+        'clip_source': clip_source,
+        'clip_lower': [float(v) for v in lower],
+        'clip_upper': [float(v) for v in upper],
+        'scaler_mean': [float(v) for v in scaler.mean_],
+        'scaler_scale': [float(v) for v in scaler.scale_],
+        'n_samples': int(pd.Series(scaler.n_samples_seen_).max()),
+        'excluded_anomalies': int(n_excluded),
+    }
+    with open(PARAMS_PATH, 'w', encoding='utf-8') as f:
+        json.dump(params, f, indent=2)
+    print(f"Paramètres de prétraitement sauvegardés dans {PARAMS_PATH}")
+
+
+def preprocess_full(dtype='float64', exclude_anomalies=False):
+    """
+    Prétraitement en mémoire : tout le fichier est chargé (variables lues en `dtype`).
+    Avec exclude_anomalies, les bornes et le scaler sont ajustés sans les lignes signalées par anomaly.py,
+    mais toutes les lignes sont normalisées et écrites.
+    """
     # Chargement des données
-    df = pd.read_csv(INPUT_CSV)
+    df = pd.read_csv(INPUT_CSV, dtype=feature_dtypes(INPUT_CSV, dtype))
     print(f"Données chargées : {df.shape[0]} lignes, {df.shape[1]} colonnes")
 
     # Sélection des colonnes numériques à normaliser (hors user_id)
-    num_cols = [col for col in df.select_dtypes(include=['number']).columns if col != 'user_id']
+    num_cols = numeric_feature_columns(df)
     print(f"Colonnes numériques à normaliser : {num_cols}")
 
-    # Gestion des valeurs extrêmes (optionnel : ici on les tronque à +/- 5 écarts-types)
-    for col in num_cols:
-        mean = df[col].mean()
-        std = df[col].std()
-        df[col] = df[col].clip(lower=mean-5*std, upper=mean+5*std)
+    # Utilisateurs atypiques écartés de l'ajustement (les sketches de l'ETL les incluent : non utilisés)
+    keep = None
+    if exclude_anomalies:
+        keep = ~load_anomaly_mask(df['user_id'], FLAGS_CSV)
+        print(f"{len(df) - keep.sum()} utilisateurs atypiques exclus de l'ajustement ({FLAGS_CSV})")
+
+    # Gestion des valeurs extrêmes : troncature aux percentiles CLIP_PERCENTILES
+    bounds, clip_source = (None, 'data') if exclude_anomalies else (etl_clip_bounds(num_cols), 'etl')
+    if bounds is None:
+        sketches = ColumnSketches(num_cols).update(df if keep is None else df[keep])
+        bounds, clip_source = sketches.clip_bounds(CLIP_PERCENTILES), 'data'
+    lower, upper = bounds
+    df[num_cols] = df[num_cols].clip(lower=lower, upper=upper, axis=1)
 
-    # Standardisation
+    # Standardisation (en place : pas de copie complète du DataFrame)
     scaler = StandardScaler()
-    df_scaled = df.copy()
-    df_scaled[num_cols] = scaler.fit_transform(df[num_cols])
+    if keep is None:
+        df[num_cols] = scaler.fit_transform(df[num_cols])
+    else:
+        scaler.fit(df.loc[keep, num_cols])
+        df[num_cols] = scaler.transform(df[num_cols])
 
     # Sauvegarde
-    df_scaled.to_csv(OUTPUT_CSV, index=False)
+    df.to_csv(OUTPUT_CSV, index=False)
     print(f"Données normalisées sauvegardées dans {OUTPUT_CSV}")
+    save_params(num_cols, lower, upper, scaler, 'full', clip_source, 0 if keep is None else len(df) - keep.sum())
+
+
+def preprocess_streaming(chunk_size=CHUNK_SIZE, dtype='float64', exclude_anomalies=False):
+    """
+    Prétraitement par chunks, mémoire indépendante du nombre d'utilisateurs :
+    - passe 1 : sketches de quantiles de chaque colonne (bornes de troncature), sautée si les sketches
+      remplis par l'ETL décrivent le fichier d'entrée ;
+    - passe 2 : StandardScaler.partial_fit sur les valeurs tronquées, comme le fit du mode complet ;
+    - passe 3 : troncature et standardisation de chaque chunk, écrit directement dans le fichier de sortie.
+    Avec exclude_anomalies, les passes 1 et 2 ignorent les lignes signalées par anomaly.py (drapeaux lus
+    par chunks en parallèle des features) ; la passe 3 normalise toutes les lignes.
+    """
+    dtypes = feature_dtypes(INPUT_CSV, dtype)
+    num_cols = numeric_feature_columns(pd.read_csv(INPUT_CSV, nrows=1000, dtype=dtypes))
+    print(f"Colonnes numériques à normaliser : {num_cols}")
+
+    # Passe 1 : percentiles des données brutes
+    bounds, clip_source = (None, 'data') if exclude_anomalies else (etl_clip_bounds(num_cols), 'etl')
+    if bounds is None:
+        sketches, clip_source = ColumnSketches(num_cols), 'data'
+        for chunk in fit_chunks(chunk_size, dtypes, exclude_anomalies):
+            sketches.update(chunk[num_cols])
+        print(f"Données parcourues : {sketches.n_rows()} lignes")
+        bounds = sketches.clip_bounds(CLIP_PERCENTILES)
+    lower, upper = bounds
+
+    # Passe 2 : paramètres du scaler sur les valeurs tronquées
+    scaler, n_fit = StandardScaler(), 0
+    for chunk in fit_chunks(chunk_size, dtypes, exclude_anomalies):
+        scaler.partial_fit(chunk[num_cols].clip(lower=lower, upper=upper, axis=1))
+        n_fit += len(chunk)
+    if not hasattr(scaler, 'n_samples_seen_'):
+        print(f"Aucune donnée dans {INPUT_CSV}")
+        return
+
+    # Passe 3 : troncature, standardisation et écriture chunk par chunk
+    header, n_rows = True, 0
+    for chunk in iter_csv_chunks(INPUT_CSV, chunk_size, dtype=dtypes):
+        chunk[num_cols] = scaler.transform(chunk[num_cols].clip(lower=lower, upper=upper, axis=1))
+        chunk.to_csv(OUTPUT_CSV, mode='w' if header else 'a', header=header, index=False)
+        header = False
+        n_rows += len(chunk)
+    print(f"Données normalisées sauvegardées dans {OUTPUT_CSV}")
+    if exclude_anomalies:
+        print(f"{n_rows - n_fit} utilisateurs atypiques exclus de l'ajustement ({FLAGS_CSV})")
+    save_params(num_cols, lower, upper, scaler, 'streaming', clip_source, n_rows - n_fit)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Étape 2 : troncature des valeurs extrêmes et standardisation.")
+    parser.add_argument('--streaming', action='store_true',
+                        help="Traitement par chunks (mémoire indépendante du nombre d'utilisateurs)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Lignes par chunk en mode streaming")
+    parser.add_argument('--dtype', choices=DTYPES, default='float64',
+                        help="Type flottant des variables (float32 : mémoire et bande passante divisées par deux)")
+    parser.add_argument('--exclude-anomalies', action='store_true',
+                        help=f"Ajuste bornes et scaler sans les utilisateurs signalés dans {FLAGS_CSV} "
+                             "(anomaly.py score ; toutes les lignes restent normalisées)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.streaming:
+        preprocess_streaming(args.chunk_size, args.dtype, args.exclude_anomalies)
+    else:
+        preprocess_full(args.dtype, args.exclude_anomalies)
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
@@ -1,18 +1,86 @@
 import pandas as pd
+import numpy as np
 import os
-from sklearn.decomposition import PCA
-import matplotlib.pyplot as plt
+import argparse
+import joblib
+from sklearn.decomposition import PCA, IncrementalPCA
 from sklearn.impute import SimpleImputer
+from streaming import CHUNK_SIZE, DTYPES, RunningMoments, feature_dtypes, iter_csv_chunks
+from density_plot import DensityGrid
 
 
 INPUT_CSV = os.path.join('model_ia_steps', 'features_normalized.csv')
 OUTPUT_CSV = os.path.join('model_ia_steps', 'features_pca.csv')
 PLOT_PATH = os.path.join('model_ia_steps', 'pca_projection.png')
+PCA_MODEL_PATH = os.path.join('model_ia_steps', 'pca_model.joblib')
 
+# Part de variance expliquée à conserver
+VARIANCE_TARGET = 0.9
 
-def main():
+# Solveurs disponibles : 'full' (PCA exacte en mémoire), 'incremental' (IncrementalPCA par chunks lus
+# sur disque), 'randomized' (SVD randomisée, nombre de composantes choisi sur un échantillon)
+SOLVERS = ['full', 'incremental', 'randomized']
+
+# Taille de l'échantillon servant à estimer le spectre de variance (solveur randomized)
+SPECTRUM_SAMPLE_SIZE = 200000
+
+
+def n_components_for_variance(explained_variance_ratio, target=VARIANCE_TARGET):
+    """Nombre de composantes nécessaires pour expliquer `target` de la variance (même règle que PCA(n_components=0.9))."""
+    cumulative = np.cumsum(explained_variance_ratio)
+    return int(min(np.searchsorted(cumulative, target, side='right') + 1, len(cumulative)))
+
+
+def save_projection(columns, impute_means, mean, components, explained_variance_ratio, solver):
+    """
+    Sauvegarde la projection ajustée (imputation par la moyenne puis centrage et projection),
+    pour transformer de nouveaux utilisateurs sans réajuster la PCA.
+    """
+    projection = {
+        'solver': solver,
+        'columns': list(columns),
+        'impute_means': np.asarray(impute_means, dtype=np.float64),
+        'mean': np.asarray(mean, dtype=np.float64),
+        'components': np.asarray(components, dtype=np.float64),
+        'explained_variance_ratio': np.asarray(explained_variance_ratio, dtype=np.float64),
+    }
+    joblib.dump(projection, PCA_MODEL_PATH)
+    print(f"Projection PCA sauvegardée dans {PCA_MODEL_PATH}")
+
+
+def load_projection(path=PCA_MODEL_PATH):
+    return joblib.load(path)
+
+
+def apply_projection(X, projection, dtype=np.float64):
+    """
+    Projette des utilisateurs (tableau ou DataFrame aux colonnes projection['columns']) sur les composantes ;
+    le calcul et le résultat sont en `dtype`.
+    """
+    X = np.array(X, dtype=dtype)
+    missing = np.isnan(X)
+    if missing.any():
+        X[missing] = np.take(projection['impute_means'], np.nonzero(missing)[1])
+    X -= projection['mean'].astype(dtype)
+    return X @ projection['components'].T.astype(dtype)
+
+
+def pca_dataframe(X_pca, user_ids=None):
+    df_pca = pd.DataFrame(X_pca, columns=[f'PC{i+1}' for i in range(X_pca.shape[1])])
+    if user_ids is not None:
+        df_pca.insert(0, 'user_id', np.asarray(user_ids))
+    return df_pca
+
+
+def add_to_grid(grid, df_pca):
+    """Ajoute les utilisateurs projetés à la grille de densité (PC1, PC2)."""
+    return grid.add(df_pca['PC1'], df_pca['PC2'] if 'PC2' in df_pca.columns else np.zeros(len(df_pca)))
+
+
+def pca_full(dtype='float64'):
+    """PCA exacte sur toute la matrice chargée en mémoire (scikit-learn conserve le float32)."""
     # Chargement des données
-    df = pd.read_csv(INPUT_CSV)
+    df = pd.read_csv(INPUT_CSV, dtype=feature_dtypes(INPUT_CSV, dtype))
     print(f"Données chargées : {df.shape[0]} lignes, {df.shape[1]} colonnes")
 
     # On conserve l'identifiant utilisateur si présent
@@ -23,31 +91,145 @@ def main():
     imputer = SimpleImputer(strategy='mean')
     X = pd.DataFrame(imputer.fit_transform(X), columns=X.columns)
 
-    if user_ids is not None:
-        user_ids = df['user_id']
-
     # PCA : on garde assez de composantes pour expliquer 90% de la variance
-    pca = PCA(n_components=0.9, svd_solver='full')
+    pca = PCA(n_components=VARIANCE_TARGET, svd_solver='full')
     X_pca = pca.fit_transform(X)
     print(f"Nombre de composantes principales retenues : {X_pca.shape[1]}")
     print("Variance expliquée cumulée :", pca.explained_variance_ratio_.sum())
 
     # Sauvegarde des composantes principales
-    df_pca = pd.DataFrame(X_pca, columns=[f'PC{i+1}' for i in range(X_pca.shape[1])])
-    if user_ids is not None:
-        df_pca.insert(0, 'user_id', user_ids)
+    df_pca = pca_dataframe(X_pca, user_ids)
+    df_pca.to_csv(OUTPUT_CSV, index=False)
+    print(f"Composantes principales sauvegardées dans {OUTPUT_CSV}")
+    save_projection(X.columns, imputer.statistics_, pca.mean_, pca.components_,
+                    pca.explained_variance_ratio_, 'full')
+    return add_to_grid(DensityGrid(), df_pca)
+
+
+def pca_randomized(dtype='float64'):
+    """
+    SVD randomisée : le nombre de composantes est choisi sur le spectre de variance d'un échantillon
+    (matrice de covariance d x d), puis seules ces composantes sont calculées sur toute la matrice.
+    """
+    df = pd.read_csv(INPUT_CSV, dtype=feature_dtypes(INPUT_CSV, dtype))
+    print(f"Données chargées : {df.shape[0]} lignes, {df.shape[1]} colonnes")
+    user_ids = df.pop('user_id') if 'user_id' in df.columns else None
+    columns = list(df.columns)
+    X = df.to_numpy(dtype=dtype)
+    del df
+
+    # Imputation en place par la moyenne (sans DataFrame intermédiaire)
+    impute_means = np.nanmean(X, axis=0)
+    missing = np.isnan(X)
+    if missing.any():
+        X[missing] = np.take(impute_means, np.nonzero(missing)[1])
+
+    rng = np.random.default_rng(42)
+    sample = X[rng.choice(len(X), size=min(len(X), SPECTRUM_SAMPLE_SIZE), replace=False)]
+    eigenvalues = np.linalg.eigvalsh(np.cov(sample, rowvar=False))[::-1].clip(min=0)
+    n_components = n_components_for_variance(eigenvalues / eigenvalues.sum())
+    print(f"Composantes estimées sur un échantillon de {len(sample)} utilisateurs : {n_components}")
+
+    pca = PCA(n_components=n_components, svd_solver='randomized', random_state=42)
+    X_pca = pca.fit_transform(X)
+    print(f"Nombre de composantes principales retenues : {X_pca.shape[1]}")
+    print("Variance expliquée cumulée :", pca.explained_variance_ratio_.sum())
+
+    df_pca = pca_dataframe(X_pca, user_ids)
     df_pca.to_csv(OUTPUT_CSV, index=False)
     print(f"Composantes principales sauvegardées dans {OUTPUT_CSV}")
+    save_projection(columns, impute_means, pca.mean_, pca.components_, pca.explained_variance_ratio_, 'randomized')
+    return add_to_grid(DensityGrid(), df_pca)
+
 
-    # Graphique de projection sur les deux premières composantes
-    plt.figure(figsize=(8,6))
-    plt.scatter(df_pca['PC1'], df_pca['PC2'], alpha=0.3, s=10)
-    plt.xlabel('PC1')
-    plt.ylabel('PC2')
-    plt.title('Projection des utilisateurs sur les deux premières composantes principales')
-    plt.tight_layout()
-    plt.savefig(PLOT_PATH)
+def pca_incremental(chunk_size=CHUNK_SIZE, dtype='float64'):
+    """
+    IncrementalPCA sur des chunks lus sur disque (mémoire indépendante du nombre d'utilisateurs) :
+    - passe 1 : moyennes pour l'imputation ;
+    - passe 2 : partial_fit de toutes les composantes, puis sélection de la règle des 90 % ;
+    - passe 3 : projection et écriture chunk par chunk.
+    Les points projetés sont cumulés chunk par chunk dans la grille de densité du graphique.
+    """
+    dtypes = feature_dtypes(INPUT_CSV, dtype)
+    moments, columns, n_rows = None, None, 0
+    for chunk in iter_csv_chunks(INPUT_CSV, chunk_size, dtype=dtypes):
+        if columns is None:
+            columns = [c for c in chunk.columns if c != 'user_id']
+            moments = RunningMoments(columns)
+        moments.update(chunk[columns])
+        n_rows += len(chunk)
+    if columns is None:
+        print(f"Aucune donnée dans {INPUT_CSV}")
+        return None
+    print(f"Données parcourues : {n_rows} lignes, {len(columns)} variables")
+    impute_means = moments.mean
+    imputation = {'impute_means': impute_means, 'mean': np.zeros(len(columns)), 'components': np.eye(len(columns))}
+
+    # Passe 2 : chaque lot doit contenir au moins autant de lignes que de variables ;
+    # un dernier chunk trop petit est fusionné avec le précédent
+    ipca = IncrementalPCA(n_components=len(columns))
+    previous = None
+    for chunk in iter_csv_chunks(INPUT_CSV, chunk_size, dtype=dtypes):
+        X = apply_projection(chunk[columns], imputation, dtype)
+        if previous is not None:
+            if len(X) < len(columns):
+                X = np.vstack([previous, X])
+            else:
+                ipca.partial_fit(previous)
+        previous = X
+    ipca.partial_fit(previous)
+
+    n_components = n_components_for_variance(ipca.explained_variance_ratio_)
+    projection = {
+        'impute_means': impute_means,
+        'mean': ipca.mean_,
+        'components': ipca.components_[:n_components],
+    }
+    print(f"Nombre de composantes principales retenues : {n_components}")
+    print("Variance expliquée cumulée :", ipca.explained_variance_ratio_[:n_components].sum())
+
+    # Passe 3 : projection et écriture
+    grid = DensityGrid()
+    header = True
+    for chunk in iter_csv_chunks(INPUT_CSV, chunk_size, dtype=dtypes):
+        df_pca = pca_dataframe(apply_projection(chunk[columns], projection, dtype),
+                               chunk['user_id'] if 'user_id' in chunk.columns else None)
+        df_pca.to_csv(OUTPUT_CSV, mode='w' if header else 'a', header=header, index=False)
+        header = False
+        add_to_grid(grid, df_pca)
+    print(f"Composantes principales sauvegardées dans {OUTPUT_CSV}")
+    save_projection(columns, impute_means, ipca.mean_, ipca.components_[:n_components],
+                    ipca.explained_variance_ratio_[:n_components], 'incremental')
+    return grid
+
+
+def plot_projection(grid):
+    # Graphique de projection sur les deux premières composantes (densité des utilisateurs)
+    grid.save(PLOT_PATH, 'Projection des utilisateurs sur les deux premières composantes principales')
     print(f"Graphique de projection sauvegardé dans {PLOT_PATH}")
 
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Étape 3 : réduction de dimension par PCA (90 % de variance expliquée).")
+    parser.add_argument('--solver', choices=SOLVERS, default='full',
+                        help="full : PCA exacte en mémoire ; incremental : IncrementalPCA par chunks ; "
+                             "randomized : SVD randomisée")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Lignes par chunk (solveur incremental)")
+    parser.add_argument('--dtype', choices=DTYPES, default='float64',
+                        help="Type flottant de la matrice et de la projection (float32 : mémoire divisée par deux)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.solver == 'incremental':
+        grid = pca_incremental(args.chunk_size, args.dtype)
+    elif args.solver == 'randomized':
+        grid = pca_randomized(args.dtype)
+    else:
+        grid = pca_full(args.dtype)
+    if grid is not None:
+        plot_projection(grid)
+
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
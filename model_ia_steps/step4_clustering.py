@@ -1,28 +1,184 @@
 import pandas as pd
+import numpy as np
 import os
+import time
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 import matplotlib.pyplot as plt
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import adjusted_rand_score
+from threadpoolctl import threadpool_limits
+from streaming import CHUNK_SIZE, DTYPES, feature_dtypes, iter_csv_chunks
+from k_search import AdaptiveKSearch
+from silhouette import METHODS as SILHOUETTE_METHODS, estimate_silhouette
+from segment_model import export_bundle
+from coreset import CORESET_SIZE, StreamingCoreset, build_coreset_from_csv
+from density_plot import DensityGrid
+from anomaly import FLAGS_CSV, load_anomaly_mask
 
 INPUT_CSV = os.path.join('model_ia_steps', 'features_pca.csv')
 OUTPUT_CSV = os.path.join('model_ia_steps', 'features_clusters.csv')
 PLOT_PATH = os.path.join('model_ia_steps', 'clusters_projection.png')
+DIAGNOSTICS_PATH = os.path.join('model_ia_steps', 'clustering_diagnostics.png')
+COMPARISON_CSV = os.path.join('model_ia_steps', 'clustering_comparison.csv')
 
+K_RANGE = range(2, 11)
 
-def main():
-    # Chargement des données PCA
-    df = pd.read_csv(INPUT_CSV)
-    X = df.drop(columns=['user_id']) if 'user_id' in df.columns else df
+# Modes de clustering :
+# - exact : KMeans(n_init=10) sur toute la population (comportement d'origine) ;
+# - minibatch : MiniBatchKMeans sur toute la population ;
+# - sample : KMeans(n_init=10) sur un échantillon stratifié, puis affectation de tous les utilisateurs ;
+# - coreset : KMeans(n_init=10) pondéré sur un coreset construit en une passe (voir coreset.py) ; le choix de k
+#   et les diagnostics ne dépendent plus de la taille de la population.
+# Dans les modes minibatch, sample et coreset, les labels sont calculés par chunks (predict) et écrits au fil de l'eau.
+MODES = ['exact', 'minibatch', 'sample', 'coreset']
 
-    # Recherche du nombre optimal de clusters (méthode du coude + silhouette)
+# Taille des mini-lots de MiniBatchKMeans
+BATCH_SIZE = 4096
+
+# Taille de l'échantillon stratifié (mode sample) et nombre de strates (quantiles de PC1)
+SAMPLE_SIZE = 200000
+SAMPLE_STRATA = 10
+
+# Taille de l'échantillon du score silhouette
+SILHOUETTE_SAMPLE_SIZE = 10000
+
+# Matrice partagée par les workers du balayage parallèle (ouverte en memmap par chaque processus)
+_shared_X = None
+_shared_sample_idx = None
+_shared_silhouette_method = 'sampled'
+_thread_limits = None
+
+
+def stratified_sample(X, size=SAMPLE_SIZE, strata=SAMPLE_STRATA, random_state=42):
+    """
+    Indices d'un échantillon stratifié sur les quantiles de la première composante :
+    chaque strate est représentée en proportion de son effectif (au moins une ligne par strate non vide).
+    """
+    n = len(X)
+    if n <= size:
+        return np.arange(n)
+    rng = np.random.default_rng(random_state)
+    edges = np.quantile(X[:, 0], np.linspace(0, 1, strata + 1)[1:-1])
+    strata_ids = np.searchsorted(edges, X[:, 0], side='right')
+    indices = []
+    for stratum in np.unique(strata_ids):
+        members = np.flatnonzero(strata_ids == stratum)
+        n_take = max(1, int(round(size * len(members) / n)))
+        indices.append(rng.choice(members, size=min(n_take, len(members)), replace=False))
+    return np.sort(np.concatenate(indices))
+
+
+def make_kmeans(k, mode, init=None):
+    """init : centres initiaux (initialisation à chaud, un seul essai) ; None pour k-means++ avec plusieurs essais."""
+    if mode == 'minibatch':
+        if init is not None:
+            return MiniBatchKMeans(n_clusters=k, random_state=42, batch_size=BATCH_SIZE, init=init, n_init=1)
+        return MiniBatchKMeans(n_clusters=k, random_state=42, batch_size=BATCH_SIZE, n_init=3)
+    if init is not None:
+        return KMeans(n_clusters=k, random_state=42, init=init, n_init=1)
+    return KMeans(n_clusters=k, random_state=42, n_init=10)
+
+
+def fit_kmeans(X, k, mode, sample_idx=None, init=None, weights=None):
+    """
+    Ajuste le modèle pour k clusters selon le mode (en mode coreset, X est le coreset et `weights` ses poids).
+    Returns:
+        (modèle, labels de X, inertie sur toute la population)
+    """
+    kmeans = make_kmeans(k, mode, init)
+    if mode in ('exact', 'coreset'):
+        labels = kmeans.fit_predict(X, sample_weight=weights)
+        return kmeans, labels, kmeans.inertia_
+    kmeans.fit(X[sample_idx] if mode == 'sample' else X)
+    labels = kmeans.predict(X)
+    return kmeans, labels, -kmeans.score(X)
+
+
+def weighted_resample(weights, size=SILHOUETTE_SAMPLE_SIZE, random_state=42):
+    """Indices tirés proportionnellement aux poids : la silhouette d'un coreset porte sur la population représentée."""
+    rng = np.random.default_rng(random_state)
+    return rng.choice(len(weights), size=size, replace=True, p=weights / weights.sum())
+
+
+def score_silhouette(X, labels, kmeans, method='sampled', weights=None):
+    """Score silhouette selon la méthode choisie (voir silhouette.py) ; affiche l'intervalle de confiance s'il existe."""
+    if weights is not None:
+        idx = weighted_resample(weights)
+        X, labels = np.asarray(X)[idx], np.asarray(labels)[idx]
+    estimate = estimate_silhouette(X, labels, method, centers=kmeans.cluster_centers_,
+                                   sample_size=SILHOUETTE_SAMPLE_SIZE)
+    if not np.isnan(estimate['ci_low']):
+        print(f"k={kmeans.n_clusters} : silhouette {estimate['mean']:.4f} "
+              f"[IC {estimate['ci_low']:.4f} ; {estimate['ci_high']:.4f}]")
+    return estimate['mean']
+
+
+def sweep_k(X, mode, sample_idx=None, K_range=K_RANGE, silhouette_method='sampled', weights=None):
+    """Inertie et score silhouette pour chaque k (méthode du coude + silhouette)."""
     inertias = []
     silhouettes = []
-    K_range = range(2, 11)
     for k in K_range:
-        kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-        labels = kmeans.fit_predict(X)
-        inertias.append(kmeans.inertia_)
-        silhouettes.append(silhouette_score(X, labels, sample_size=10000, random_state=42))
+        kmeans, labels, inertia = fit_kmeans(X, k, mode, sample_idx, weights=weights)
+        inertias.append(inertia)
+        silhouettes.append(score_silhouette(X, labels, kmeans, silhouette_method, weights))
+    return inertias, silhouettes
+
+
+def adaptive_search_k(X, mode, sample_idx=None, K_range=K_RANGE, silhouette_method='sampled', weights=None):
+    """Recherche adaptative de k (centres initialisés à chaud, arrêt anticipé), voir k_search.py."""
+    X = np.asarray(X)
+    return AdaptiveKSearch(
+        fit_fn=lambda k, init: fit_kmeans(X, k, mode, sample_idx, init, weights),
+        score_fn=lambda kmeans, labels: score_silhouette(X, labels, kmeans, silhouette_method, weights),
+        K_range=K_range,
+    ).run(X, weights)
+
+
+def _init_sweep_worker(matrix_path, sample_idx, n_threads, silhouette_method='sampled'):
+    """
+    Initialise un worker du balayage parallèle : la matrice est ouverte en memmap (pages partagées entre
+    processus, pas de copie picklée) et les threads BLAS/OpenMP sont limités pour ne pas dépasser les cœurs.
+    """
+    global _shared_X, _shared_sample_idx, _shared_silhouette_method, _thread_limits
+    _shared_X = np.load(matrix_path, mmap_mode='r')
+    _shared_sample_idx = sample_idx
+    _shared_silhouette_method = silhouette_method
+    _thread_limits = threadpool_limits(limits=n_threads)
+
+
+def _sweep_worker(k, mode):
+    kmeans, labels, inertia = fit_kmeans(_shared_X, k, mode, _shared_sample_idx)
+    return k, inertia, score_silhouette(_shared_X, labels, kmeans, _shared_silhouette_method)
+
+
+def parallel_sweep_k(X, mode, jobs, sample_idx=None, K_range=K_RANGE, dtype=np.float64, silhouette_method='sampled'):
+    """
+    Balayage de k réparti sur un pool de processus. X est écrit une fois dans un fichier .npy
+    que chaque worker ouvre en memmap ; chaque worker dispose de cpu_count // jobs threads BLAS/OpenMP.
+    Les k les plus coûteux sont soumis en premier pour équilibrer la charge.
+    En float64, les courbes et best_k sont identiques au balayage séquentiel ; float32 divise par deux
+    la matrice partagée mais KMeans peut alors converger vers des solutions légèrement différentes.
+    """
+    n_threads = max(1, (os.cpu_count() or 1) // jobs)
+    print(f"Balayage parallèle de k : {jobs} processus, {n_threads} thread(s) chacun")
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='kmeans_sweep_') as tmp_dir:
+        matrix_path = os.path.join(tmp_dir, 'X.npy')
+        np.save(matrix_path, np.ascontiguousarray(X, dtype=dtype))
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_sweep_worker,
+                                 initargs=(matrix_path, sample_idx, n_threads, silhouette_method)) as executor:
+            futures = [executor.submit(_sweep_worker, k, mode) for k in sorted(K_range, reverse=True)]
+            for future in futures:
+                k, inertia, silhouette = future.result()
+                results[k] = (inertia, silhouette)
+    inertias = [results[k][0] for k in K_range]
+    silhouettes = [results[k][1] for k in K_range]
+    return inertias, silhouettes
+
+
+def plot_diagnostics(K_range, inertias, silhouettes):
     # Affichage des courbes
     plt.figure(figsize=(10,4))
     plt.subplot(1,2,1)
@@ -36,31 +192,205 @@ def main():
     plt.ylabel('Score silhouette')
     plt.title('Score silhouette')
     plt.tight_layout()
-    plt.savefig(os.path.join('model_ia_steps', 'clustering_diagnostics.png'))
+    plt.savefig(DIAGNOSTICS_PATH)
     print("Courbes du coude et silhouette sauvegardées.")
 
+
+def assign_in_chunks(kmeans, feature_columns, chunk_size=CHUNK_SIZE, dtype=np.float64):
+    """
+    Affecte tous les utilisateurs par chunks (predict) et écrit les labels au fil de l'eau.
+    Returns:
+        (grille de densité des clusters pour le graphique, effectif de chaque cluster, inertie de la population)
+    """
+    grid = DensityGrid(kmeans.n_clusters)
+    sizes = np.zeros(kmeans.n_clusters, dtype=np.int64)
+    inertia = 0.0
+    header = True
+    for chunk in iter_csv_chunks(INPUT_CSV, chunk_size, dtype=feature_dtypes(INPUT_CSV, np.dtype(dtype).name)):
+        X = chunk[feature_columns].to_numpy(dtype=dtype)
+        chunk['cluster'] = kmeans.predict(X)
+        inertia -= kmeans.score(X)
+        chunk.to_csv(OUTPUT_CSV, mode='w' if header else 'a', header=header, index=False)
+        header = False
+        sizes += np.bincount(chunk['cluster'], minlength=kmeans.n_clusters)
+        grid.add(chunk['PC1'], chunk['PC2'], chunk['cluster'])
+    return grid, sizes, inertia
+
+
+def fit_mask(user_ids=None):
+    """Lignes gardées pour l'ajustement : toutes sauf les utilisateurs signalés par anomaly.py."""
+    if user_ids is None:
+        user_ids = pd.read_csv(INPUT_CSV, usecols=['user_id'])['user_id']
+    flagged = load_anomaly_mask(user_ids, FLAGS_CSV)
+    print(f"{flagged.sum()} utilisateurs atypiques exclus de l'ajustement ({FLAGS_CSV}), "
+          "affectés ensuite au centre le plus proche")
+    return ~flagged
+
+
+def plot_clusters(grid):
+    # Visualisation des clusters sur PC1/PC2 (densité, couleur du cluster majoritaire de chaque case)
+    grid.save(PLOT_PATH, 'Répartition des clusters sur les deux premières composantes')
+    print(f"Graphique des clusters sauvegardé dans {PLOT_PATH}")
+
+
+def compare_modes(X, sample_size=SAMPLE_SIZE, K_range=K_RANGE, silhouette_method='sampled',
+                  coreset_size=CORESET_SIZE):
+    """
+    Compare qualité et temps des modes pour chaque k : durée d'ajustement, inertie et silhouette
+    sur la même population, accord des labels avec le mode exact (indice de Rand ajusté).
+    La durée du mode coreset inclut la construction du coreset.
+    """
+    sample_idx = stratified_sample(X, sample_size)
+    start = time.perf_counter()
+    builder = StreamingCoreset(coreset_size)
+    for chunk_start in range(0, len(X), CHUNK_SIZE):
+        builder.add(X[chunk_start:chunk_start + CHUNK_SIZE])
+    coreset, coreset_weights = builder.result()
+    coreset_seconds = time.perf_counter() - start
+    rows = []
+    for k in K_range:
+        exact_labels = None
+        for mode in MODES:
+            start = time.perf_counter()
+            if mode == 'coreset':
+                kmeans, _, _ = fit_kmeans(coreset, k, mode, weights=coreset_weights)
+                labels, inertia = kmeans.predict(X), -kmeans.score(X)
+            else:
+                kmeans, labels, inertia = fit_kmeans(X, k, mode, sample_idx)
+            fit_seconds = time.perf_counter() - start + (coreset_seconds if mode == 'coreset' else 0)
+            if mode == 'exact':
+                exact_labels = labels
+            rows.append({
+                'mode': mode,
+                'k': k,
+                'fit_seconds': round(fit_seconds, 3),
+                'inertia': inertia,
+                'silhouette': score_silhouette(X, labels, kmeans, silhouette_method),
+                'ari_vs_exact': adjusted_rand_score(exact_labels, labels),
+            })
+    comparison = pd.DataFrame(rows)
+    comparison.to_csv(COMPARISON_CSV, index=False)
+    print(comparison.to_string(index=False))
+    print(f"Comparaison des modes sauvegardée dans {COMPARISON_CSV}")
+    return comparison
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Étape 4 : segmentation KMeans (choix de k par silhouette).")
+    parser.add_argument('--mode', choices=MODES, default='exact',
+                        help="exact : KMeans sur toute la population ; minibatch : MiniBatchKMeans ; "
+                             "sample : KMeans sur un échantillon stratifié ; coreset : KMeans pondéré sur un coreset "
+                             "construit en une passe (minibatch, sample et coreset : affectation par chunks)")
+    parser.add_argument('--sample-size', type=int, default=SAMPLE_SIZE, help="Taille de l'échantillon (mode sample)")
+    parser.add_argument('--coreset-size', type=int, default=CORESET_SIZE, help="Points pondérés du coreset (mode coreset)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Lignes par chunk pour l'affectation")
+    parser.add_argument('--search', choices=['exhaustive', 'adaptive'], default='exhaustive',
+                        help="exhaustive : tous les k de 2 à 10 ; adaptive : centres initialisés à chaud "
+                             "et arrêt dès que la silhouette a passé son maximum (séquentiel)")
+    parser.add_argument('--silhouette', choices=SILHOUETTE_METHODS, default='sampled',
+                        help="sampled : échantillon aléatoire de 10 000 points ; simplified : silhouette par les "
+                             "centres sur tous les points, O(n·k) ; stratified : échantillons stratifiés par cluster, "
+                             "moyenne bootstrap avec intervalle de confiance")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="Processus pour le balayage de k (matrice partagée en memmap ; 1 = séquentiel ; "
+                             "sans effet en mode coreset)")
+    parser.add_argument('--dtype', choices=DTYPES, default='float64',
+                        help="Type flottant des composantes et de KMeans (float32 : mémoire et bande passante "
+                             "divisées par deux ; le coreset reste en float64)")
+    parser.add_argument('--sweep-dtype', choices=DTYPES, default=None,
+                        help="Type de la matrice partagée du balayage parallèle (défaut : --dtype)")
+    parser.add_argument('--exclude-anomalies', action='store_true',
+                        help=f"Choix de k et centres ajustés sans les utilisateurs signalés dans {FLAGS_CSV} "
+                             "(anomaly.py score) ; tous les utilisateurs reçoivent un cluster")
+    parser.add_argument('--compare', action='store_true',
+                        help=f"Compare qualité et temps des modes pour chaque k (résultats dans {COMPARISON_CSV})")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    weights = None
+    # Lignes gardées pour l'ajustement (None : toutes)
+    keep = None
+    if args.mode == 'exact' and not args.compare:
+        # Chargement des données PCA
+        df = pd.read_csv(INPUT_CSV, dtype=feature_dtypes(INPUT_CSV, args.dtype))
+        X = df.drop(columns=['user_id']) if 'user_id' in df.columns else df
+        if args.exclude_anomalies:
+            keep = fit_mask(df['user_id'])
+            X = X[keep]
+    elif args.mode == 'coreset' and not args.compare:
+        # Une passe sur les données : seul le coreset pondéré est gardé en mémoire
+        feature_columns = [c for c in pd.read_csv(INPUT_CSV, nrows=0).columns if c != 'user_id']
+        exclude = ~fit_mask() if args.exclude_anomalies else None
+        X, weights, n_rows = build_coreset_from_csv(INPUT_CSV, feature_columns, args.coreset_size, args.chunk_size,
+                                                    exclude=exclude)
+        print(f"Coreset : {len(X)} points pondérés pour {n_rows} utilisateurs")
+    else:
+        # Seules les composantes sont chargées ; les identifiants sont relus par chunks à l'affectation
+        feature_columns = [c for c in pd.read_csv(INPUT_CSV, nrows=0).columns if c != 'user_id']
+        X = pd.read_csv(INPUT_CSV, usecols=feature_columns, dtype=feature_dtypes(INPUT_CSV, args.dtype)
+                        ).to_numpy(dtype=args.dtype)
+        if args.exclude_anomalies:
+            keep = fit_mask()
+            X = X[keep]
+
+    if args.compare:
+        compare_modes(X, args.sample_size, silhouette_method=args.silhouette, coreset_size=args.coreset_size)
+        return
+
+    # Recherche du nombre optimal de clusters (méthode du coude + silhouette)
+    sample_idx = stratified_sample(X, args.sample_size) if args.mode == 'sample' else None
+    if sample_idx is not None:
+        print(f"Échantillon stratifié : {len(sample_idx)} utilisateurs sur {len(X)}")
+    search = None
+    K_evaluated = K_RANGE
+    if args.search == 'adaptive':
+        search = adaptive_search_k(X, args.mode, sample_idx, silhouette_method=args.silhouette, weights=weights)
+        K_evaluated, inertias, silhouettes = search.evaluated_k, search.inertias, search.silhouettes
+    elif args.jobs > 1 and weights is None:
+        inertias, silhouettes = parallel_sweep_k(X, args.mode, args.jobs, sample_idx,
+                                                  dtype=np.dtype(args.sweep_dtype or args.dtype),
+                                                  silhouette_method=args.silhouette)
+    else:
+        inertias, silhouettes = sweep_k(X, args.mode, sample_idx, silhouette_method=args.silhouette, weights=weights)
+    plot_diagnostics(K_evaluated, inertias, silhouettes)
+
     # Choix du nombre de clusters (exemple : max du score silhouette)
-    best_k = K_range[silhouettes.index(max(silhouettes))]
+    best_k = search.best_k if search is not None else K_evaluated[silhouettes.index(max(silhouettes))]
     print(f"Nombre optimal de clusters retenu : {best_k}")
 
-    # Clustering final
-    kmeans = KMeans(n_clusters=best_k, random_state=42, n_init=10)
-    labels = kmeans.fit_predict(X)
-    df['cluster'] = labels
-    df.to_csv(OUTPUT_CSV, index=False)
+    # Clustering final (la recherche adaptative fournit directement le modèle retenu)
+    if search is not None:
+        kmeans, labels = search.best_model, search.best_labels
+    elif args.mode == 'exact':
+        kmeans = KMeans(n_clusters=best_k, random_state=42, n_init=10)
+        labels = kmeans.fit_predict(X)
+    else:
+        kmeans, _, _ = fit_kmeans(X, best_k, args.mode, sample_idx, weights=weights)
+    if weights is None:
+        n_rows = len(X) if keep is None else len(keep)
+    if args.mode == 'exact':
+        if keep is not None:
+            labels = kmeans.predict(df[X.columns])
+        df['cluster'] = labels
+        df.to_csv(OUTPUT_CSV, index=False)
+        sizes = np.bincount(labels, minlength=best_k)
+        grid = DensityGrid(best_k).add(df['PC1'], df['PC2'], labels)
+    else:
+        del X
+        grid, sizes, inertia = assign_in_chunks(kmeans, feature_columns, args.chunk_size,
+                                                np.float64 if weights is not None else args.dtype)
+        if weights is not None:
+            print(f"Coût KMeans : {kmeans.inertia_:.6g} sur le coreset, {inertia:.6g} sur la population "
+                  f"(écart {abs(kmeans.inertia_ - inertia) / inertia:.2%})")
     print(f"Résultats de clustering sauvegardés dans {OUTPUT_CSV}")
 
-    # Visualisation des clusters sur PC1/PC2
-    plt.figure(figsize=(8,6))
-    for cluster in range(best_k):
-        plt.scatter(df.loc[df['cluster']==cluster, 'PC1'], df.loc[df['cluster']==cluster, 'PC2'], label=f'Cluster {cluster}', s=10, alpha=0.5)
-    plt.xlabel('PC1')
-    plt.ylabel('PC2')
-    plt.title('Répartition des clusters sur les deux premières composantes')
-    plt.legend()
-    plt.tight_layout()
-    plt.savefig(PLOT_PATH)
-    print(f"Graphique des clusters sauvegardé dans {PLOT_PATH}")
+    # Chaîne complète (prétraitement, PCA, centres) pour affecter de nouveaux utilisateurs
+    export_bundle(kmeans.cluster_centers_, n_rows, sizes)
+
+    plot_clusters(grid)
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
@@ -1,34 +1,87 @@
 import pandas as pd
+import numpy as np
 import os
 
 INPUT_CSV = os.path.join('model_ia_steps', 'features_clusters.csv')
+FEATURES_CSV = os.path.join('output', 'features_all_users.csv')
 REPORT_PATH = os.path.join('model_ia_steps', 'clusters_analysis_report.txt')
+PROFILE_CSV = os.path.join('model_ia_steps', 'clusters_profile.csv')
+
+
+def align_clusters_to_features(feature_ids, cluster_ids, clusters):
+    """
+    Jointure par user_id sous forme de fusion triée (sans table de hachage) : les deux séries d'identifiants
+    sont triées de façon stable, puis comparées dans l'ordre. Les lignes d'un même utilisateur gardent
+    leur ordre relatif, ce qui apparie correctement les utilisateurs présents sur plusieurs lignes.
+    Returns:
+        Le cluster de chaque ligne du fichier de features (-1 si l'utilisateur n'a pas de cluster).
+    """
+    feature_ids = np.asarray(feature_ids)
+    cluster_ids = np.asarray(cluster_ids)
+    feature_order = np.argsort(feature_ids, kind='stable')
+    cluster_order = np.argsort(cluster_ids, kind='stable')
+    sorted_features = feature_ids[feature_order]
+    sorted_clusters = cluster_ids[cluster_order]
+
+    aligned = np.full(len(feature_ids), -1, dtype=np.int64)
+    if len(sorted_features) == len(sorted_clusters) and np.array_equal(sorted_features, sorted_clusters):
+        aligned[feature_order] = np.asarray(clusters)[cluster_order]
+        return aligned
+
+    # Populations différentes : recherche dichotomique de chaque identifiant dans la série triée des clusters
+    positions = np.searchsorted(sorted_clusters, sorted_features)
+    positions = np.minimum(positions, len(sorted_clusters) - 1)
+    found = sorted_clusters[positions] == sorted_features
+    aligned[feature_order[found]] = np.asarray(clusters)[cluster_order[positions[found]]]
+    return aligned
+
+
+def cluster_profile(features, feature_cols):
+    """Taille, part, moyennes et médianes de chaque cluster en une seule agrégation groupée."""
+    grouped = features.groupby('cluster', sort=True)
+    stats = grouped[feature_cols].agg(['mean', 'median'])
+    stats.columns = [f'{stat}_{col}' for col, stat in stats.columns]
+    profile = pd.concat([grouped.size().rename('size'), stats], axis=1)
+    profile.insert(1, 'share', profile['size'] / profile['size'].sum())
+    return profile
 
 
 def main():
-    df = pd.read_csv(INPUT_CSV)
+    df = pd.read_csv(INPUT_CSV, usecols=lambda col: col in ('user_id', 'cluster'))
     if 'cluster' not in df.columns:
         print("Aucune colonne 'cluster' trouvée dans les données.")
         return
-    clusters = df['cluster'].unique()
+
+    # Variables métier d'origine (non normalisées), rattachées à leur cluster par user_id
+    features = pd.read_csv(FEATURES_CSV)
+    feature_cols = [col for col in features.select_dtypes(include=['number']).columns if col != 'user_id']
+    features['cluster'] = align_clusters_to_features(features['user_id'], df['user_id'], df['cluster'])
+    unmatched = int((features['cluster'] < 0).sum())
+    if unmatched:
+        print(f"⚠️ {unmatched} lignes de {FEATURES_CSV} sans cluster : ignorées")
+        features = features[features['cluster'] >= 0]
+    del df
+
+    profile = cluster_profile(features, feature_cols)
+    profile.to_csv(PROFILE_CSV, index_label='cluster')
+    overall_mean = features[feature_cols].mean()
+    overall_std = features[feature_cols].std().replace(0, np.nan)
+
     report_lines = []
-    report_lines.append(f"Nombre total de clusters : {len(clusters)}\n")
-    for cluster in sorted(clusters):
-        group = df[df['cluster'] == cluster]
-        size = len(group)
+    report_lines.append(f"Nombre total de clusters : {len(profile)}\n")
+    for cluster, row in profile.iterrows():
         report_lines.append(f"\n--- Cluster {cluster} ---")
-        report_lines.append(f"Taille du cluster : {size}")
-        # Moyennes des features principales
-        means = group.mean(numeric_only=True)
-        report_lines.append("Moyennes des variables principales :")
-        for col, val in means.items():
-            if col not in ['cluster', 'user_id']:
-                report_lines.append(f"  {col} : {val:.2f}")
-        # Caractéristiques principales (features les plus élevées)
-        top_features = means.drop(['cluster'], errors='ignore').sort_values(ascending=False).head(3)
+        report_lines.append(f"Taille du cluster : {int(row['size'])} ({row['share']:.1%} des utilisateurs)")
+        # Moyennes et médianes des variables métier
+        report_lines.append("Moyennes et médianes des variables principales :")
+        for col in feature_cols:
+            report_lines.append(f"  {col} : moyenne {row[f'mean_{col}']:.2f}, médiane {row[f'median_{col}']:.2f}")
+        # Caractéristiques principales : variables les plus au-dessus de la moyenne générale (en écarts-types)
+        means = pd.Series({col: row[f'mean_{col}'] for col in feature_cols})
+        top_features = ((means - overall_mean) / overall_std).sort_values(ascending=False).head(3)
         report_lines.append("Caractéristiques principales du groupe :")
         for feat, val in top_features.items():
-            report_lines.append(f"  {feat} (moyenne : {val:.2f})")
+            report_lines.append(f"  {feat} (moyenne : {means[feat]:.2f}, {val:+.2f} écart-type vs l'ensemble)")
         # Proposition de nom (exemple simple)
         if top_features.index[0] == 'total_spent':
             name = "Gros acheteurs"
@@ -42,7 +95,8 @@ def main():
     # Sauvegarde du rapport
     with open(REPORT_PATH, 'w', encoding='utf-8') as f:
         f.write('\n'.join(report_lines))
+    print(f"Profil des clusters sauvegardé dans {PROFILE_CSV}")
     print(f"Rapport d'analyse des clusters sauvegardé dans {REPORT_PATH}")
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
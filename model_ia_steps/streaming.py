@@ -0,0 +1,84 @@
+"""
+streaming.py
+Outils de lecture par chunks pour les étapes du modèle : itération sur un CSV et moments par colonne
+(moyenne, variance, min, max) cumulés en une passe, sans charger toute la population en mémoire.
+"""
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterator, List, Optional
+
+# Nombre de lignes (utilisateurs) lues par chunk
+CHUNK_SIZE = 500000
+
+# Types flottants des étapes du modèle (float32 : mémoire et bande passante divisées par deux)
+DTYPES = ['float64', 'float32']
+
+def iter_csv_chunks(path: str, chunk_size: int = CHUNK_SIZE, **read_csv_kwargs) -> Iterator[pd.DataFrame]:
+    """Itère sur un fichier CSV par chunks de `chunk_size` lignes."""
+    with pd.read_csv(path, chunksize=chunk_size, **read_csv_kwargs) as reader:
+        for chunk in reader:
+            yield chunk
+
+def feature_dtypes(path: str, dtype: str = 'float64') -> Optional[Dict[str, str]]:
+    """
+    Types à passer à read_csv pour lire les variables en `dtype` (user_id garde son type : un float32
+    ne représente pas exactement les identifiants). None en float64 : inférence par défaut de pandas.
+    """
+    if dtype == 'float64':
+        return None
+    return {col: dtype for col in pd.read_csv(path, nrows=0).columns if col != 'user_id'}
+
+def numeric_feature_columns(df: pd.DataFrame) -> List[str]:
+    """Colonnes numériques à traiter (hors user_id)."""
+    return [col for col in df.select_dtypes(include=['number']).columns if col != 'user_id']
+
+class RunningMoments:
+    """
+    Moyenne, variance, min et max par colonne, cumulés chunk par chunk
+    (fusion des moments de Chan et al., stable numériquement). Les valeurs manquantes sont ignorées,
+    comme avec pandas.
+    """
+
+    def __init__(self, columns: List[str]):
+        self.columns = list(columns)
+        k = len(self.columns)
+        self.count = np.zeros(k)
+        self.mean = np.zeros(k)
+        self.m2 = np.zeros(k)
+        self.min = np.full(k, np.inf)
+        self.max = np.full(k, -np.inf)
+
+    def update(self, values) -> 'RunningMoments':
+        """Ajoute un chunk (DataFrame ou tableau 2D dont les colonnes suivent self.columns)."""
+        values = np.asarray(values, dtype=np.float64)
+        if values.size == 0:
+            return self
+        mask = ~np.isnan(values)
+        n_b = mask.sum(axis=0).astype(np.float64)
+        filled = np.where(mask, values, 0.0)
+        mean_b = np.divide(filled.sum(axis=0), n_b, out=np.zeros_like(n_b), where=n_b > 0)
+        m2_b = (np.where(mask, values - mean_b, 0.0) ** 2).sum(axis=0)
+
+        n = self.count + n_b
+        ratio = np.divide(n_b, n, out=np.zeros_like(n), where=n > 0)
+        delta = mean_b - self.mean
+        self.mean = self.mean + delta * ratio
+        self.m2 = self.m2 + m2_b + delta ** 2 * self.count * ratio
+        self.count = n
+        self.min = np.minimum(self.min, np.where(mask, values, np.inf).min(axis=0))
+        self.max = np.maximum(self.max, np.where(mask, values, -np.inf).max(axis=0))
+        return self
+
+    def variance(self, ddof: int = 1) -> np.ndarray:
+        """Variance par colonne (ddof=1 comme pandas.Series.var, NaN si pas assez de valeurs)."""
+        denominator = self.count - ddof
+        return np.divide(self.m2, denominator, out=np.full_like(self.m2, np.nan), where=denominator > 0)
+
+    def std(self, ddof: int = 1) -> np.ndarray:
+        return np.sqrt(self.variance(ddof))
+
+    def mean_series(self) -> pd.Series:
+        return pd.Series(np.where(self.count > 0, self.mean, np.nan), index=self.columns)
+
+    def std_series(self, ddof: int = 1) -> pd.Series:
+        return pd.Series(self.std(ddof), index=self.columns)
@@ -0,0 +1,183 @@
+"""
+memory_governor.py
+Gouverneur de budget mémoire pour le pipeline ETL (option --memory-budget).
+Mesure l'empreinte par ligne sur un premier chunk, en déduit la taille des chunks, le nombre de workers
+et la profondeur de préchargement qui tiennent dans le budget, puis ajuste la taille des chunks
+d'après la RSS observée. En cas de dépassement, il réduit les chunks et demande de déverser
+(spill) les résultats accumulés sur disque plutôt que de laisser le système tuer le processus.
+"""
+import os
+from typing import Dict, Optional
+
+from monitoring.profiling import get_rss_bytes
+
+# =============================================================================
+# CONSTANTES DE CONFIGURATION
+# =============================================================================
+
+# Lignes lues pour mesurer l'empreinte mémoire par ligne
+CALIBRATION_ROWS = 10000
+
+# Bornes de la taille des chunks
+MIN_CHUNK_SIZE = 5000
+MAX_CHUNK_SIZE = 2000000
+
+# Rapport entre la mémoire de travail d'un chunk (copies de clean_data, conversions, pivot)
+# et la taille du DataFrame brut
+WORKING_SET_FACTOR = 4.0
+
+# Part du budget réservée aux features accumulées avant déversement sur disque
+SPILL_FRACTION = 0.25
+
+# Seuils d'ajustement (fraction du budget)
+HIGH_WATERMARK = 0.85
+LOW_WATERMARK = 0.55
+SHRINK_FACTOR = 0.5
+GROW_FACTOR = 1.25
+
+# Profondeur maximale de préchargement (chunks lus à l'avance)
+MAX_PREFETCH = 4
+
+# Mémoire de base estimée d'un processus worker (interpréteur + pandas)
+DEFAULT_WORKER_OVERHEAD = 150 * 1024 * 1024
+
+# =============================================================================
+# FONCTIONS UTILITAIRES
+# =============================================================================
+
+def parse_memory_size(value: str) -> int:
+    """Convertit '4G', '512M', '2.5GB' ou un nombre d'octets en octets."""
+    value = value.strip().upper().rstrip('B')
+    factors = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    if value and value[-1] in factors:
+        return int(float(value[:-1]) * factors[value[-1]])
+    return int(float(value))
+
+def format_bytes(value: float) -> str:
+    for unit, factor in (('GB', 1024 ** 3), ('MB', 1024 ** 2), ('KB', 1024)):
+        if abs(value) >= factor:
+            return f"{value / factor:.1f} {unit}"
+    return f"{value:.0f} B"
+
+# =============================================================================
+# GOUVERNEUR
+# =============================================================================
+
+class MemoryGovernor:
+    """
+    Dimensionne et ajuste le traitement par chunks pour rester sous un budget mémoire.
+
+    Usage :
+        governor = MemoryGovernor(parse_memory_size('4G'))
+        governor.calibrate(first_chunk)          # fixe chunk_size, workers, prefetch
+        ...
+        governor.observe(worker_rss={pid: rss})  # après chaque chunk
+        if governor.should_spill(accumulated_bytes):
+            ...
+    """
+
+    def __init__(self, budget_bytes: int, max_workers: Optional[int] = None,
+                 worker_overhead: int = DEFAULT_WORKER_OVERHEAD):
+        self.budget = int(budget_bytes)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.worker_overhead = worker_overhead
+        self.baseline_rss = get_rss_bytes()
+        self.bytes_per_row: Optional[float] = None
+        self.chunk_size = CALIBRATION_ROWS
+        self.max_chunk_size = MAX_CHUNK_SIZE
+        self.workers = 1
+        self.prefetch = 1
+        self.worker_rss: Dict[int, int] = {}
+        self.last_total_rss = self.baseline_rss
+        self.adjustments = 0
+        self.spill_requested = False
+
+    @property
+    def spill_threshold(self) -> int:
+        return int(self.budget * SPILL_FRACTION)
+
+    def chunk_footprint(self, rows: int) -> float:
+        """Mémoire de travail estimée pour traiter un chunk de `rows` lignes."""
+        return rows * (self.bytes_per_row or 0) * WORKING_SET_FACTOR
+
+    def calibrate(self, chunk) -> Dict[str, int]:
+        """
+        Mesure l'empreinte par ligne d'un premier chunk et fixe chunk_size, workers et prefetch.
+        Returns:
+            Le plan retenu.
+        """
+        rows = max(len(chunk), 1)
+        self.bytes_per_row = float(chunk.memory_usage(deep=True).sum()) / rows
+        return self.plan()
+
+    def plan(self) -> Dict[str, int]:
+        """Choisit le nombre de workers, la profondeur de préchargement et la taille des chunks."""
+        available = self.budget - self.baseline_rss - self.spill_threshold
+        if available <= 0:
+            print(f"⚠️ Budget mémoire très serré ({format_bytes(self.budget)} pour une base de "
+                  f"{format_bytes(self.baseline_rss)}) : chunks minimaux, un seul worker")
+            self.workers, self.prefetch, self.chunk_size = 1, 1, MIN_CHUNK_SIZE
+            self.max_chunk_size = MIN_CHUNK_SIZE
+            return self.current_plan()
+
+        # Un worker supplémentaire n'est utile que s'il peut traiter au moins un chunk minimal
+        min_footprint = self.chunk_footprint(MIN_CHUNK_SIZE)
+        workers = int(available // (self.worker_overhead + min_footprint * 2))
+        self.workers = max(1, min(self.max_workers, workers))
+        if self.workers > 1:
+            available -= self.workers * self.worker_overhead
+        self.prefetch = max(1, min(MAX_PREFETCH, self.workers))
+
+        # Chunks simultanément en mémoire : un par worker, ceux en file d'attente, celui en lecture
+        in_flight = self.workers + self.prefetch + 1
+        rows = int(available / (in_flight * self.chunk_footprint(1))) if self.bytes_per_row else MIN_CHUNK_SIZE
+        self.chunk_size = max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, rows))
+        self.max_chunk_size = self.chunk_size
+        return self.current_plan()
+
+    def current_plan(self) -> Dict[str, int]:
+        return {
+            'chunk_size': self.chunk_size,
+            'workers': self.workers,
+            'prefetch': self.prefetch,
+            'bytes_per_row': int(self.bytes_per_row or 0),
+            'budget_bytes': self.budget,
+        }
+
+    def total_rss(self) -> int:
+        """RSS du processus principal plus la dernière RSS rapportée par chaque worker."""
+        return get_rss_bytes() + sum(self.worker_rss.values())
+
+    def observe(self, worker_rss: Optional[Dict[int, int]] = None) -> int:
+        """
+        Met à jour les RSS observées et ajuste la taille des chunks.
+        Au-dessus du seuil haut : chunks divisés et déversement demandé ; sous le seuil bas : chunks agrandis
+        (sans dépasser la taille planifiée). Retourne la nouvelle taille de chunk.
+        """
+        if worker_rss:
+            self.worker_rss.update(worker_rss)
+        total = self.total_rss()
+        self.last_total_rss = total
+        if total > HIGH_WATERMARK * self.budget:
+            self.spill_requested = True
+            new_size = max(MIN_CHUNK_SIZE, int(self.chunk_size * SHRINK_FACTOR))
+            if new_size != self.chunk_size:
+                print(f"⚠️ RSS {format_bytes(total)} proche du budget {format_bytes(self.budget)} : "
+                      f"chunks réduits à {new_size} lignes")
+                self.chunk_size = new_size
+                self.adjustments += 1
+        elif total < LOW_WATERMARK * self.budget and self.chunk_size < self.max_chunk_size:
+            self.chunk_size = min(self.max_chunk_size, int(self.chunk_size * GROW_FACTOR))
+            self.adjustments += 1
+        return self.chunk_size
+
+    def should_spill(self, accumulated_bytes: int) -> bool:
+        """Indique s'il faut déverser les résultats accumulés sur disque (puis réarme la demande)."""
+        if self.spill_requested or accumulated_bytes > self.spill_threshold:
+            self.spill_requested = False
+            return True
+        return False
+
+    def describe(self) -> str:
+        return (f"budget {format_bytes(self.budget)}, {int(self.bytes_per_row or 0)} octets/ligne, "
+                f"chunks de {self.chunk_size} lignes, {self.workers} worker(s), préchargement {self.prefetch}")
@@ -0,0 +1,255 @@
+"""
+metrics.py
+Suivi en direct des traitements longs (ETL) : octets et lignes traités, fichier courant, débit,
+ETA estimée sur la taille des fichiers, mémoire résidente et lignes écartées par règle de nettoyage.
+Les métriques sont écrites périodiquement dans un fichier texte Prometheus (collecteur textfile
+du node exporter) et résumées dans une ligne de progression compacte.
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from monitoring.profiling import get_rss_bytes
+
+# =============================================================================
+# CONSTANTES DE CONFIGURATION
+# =============================================================================
+
+# Préfixe des métriques exportées
+METRICS_PREFIX = 'mspr_etl'
+
+# Période d'écriture du fichier Prometheus et de la ligne de progression (secondes)
+METRICS_INTERVAL = 10.0
+
+# =============================================================================
+# FONCTIONS UTILITAIRES
+# =============================================================================
+
+def format_duration(seconds: Optional[float]) -> str:
+    """Formate une durée en HH:MM:SS ('--:--:--' si inconnue)."""
+    if seconds is None:
+        return '--:--:--'
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def format_count(value: float) -> str:
+    """Formate un nombre avec un suffixe k/M/G."""
+    for unit, factor in (('G', 1e9), ('M', 1e6), ('k', 1e3)):
+        if abs(value) >= factor:
+            return f"{value / factor:.1f}{unit}"
+    return f"{value:.0f}"
+
+def escape_label(value: str) -> str:
+    """Échappe une valeur de label au format texte Prometheus."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# =============================================================================
+# SUIVI DE PROGRESSION
+# =============================================================================
+
+class ProgressMetrics:
+    """
+    Métriques de progression d'un traitement par fichiers et par chunks.
+
+    Usage :
+        metrics = ProgressMetrics(csv_files, textfile_path='output/etl_metrics.prom')
+        metrics.start()
+        for csv_file in csv_files:
+            metrics.start_file(csv_file)
+            for chunk in ...:
+                metrics.add_chunk(rows=len(chunk), file_position=handle.tell())
+            metrics.finish_file()
+        metrics.stop()
+    """
+
+    def __init__(self, files: List[str], textfile_path: Optional[str] = None,
+                 interval: float = METRICS_INTERVAL, job: str = 'etl', prefix: str = METRICS_PREFIX):
+        self.file_sizes = {f: os.path.getsize(f) for f in files if os.path.exists(f)}
+        self.bytes_total = sum(self.file_sizes.values())
+        self.files_total = len(files)
+        self.textfile_path = textfile_path
+        self.interval = interval
+        self.job = job
+        self.prefix = prefix
+
+        self.files_done = 0
+        self.bytes_done_files = 0
+        self.current_file: Optional[str] = None
+        self.current_position = 0
+        self.rows_processed = 0
+        self.rows_output = 0
+        self.drop_counts: Dict[str, int] = {}
+        # Lignes conservées mais signalées par une règle de validation (ex : type d'événement inconnu)
+        self.flag_counts: Dict[str, int] = {}
+        # Bornes (min, max) des prix conservés par le nettoyage, exposées si renseignées
+        self.price_bounds: Optional[Tuple[float, float]] = None
+
+        self.start_time = time.time()
+        self.last_progress_time = self.start_time
+        self.running = False
+        self._last_line_time = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # -------------------------------------------------------------------------
+    # Mises à jour
+    # -------------------------------------------------------------------------
+
+    @property
+    def bytes_processed(self) -> int:
+        return self.bytes_done_files + self.current_position
+
+    def start(self):
+        """Démarre l'export périodique du fichier Prometheus."""
+        self.start_time = time.time()
+        self.last_progress_time = self.start_time
+        self.running = True
+        if self.textfile_path:
+            self.write_textfile()
+            self._thread = threading.Thread(target=self._run, name='metrics-exporter', daemon=True)
+            self._thread.start()
+
+    def start_file(self, file_path: str):
+        with self._lock:
+            self.current_file = file_path
+            self.current_position = 0
+            self.last_progress_time = time.time()
+
+    def add_chunk(self, rows: int, file_position: Optional[int] = None, rows_output: int = 0):
+        """
+        Enregistre un chunk traité.
+        Args:
+            rows: Lignes lues dans le chunk.
+            file_position: Position courante dans le fichier (octets), pour le suivi en octets et l'ETA.
+            rows_output: Lignes (ou utilisateurs) produites à partir du chunk.
+        """
+        with self._lock:
+            self.rows_processed += int(rows)
+            self.rows_output += int(rows_output)
+            if file_position is not None:
+                size = self.file_sizes.get(self.current_file, file_position)
+                self.current_position = min(int(file_position), size)
+            self.last_progress_time = time.time()
+        if time.time() - self._last_line_time >= self.interval:
+            print(self.progress_line(), flush=True)
+            self._last_line_time = time.time()
+
+    def finish_file(self):
+        with self._lock:
+            self.bytes_done_files += self.file_sizes.get(self.current_file, self.current_position)
+            self.current_position = 0
+            self.files_done += 1
+            self.last_progress_time = time.time()
+
+    def stop(self):
+        """Arrête l'export périodique et écrit l'état final."""
+        self.running = False
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+        if self.textfile_path:
+            self.write_textfile()
+        print(self.progress_line(), flush=True)
+
+    # -------------------------------------------------------------------------
+    # Valeurs dérivées
+    # -------------------------------------------------------------------------
+
+    def elapsed(self) -> float:
+        return max(time.time() - self.start_time, 1e-9)
+
+    def rows_per_second(self) -> float:
+        return self.rows_processed / self.elapsed()
+
+    def bytes_per_second(self) -> float:
+        return self.bytes_processed / self.elapsed()
+
+    def eta_seconds(self) -> Optional[float]:
+        """Temps restant estimé à partir des octets restants et du débit moyen en octets."""
+        rate = self.bytes_per_second()
+        if rate <= 0 or self.bytes_total == 0:
+            return None
+        return max(self.bytes_total - self.bytes_processed, 0) / rate
+
+    def progress_line(self) -> str:
+        """Ligne de progression compacte."""
+        percent = 100.0 * self.bytes_processed / self.bytes_total if self.bytes_total else 0.0
+        current = os.path.basename(self.current_file) if self.current_file else '-'
+        drops = sum(self.drop_counts.values())
+        return (f"[{self.job}] {current} ({self.files_done}/{self.files_total}) {percent:5.1f}% | "
+                f"{format_count(self.rows_processed)} lignes | {format_count(self.rows_per_second())} l/s | "
+                f"{self.bytes_per_second() / (1024 * 1024):.1f} MB/s | ETA {format_duration(self.eta_seconds())} | "
+                f"RSS {get_rss_bytes() / (1024 ** 3):.2f} GB | écartées {format_count(drops)}")
+
+    # -------------------------------------------------------------------------
+    # Export Prometheus
+    # -------------------------------------------------------------------------
+
+    def render_textfile(self) -> str:
+        """Rend les métriques au format d'exposition texte Prometheus."""
+        p = self.prefix
+        job = escape_label(self.job)
+        eta = self.eta_seconds()
+        gauges = [
+            ('bytes_processed_total', 'counter', 'Octets lus dans les fichiers sources', self.bytes_processed),
+            ('bytes_total', 'gauge', 'Taille totale des fichiers à traiter', self.bytes_total),
+            ('rows_processed_total', 'counter', 'Lignes lues', self.rows_processed),
+            ('rows_output_total', 'counter', 'Lignes produites', self.rows_output),
+            ('files_processed_total', 'counter', 'Fichiers entièrement traités', self.files_done),
+            ('files_total', 'gauge', 'Nombre de fichiers à traiter', self.files_total),
+            ('throughput_rows_per_second', 'gauge', 'Débit moyen en lignes par seconde', self.rows_per_second()),
+            ('throughput_bytes_per_second', 'gauge', 'Débit moyen en octets par seconde', self.bytes_per_second()),
+            ('eta_seconds', 'gauge', 'Temps restant estimé (-1 si inconnu)', -1 if eta is None else eta),
+            ('rss_bytes', 'gauge', 'Mémoire résidente du processus', get_rss_bytes()),
+            ('start_timestamp_seconds', 'gauge', 'Horodatage du démarrage', self.start_time),
+            ('last_progress_timestamp_seconds', 'gauge', 'Horodatage du dernier chunk traité', self.last_progress_time),
+            ('running', 'gauge', '1 tant que le traitement est en cours', 1 if self.running else 0),
+        ]
+        lines = []
+        for name, kind, help_text, value in gauges:
+            lines.append(f"# HELP {p}_{name} {help_text}")
+            lines.append(f"# TYPE {p}_{name} {kind}")
+            lines.append(f'{p}_{name}{{job="{job}"}} {value}')
+
+        lines.append(f"# HELP {p}_current_file_info Fichier en cours de traitement")
+        lines.append(f"# TYPE {p}_current_file_info gauge")
+        if self.current_file:
+            lines.append(f'{p}_current_file_info{{job="{job}",file="{escape_label(self.current_file)}"}} 1')
+
+        lines.append(f"# HELP {p}_rows_dropped_total Lignes ou utilisateurs écartés par règle de nettoyage")
+        lines.append(f"# TYPE {p}_rows_dropped_total counter")
+        for rule, count in sorted(dict(self.drop_counts).items()):
+            lines.append(f'{p}_rows_dropped_total{{job="{job}",rule="{escape_label(rule)}"}} {count}')
+
+        lines.append(f"# HELP {p}_rows_flagged_total Lignes conservées mais signalées par règle de validation")
+        lines.append(f"# TYPE {p}_rows_flagged_total counter")
+        for rule, count in sorted(dict(self.flag_counts).items()):
+            lines.append(f'{p}_rows_flagged_total{{job="{job}",rule="{escape_label(rule)}"}} {count}')
+
+        if self.price_bounds is not None:
+            lines.append(f"# HELP {p}_price_bound Bornes des prix conservés par le nettoyage")
+            lines.append(f"# TYPE {p}_price_bound gauge")
+            for bound, value in zip(('min', 'max'), self.price_bounds):
+                lines.append(f'{p}_price_bound{{job="{job}",bound="{bound}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self):
+        """Écrit le fichier de façon atomique (le collecteur ne doit jamais lire un fichier partiel)."""
+        directory = os.path.dirname(self.textfile_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.textfile_path}.{os.getpid()}.tmp"
+        with self._lock:
+            content = self.render_textfile()
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, self.textfile_path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write_textfile()
+            except OSError as e:
+                print(f"⚠️ Écriture des métriques impossible : {e}")
@@ -0,0 +1,363 @@
+"""
+profiling.py
+Instrumentation des étapes du pipeline : temps mur, temps CPU, allocations, pic RSS et lignes traitées.
+Chaque exécution produit un résumé JSON et une trace Chrome (chrome://tracing ou ui.perfetto.dev),
+ainsi que les statistiques cProfile de chaque étape si le profilage détaillé est demandé (--profile).
+"""
+import cProfile
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# =============================================================================
+# CONSTANTES DE CONFIGURATION
+# =============================================================================
+
+# Dossier racine des rapports de profilage (un sous-dossier par exécution)
+PROFILING_DIR = 'profiling_results'
+
+# Fichiers produits dans le dossier de l'exécution
+SUMMARY_FILENAME = 'summary.json'
+TRACE_FILENAME = 'trace.json'
+
+# Période d'échantillonnage de la mémoire résidente (secondes)
+RSS_SAMPLING_INTERVAL = 0.05
+
+# =============================================================================
+# MESURES MÉMOIRE
+# =============================================================================
+
+def get_rss_bytes() -> int:
+    """Retourne la mémoire résidente actuelle du processus (octets)."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return get_peak_rss_bytes()
+
+def get_peak_rss_bytes() -> int:
+    """Retourne le pic de mémoire résidente du processus depuis son démarrage (octets)."""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en Ko sous Linux, en octets sous macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def count_rows(obj: Any) -> Optional[int]:
+    """Nombre de lignes d'un DataFrame/Series/ndarray, None pour les autres objets."""
+    shape = getattr(obj, 'shape', None)
+    if shape:
+        return int(shape[0])
+    return None
+
+class RssSampler:
+    """
+    Échantillonne la mémoire résidente dans un thread de fond pour connaître le pic
+    atteint pendant chaque étape (ru_maxrss ne donne que le pic global du processus).
+    """
+
+    def __init__(self, interval: float = RSS_SAMPLING_INTERVAL):
+        self.interval = interval
+        self.current = get_rss_bytes()
+        self.window_peak = self.current
+        self.samples: List[tuple] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+
+    def reset_window(self) -> int:
+        """Démarre une nouvelle fenêtre de mesure du pic et retourne la RSS actuelle."""
+        self.current = get_rss_bytes()
+        self.window_peak = self.current
+        return self.current
+
+    def read_window_peak(self) -> int:
+        self.current = get_rss_bytes()
+        self.window_peak = max(self.window_peak, self.current)
+        return self.window_peak
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = get_rss_bytes()
+            self.current = rss
+            if rss > self.window_peak:
+                self.window_peak = rss
+            self.samples.append((time.perf_counter(), rss))
+
+# =============================================================================
+# PROFILEUR D'EXÉCUTION
+# =============================================================================
+
+class RunProfiler:
+    """
+    Collecte les mesures de chaque étape d'une exécution du pipeline.
+
+    Usage :
+        profiler = RunProfiler('etl', enable_cprofile=args.profile)
+        clean = profiler.wrap(clean_data)
+        with profiler.stage('concat') as record:
+            ...
+            record['rows_out'] = len(features_df)
+        profiler.save()
+    """
+
+    def __init__(self, run_name: str, output_dir: str = PROFILING_DIR,
+                 enable_cprofile: bool = False, trace_allocations: bool = False):
+        self.run_name = run_name
+        self.started_at = datetime.now()
+        self.run_dir = os.path.join(output_dir, f"{run_name}_{self.started_at.strftime('%Y%m%d_%H%M%S')}")
+        self.enable_cprofile = enable_cprofile
+        self.trace_allocations = trace_allocations
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.trace_events: List[Dict[str, Any]] = []
+        # Paramètres effectifs de l'exécution (ex : bornes de prix), recopiés dans le résumé
+        self.context: Dict[str, Any] = {}
+        self._profiles: Dict[str, cProfile.Profile] = {}
+        self._extra_profiles: Dict[str, str] = {}
+        self._t0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+        self._pid = os.getpid()
+
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._sampler = RssSampler()
+        self._sampler.start()
+
+    # -------------------------------------------------------------------------
+    # Enregistrement des étapes
+    # -------------------------------------------------------------------------
+
+    def _stage_stats(self, name: str) -> Dict[str, Any]:
+        if name not in self.stages:
+            self.stages[name] = {
+                'calls': 0,
+                'wall_s': 0.0,
+                'cpu_s': 0.0,
+                'rows_in': 0,
+                'rows_out': 0,
+                'alloc_net_bytes': 0,
+                'alloc_peak_bytes': 0,
+                'rss_peak_bytes': 0,
+            }
+        return self.stages[name]
+
+    @contextmanager
+    def stage(self, name: str, rows_in: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Mesure un bloc de code. Le dictionnaire retourné peut être complété par l'appelant
+        (rows_in, rows_out, ou toute autre valeur à reporter dans la trace).
+        """
+        record: Dict[str, Any] = {'rows_in': rows_in, 'rows_out': None}
+        profile = None
+        if self.enable_cprofile:
+            profile = self._profiles.setdefault(name, cProfile.Profile())
+
+        self._sampler.reset_window()
+        if self.trace_allocations:
+            alloc_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile is not None:
+                profile.disable()
+            wall = time.perf_counter() - start_wall
+            cpu = time.process_time() - start_cpu
+            rss_peak = self._sampler.read_window_peak()
+            alloc_net = alloc_peak = 0
+            if self.trace_allocations:
+                alloc_current, alloc_max = tracemalloc.get_traced_memory()
+                alloc_net = alloc_current - alloc_start
+                alloc_peak = max(alloc_max - alloc_start, 0)
+            self._record(name, start_wall, wall, cpu, rss_peak, alloc_net, alloc_peak, record)
+
+    def _record(self, name: str, start: float, wall: float, cpu: float, rss_peak: int,
+                alloc_net: int, alloc_peak: int, record: Dict[str, Any]):
+        stats = self._stage_stats(name)
+        stats['calls'] += 1
+        stats['wall_s'] += wall
+        stats['cpu_s'] += cpu
+        stats['alloc_net_bytes'] += alloc_net
+        stats['alloc_peak_bytes'] = max(stats['alloc_peak_bytes'], alloc_peak)
+        stats['rss_peak_bytes'] = max(stats['rss_peak_bytes'], rss_peak)
+        for key in ('rows_in', 'rows_out'):
+            if record.get(key) is not None:
+                stats[key] += int(record[key])
+
+        args = {k: v for k, v in record.items() if v is not None}
+        args.update({'cpu_s': round(cpu, 6), 'rss_peak_bytes': rss_peak, 'alloc_peak_bytes': alloc_peak})
+        self.trace_events.append({
+            'name': name,
+            'cat': self.run_name,
+            'ph': 'X',
+            'ts': (start - self._t0) * 1e6,
+            'dur': wall * 1e6,
+            'pid': self._pid,
+            'tid': threading.get_ident(),
+            'args': args,
+        })
+
+    def add_external(self, name: str, start: float, wall_s: float, cpu_s: float,
+                     rows_in: Optional[int] = None, rows_out: Optional[int] = None,
+                     rss_peak_bytes: int = 0, **extra):
+        """
+        Enregistre une mesure prise hors du processus courant (worker d'un pool).
+        `start` est une valeur de time.perf_counter() (horloge monotone commune aux processus sous Linux).
+        """
+        record = {'rows_in': rows_in, 'rows_out': rows_out}
+        record.update(extra)
+        self._record(name, start, wall_s, cpu_s, rss_peak_bytes, 0, 0, record)
+
+    def wrap(self, func: Callable, name: Optional[str] = None) -> Callable:
+        """
+        Retourne une version instrumentée de `func`. Les lignes en entrée sont celles du premier
+        argument, les lignes en sortie celles du résultat (si ce sont des DataFrames).
+        """
+        stage_name = name or func.__name__
+
+        def wrapped(*args, **kwargs):
+            with self.stage(stage_name, rows_in=count_rows(args[0]) if args else None) as record:
+                result = func(*args, **kwargs)
+                record['rows_out'] = count_rows(result)
+            return result
+
+        wrapped.__name__ = stage_name
+        wrapped.__doc__ = func.__doc__
+        return wrapped
+
+    def wrap_iterator(self, iterator: Iterator, name: str) -> Iterator:
+        """
+        Instrumente un itérateur (ex : lecture par chunks) : chaque appel à next() est mesuré
+        comme un appel de l'étape `name`, avec le nombre de lignes produites en sortie.
+        """
+        iterator = iter(iterator)
+        while True:
+            with self.stage(name) as record:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                record['rows_out'] = count_rows(item)
+            yield item
+
+    def run_subprocess(self, name: str, cmd: List[str]) -> int:
+        """
+        Exécute une étape dans un sous-processus et mesure son temps mur, son temps CPU et son pic RSS.
+        Avec le profilage détaillé, la commande Python est lancée sous `-m cProfile`.
+        """
+        if self.enable_cprofile:
+            os.makedirs(self.run_dir, exist_ok=True)
+            prof_path = os.path.join(self.run_dir, f"{name}.prof")
+            cmd = [cmd[0], '-m', 'cProfile', '-o', prof_path] + list(cmd[1:])
+            self._extra_profiles[name] = prof_path
+
+        start_wall = time.perf_counter()
+        if hasattr(os, 'wait4'):
+            process = subprocess.Popen(cmd)
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            cpu = usage.ru_utime + usage.ru_stime
+            rss_peak = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+        else:
+            start_cpu = time.process_time()
+            process = subprocess.run(cmd)
+            cpu = time.process_time() - start_cpu
+            rss_peak = 0
+        wall = time.perf_counter() - start_wall
+
+        record = {'returncode': process.returncode, 'rows_in': None, 'rows_out': None}
+        self._record(name, start_wall, wall, cpu, rss_peak, 0, 0, record)
+        return process.returncode
+
+    # -------------------------------------------------------------------------
+    # Rapports
+    # -------------------------------------------------------------------------
+
+    def summary(self) -> Dict[str, Any]:
+        """Retourne le résumé de l'exécution (agrégé par étape)."""
+        stages = {}
+        for name, stats in self.stages.items():
+            stage = dict(stats)
+            rows = stats['rows_in'] or stats['rows_out']
+            stage['rows_per_s'] = rows / stats['wall_s'] if rows and stats['wall_s'] > 0 else None
+            stage['wall_s'] = round(stats['wall_s'], 6)
+            stage['cpu_s'] = round(stats['cpu_s'], 6)
+            stages[name] = stage
+        return {
+            'run': self.run_name,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'total_wall_s': round(time.perf_counter() - self._t0, 6),
+            'total_cpu_s': round(time.process_time() - self._cpu0, 6),
+            'peak_rss_bytes': get_peak_rss_bytes(),
+            'alloc_tracing': self.trace_allocations,
+            'cprofile': self.enable_cprofile,
+            'context': dict(self.context),
+            'stages': stages,
+        }
+
+    def _rss_counter_events(self) -> List[Dict[str, Any]]:
+        return [
+            {'name': 'rss', 'ph': 'C', 'ts': (ts - self._t0) * 1e6, 'pid': self._pid,
+             'args': {'rss_mb': round(rss / (1024 * 1024), 1)}}
+            for ts, rss in self._sampler.samples
+        ]
+
+    def save(self) -> str:
+        """
+        Écrit le résumé JSON, la trace Chrome et les statistiques cProfile dans le dossier de l'exécution.
+        Returns:
+            Chemin du dossier de l'exécution.
+        """
+        self._sampler.stop()
+        os.makedirs(self.run_dir, exist_ok=True)
+        summary = self.summary()
+        summary['cprofile_files'] = dict(self._extra_profiles)
+        for name, profile in self._profiles.items():
+            prof_path = os.path.join(self.run_dir, f"{name}.prof")
+            profile.dump_stats(prof_path)
+            summary['cprofile_files'][name] = prof_path
+
+        with open(os.path.join(self.run_dir, SUMMARY_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        with open(os.path.join(self.run_dir, TRACE_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': self.trace_events + self._rss_counter_events(),
+                       'displayTimeUnit': 'ms'}, f)
+
+        if self.trace_allocations and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.print_summary(summary)
+        return self.run_dir
+
+    def print_summary(self, summary: Optional[Dict[str, Any]] = None):
+        """Affiche un tableau récapitulatif des étapes."""
+        summary = summary or self.summary()
+        print(f"\n⏱️ Profil de l'exécution '{self.run_name}' ({summary['total_wall_s']:.1f} s, "
+              f"pic RSS {summary['peak_rss_bytes'] / (1024 * 1024):.0f} MB)")
+        print(f"   {'Étape':<28}{'Appels':>8}{'Mur (s)':>10}{'CPU (s)':>10}{'Lignes/s':>12}{'Pic RSS (MB)':>14}")
+        for name, stage in summary['stages'].items():
+            rows_per_s = f"{stage['rows_per_s']:.0f}" if stage['rows_per_s'] else '-'
+            print(f"   {name:<28}{stage['calls']:>8}{stage['wall_s']:>10.2f}{stage['cpu_s']:>10.2f}"
+                  f"{rows_per_s:>12}{stage['rss_peak_bytes'] / (1024 * 1024):>14.0f}")
+        print(f"   Rapports : {self.run_dir}")
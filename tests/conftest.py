@@ -0,0 +1,11 @@
+"""
+Configuration commune des tests : les scripts de model_ia_steps s'importent entre eux par leur nom
+(`from streaming import ...`), comme lorsqu'ils sont lancés depuis la racine du projet.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'model_ia_steps')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
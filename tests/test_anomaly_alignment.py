@@ -0,0 +1,64 @@
+"""Lecture des drapeaux d'anomalie (model_ia_steps/anomaly.py) alignés ligne à ligne sur les features."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from anomaly import _check_alignment, load_anomaly_mask, with_anomaly_flags
+from streaming import iter_csv_chunks
+
+
+def write_files(tmp_path, user_ids, flag_ids=None, flagged=()):
+    """Features (user_id, view) et drapeaux au format de anomaly.py score ; retourne leurs chemins."""
+    flag_ids = user_ids if flag_ids is None else flag_ids
+    features = tmp_path / 'features.csv'
+    flags = tmp_path / 'flags.csv'
+    pd.DataFrame({'user_id': user_ids, 'view': np.arange(len(user_ids))}).to_csv(features, index=False)
+    anomaly = np.isin(np.arange(len(flag_ids)), list(flagged)).astype(np.int8)
+    pd.DataFrame({'user_id': flag_ids, 'anomaly_score': 0.0, 'anomaly': anomaly}).to_csv(flags, index=False)
+    return str(features), str(flags)
+
+
+def read_all(features, flags, chunk_size):
+    return list(with_anomaly_flags(iter_csv_chunks(features, chunk_size), flags, chunk_size))
+
+
+def test_masks_follow_rows(tmp_path):
+    user_ids = np.arange(100, 125)
+    features, flags = write_files(tmp_path, user_ids, flagged={0, 7, 24})
+    chunks = read_all(features, flags, chunk_size=10)
+    assert [len(chunk) for chunk, _ in chunks] == [10, 10, 5]
+    mask = np.concatenate([flagged for _, flagged in chunks])
+    assert mask.dtype == bool
+    assert np.flatnonzero(mask).tolist() == [0, 7, 24]
+    np.testing.assert_array_equal(load_anomaly_mask(user_ids, flags), mask)
+
+
+def test_reordered_flags_raise(tmp_path):
+    user_ids = np.arange(100, 125)
+    flag_ids = user_ids.copy()
+    flag_ids[[12, 13]] = flag_ids[[13, 12]]
+    features, flags = write_files(tmp_path, user_ids, flag_ids)
+    with pytest.raises(ValueError, match='à partir de la ligne 10'):
+        read_all(features, flags, chunk_size=10)
+    with pytest.raises(ValueError, match='ligne 0'):
+        load_anomaly_mask(user_ids, flags)
+
+
+def test_missing_flag_rows_raise(tmp_path):
+    user_ids = np.arange(100, 125)
+    features, flags = write_files(tmp_path, user_ids, user_ids[:20])
+    with pytest.raises(ValueError, match='à partir de la ligne 20'):
+        read_all(features, flags, chunk_size=10)
+
+
+def test_extra_flag_rows_raise(tmp_path):
+    user_ids = np.arange(100, 120)
+    features, flags = write_files(tmp_path, user_ids, np.arange(100, 125))
+    with pytest.raises(ValueError, match='plus de lignes'):
+        read_all(features, flags, chunk_size=10)
+
+
+def test_check_alignment_compares_ids_as_floats():
+    _check_alignment(np.array([1, 2, 3]), np.array([1.0, 2.0, 3.0]), 'flags.csv', 0)
+    with pytest.raises(ValueError, match='ligne 5'):
+        _check_alignment(np.array([1, 2, 3]), np.array([1, 2]), 'flags.csv', 5)
@@ -0,0 +1,20 @@
+"""Règles de nettoyage de etl_steps/transform.py : lignes écartées et lignes signalées."""
+import pandas as pd
+
+from etl_steps.transform import clean_data
+
+
+def test_unknown_event_types_are_kept_and_flagged():
+    df = pd.DataFrame({
+        'event_time': ['2019-10-01 00:00:00 UTC', '2019-10-01 00:01:00 UTC', '2019-10-01 00:02:00 UTC'],
+        'event_type': ['view', 'wishlist', 'purchase'],
+        'product_id': [1, 2, 3],
+        'price': [10.0, 20.0, 30.0],
+        'user_id': [1, 1, 2],
+    })
+    drop_counts, flag_counts = {}, {}
+    cleaned = clean_data(df, drop_counts=drop_counts, flag_counts=flag_counts)
+    assert cleaned['event_type'].tolist() == ['view', 'wishlist', 'purchase']
+    assert flag_counts == {'invalid_event_types': 1}
+    assert 'invalid_event_types' not in drop_counts
+    assert sum(drop_counts.values()) == 0
@@ -0,0 +1,45 @@
+"""Fenêtre d'observation des features de l'ETL (main_etl.py --features-until)."""
+import pandas as pd
+
+from etl_steps.transform import OUTPUT_FEATURE_COLUMNS
+from main_etl import parse_utc_timestamp, process_chunk
+
+
+def raw_events(start, n_users=3, events_per_user=12):
+    """Chunk brut au schéma des fichiers sources, événements espacés d'une minute à partir de `start`."""
+    n = n_users * events_per_user
+    times = pd.date_range(start, periods=n, freq='min', tz='UTC').strftime('%Y-%m-%d %H:%M:%S UTC')
+    return pd.DataFrame({
+        'event_time': times,
+        'event_type': ['view', 'view', 'cart', 'purchase'] * (n // 4),
+        'product_id': range(n),
+        'category_id': 2053013552226107000 + pd.Series(range(n)) % 5,
+        'category_code': 'electronics.smartphone',
+        'brand': 'acme',
+        'price': 19.99,
+        'user_id': [500000000 + i % n_users for i in range(n)],
+        'user_session': 'session',
+    })
+
+
+def test_chunk_entirely_after_cutoff_keeps_activity():
+    features, activity, *_ = process_chunk(raw_events('2019-10-20'), features_until=parse_utc_timestamp('2019-10-18'))
+    assert features.empty
+    assert list(features.columns) == OUTPUT_FEATURE_COLUMNS
+    assert len(activity) == 3
+    assert activity['events'].sum() == 36
+
+
+def test_chunk_straddling_cutoff_uses_earlier_events_only():
+    chunk = raw_events('2019-10-17 23:50')
+    features, activity, *_ = process_chunk(chunk, features_until=parse_utc_timestamp('2019-10-18'))
+    earlier, *_ = process_chunk(chunk.iloc[:10])
+    pd.testing.assert_frame_equal(features, earlier)
+    assert activity['events'].sum() == len(chunk)
+
+
+def test_chunk_before_cutoff_is_unchanged():
+    chunk = raw_events('2019-10-01')
+    features, *_ = process_chunk(chunk, features_until=parse_utc_timestamp('2019-10-18'))
+    full, *_ = process_chunk(chunk)
+    pd.testing.assert_frame_equal(features, full)
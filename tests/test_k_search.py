@@ -0,0 +1,35 @@
+"""Scission du cluster de plus forte inertie (model_ia_steps/k_search.py), avec et sans poids de coreset."""
+import numpy as np
+
+from k_search import cluster_inertias, split_cluster_centers
+
+
+def two_clusters(seed=0):
+    rng = np.random.default_rng(seed)
+    X = np.vstack([rng.normal(0, [3.0, 0.5], (200, 2)), rng.normal(20, [0.5, 2.0], (300, 2))])
+    labels = np.repeat([0, 1], [200, 300])
+    centers = np.array([X[labels == c].mean(axis=0) for c in (0, 1)])
+    return X, labels, centers
+
+
+def test_weighted_inertias_match_repeated_points():
+    X, labels, centers = two_clusters()
+    weights = np.random.default_rng(1).integers(1, 5, len(X))
+    repeated = np.repeat(np.arange(len(X)), weights)
+    np.testing.assert_allclose(cluster_inertias(X, centers, labels, weights),
+                               cluster_inertias(X[repeated], centers, labels[repeated]))
+
+
+def test_weighted_split_matches_repeated_points():
+    X, labels, centers = two_clusters()
+    # Les poids font passer le cluster 1 devant le cluster 0, dont l'inertie non pondérée est plus forte
+    weights = np.where(labels == 1, 10.0, 1.0)
+    repeated = np.repeat(np.arange(len(X)), weights.astype(int))
+    unweighted = split_cluster_centers(X, centers, labels)
+    weighted = split_cluster_centers(X, centers, labels, weights)
+    np.testing.assert_allclose(weighted, split_cluster_centers(X[repeated], centers, labels[repeated]))
+    np.testing.assert_array_equal(unweighted[0], centers[1])
+    np.testing.assert_array_equal(weighted[0], centers[0])
+    # Scission le long de l'axe principal du cluster scindé (axe y pour le cluster 1)
+    offset = np.abs(weighted[2] - weighted[1]) / 2
+    assert offset[1] > 10 * offset[0]
@@ -0,0 +1,78 @@
+"""Sketches de quantiles (model_ia_steps/robust_stats.py) comparés aux quantiles exacts de numpy."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from robust_stats import RELATIVE_ACCURACY, ColumnSketches, QuantileSketch, load_robust_stats, save_robust_stats
+
+QS = [0.0, 0.001, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 0.999, 1.0]
+
+
+def assert_within_relative_accuracy(sketch, values, qs=QS, accuracy=RELATIVE_ACCURACY):
+    """Chaque quantile estimé est à `accuracy` près (en relatif) d'une valeur de rang voisin."""
+    estimates = sketch.quantiles(qs)
+    lower = np.quantile(values, qs, method='lower')
+    higher = np.quantile(values, qs, method='higher')
+    tolerance = accuracy * np.maximum(np.abs(lower), np.abs(higher)) + 1e-12
+    assert np.all(estimates >= lower - tolerance), (qs, estimates, lower)
+    assert np.all(estimates <= higher + tolerance), (qs, estimates, higher)
+
+
+@pytest.mark.parametrize('distribution', ['lognormal', 'pareto', 'signed', 'zero_inflated'])
+def test_quantiles_match_numpy(distribution):
+    rng = np.random.default_rng(0)
+    n = 50000
+    values = {
+        'lognormal': rng.lognormal(3, 2, n),
+        'pareto': rng.pareto(1.2, n) * 10,
+        'signed': rng.normal(0, 100, n),
+        'zero_inflated': np.where(rng.random(n) < 0.7, 0.0, rng.exponential(50, n)),
+    }[distribution]
+    assert_within_relative_accuracy(QuantileSketch().update(values), values)
+
+
+def test_min_max_exact_and_non_finite_ignored():
+    values = np.array([3.5, np.nan, -2.0, np.inf, 0.0, 1e6, -np.inf])
+    sketch = QuantileSketch().update(values)
+    assert sketch.count == 4
+    assert sketch.quantiles([0, 1]).tolist() == [-2.0, 1e6]
+
+
+def test_empty_sketch_returns_nan():
+    assert np.isnan(QuantileSketch().quantiles([0.5])).all()
+
+
+def test_merge_equals_single_pass():
+    rng = np.random.default_rng(1)
+    values = rng.lognormal(2, 1.5, 30000) * np.where(rng.random(30000) < 0.1, -1, 1)
+    whole = QuantileSketch().update(values)
+    merged = QuantileSketch()
+    for part in np.array_split(values, 7)[::-1]:
+        merged.merge(QuantileSketch().update(part))
+    assert merged.count == whole.count
+    assert (merged.min, merged.max) == (whole.min, whole.max)
+    np.testing.assert_array_equal(merged.quantiles(QS), whole.quantiles(QS))
+    assert_within_relative_accuracy(merged, values)
+
+
+def test_merge_rejects_different_accuracy():
+    with pytest.raises(ValueError):
+        QuantileSketch(0.01).merge(QuantileSketch(0.005))
+
+
+def test_column_sketches_round_trip(tmp_path):
+    rng = np.random.default_rng(2)
+    df = pd.DataFrame({'view': rng.poisson(20, 5000).astype(float), 'total_spent': rng.exponential(80, 5000)})
+    sketches = ColumnSketches(['view', 'total_spent'])
+    for start in range(0, len(df), 1500):
+        sketches.update(df.iloc[start:start + 1500])
+    sketches.source = {'size': 1, 'mtime_ns': 2}
+    path = str(tmp_path / 'robust_stats.json')
+    save_robust_stats({'features': sketches}, path)
+    loaded = load_robust_stats(path)['features']
+    assert loaded.source == sketches.source
+    assert loaded.n_rows() == len(df)
+    lower, upper = loaded.clip_bounds((0.1, 99.9))
+    for col in ['view', 'total_spent']:
+        assert (lower[col], upper[col]) == (sketches.sketches[col].quantile(0.001), sketches.sketches[col].quantile(0.999))
+        assert_within_relative_accuracy(loaded.sketches[col], df[col].to_numpy(), [0.001, 0.999])
@@ -0,0 +1,85 @@
+"""Service de segmentation (model_ia_steps/scoring_service.py) : lecture des requêtes et micro-lots."""
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from scoring_service import LatencyStats, MicroBatcher, ScoringServer
+
+COLUMNS = ['view', 'cart', 'purchase']
+
+
+def parse(payload):
+    return ScoringServer.parse_payload(SimpleNamespace(model=SimpleNamespace(columns=COLUMNS)), payload)
+
+
+class SlowModel:
+    """Modèle factice : segment = somme des variables ; chaque appel dure `delay` secondes."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    def assign_segments(self, X):
+        self.calls.append(len(X))
+        time.sleep(self.delay)
+        return X.sum(axis=1).astype(int)
+
+
+def test_users_rows_missing_and_null_values_are_nan():
+    user_ids, X = parse({'users': [{'user_id': 7, 'view': 3, 'cart': None}, {'purchase': 2.5, 'extra': 1}]})
+    assert user_ids == [7, None]
+    assert X.dtype == np.float32 and X.shape == (2, 3)
+    np.testing.assert_array_equal(X, [[3, np.nan, np.nan], [np.nan, np.nan, 2.5]])
+
+
+def test_empty_users_give_empty_matrix():
+    user_ids, X = parse({'users': []})
+    assert user_ids == [] and X.shape == (0, 3)
+
+
+@pytest.mark.parametrize('payload', [
+    {'users': [{'view': 'abc'}]},
+    {'users': {'view': 1}},
+    {'users': [[1, 2, 3]]},
+    {'features': [[1, 2]]},
+    {'features': [[1, 2, 3]], 'user_ids': [1, 2]},
+    {},
+])
+def test_invalid_payloads_raise_value_error(payload):
+    with pytest.raises(ValueError):
+        parse(payload)
+
+
+def test_single_request_is_not_delayed_by_the_wait_window():
+    batcher = MicroBatcher(SlowModel(), LatencyStats(), max_wait_ms=500)
+    try:
+        start = time.perf_counter()
+        labels = batcher.submit(np.ones((1, 3), dtype=np.float32)).result(timeout=5)
+        assert time.perf_counter() - start < 0.25
+        assert labels.tolist() == [3]
+    finally:
+        batcher.stop()
+
+
+def test_requests_queued_during_a_batch_share_the_next_one():
+    model = SlowModel(delay=0.2)
+    batcher = MicroBatcher(model, LatencyStats(), max_wait_ms=0)
+    try:
+        first = batcher.submit(np.ones((1, 3), dtype=np.float32))
+        time.sleep(0.05)
+        queued = [batcher.submit(np.full((2, 3), i, dtype=np.float32)) for i in range(4)]
+        assert first.result(timeout=5).tolist() == [3]
+        for i, future in enumerate(queued):
+            assert future.result(timeout=5).tolist() == [3 * i, 3 * i]
+        assert model.calls == [1, 8]
+    finally:
+        batcher.stop()
+
+
+def test_stop_fails_pending_submissions():
+    batcher = MicroBatcher(SlowModel(), LatencyStats())
+    batcher.stop()
+    with pytest.raises(RuntimeError):
+        batcher.submit(np.ones((1, 3), dtype=np.float32)).result(timeout=1)
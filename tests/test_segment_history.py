@@ -0,0 +1,82 @@
+"""Suivi des segments entre deux runs (model_ia_steps/segment_history.py) : appariement et transitions."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from segment_history import match_segments, read_assignments, transition_counts
+
+
+def random_snapshot(rng, population, size, segments):
+    """(user_id triés et uniques, segment de chacun) tirés dans `population`."""
+    user_ids = np.sort(rng.choice(population, size, replace=False))
+    return user_ids, rng.choice(segments, size)
+
+
+def test_transition_counts_match_crosstab():
+    rng = np.random.default_rng(0)
+    segments = np.array([0, 1, 2, 5, 8])
+    population = 500000000 + np.arange(20000)
+    previous = random_snapshot(rng, population, 12000, segments[:4])
+    current = random_snapshot(rng, population, 15000, segments[[0, 1, 2, 4]])
+    matrix, new_users, departed = transition_counts(previous, current, segments)
+
+    merged = pd.merge(pd.DataFrame({'user_id': previous[0], 'before': previous[1]}),
+                      pd.DataFrame({'user_id': current[0], 'after': current[1]}), on='user_id', how='outer')
+    both = merged.dropna()
+    expected = pd.crosstab(both['before'].astype(int), both['after'].astype(int))
+    expected = expected.reindex(index=segments, columns=segments, fill_value=0)
+    np.testing.assert_array_equal(matrix, expected.to_numpy())
+    np.testing.assert_array_equal(
+        new_users, merged.loc[merged['before'].isna(), 'after'].value_counts().reindex(segments, fill_value=0))
+    np.testing.assert_array_equal(
+        departed, merged.loc[merged['after'].isna(), 'before'].value_counts().reindex(segments, fill_value=0))
+    assert matrix.sum() + new_users.sum() == len(current[0])
+    assert matrix.sum() + departed.sum() == len(previous[0])
+
+
+def test_transition_counts_without_previous_run():
+    segments = np.array([3, 4])
+    empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    current = (np.array([1, 2, 3]), np.array([3, 4, 4]))
+    matrix, new_users, departed = transition_counts(empty, current, segments)
+    assert matrix.sum() == 0
+    assert new_users.tolist() == [1, 2]
+    assert departed.tolist() == [0, 0]
+
+
+def test_match_segments_follows_permuted_centers():
+    rng = np.random.default_rng(1)
+    previous_centers = rng.normal(0, 10, (6, 4))
+    previous_segments = np.array([0, 1, 2, 4, 6, 7])
+    order = rng.permutation(6)
+    centers = previous_centers[order] + rng.normal(0, 0.01, (6, 4))
+    segments, distances = match_segments(previous_centers, previous_segments, centers, np.ones(4), next_segment=8)
+    np.testing.assert_array_equal(segments, previous_segments[order])
+    assert np.all(distances < 0.1)
+
+
+def test_match_segments_numbers_new_centers_after_next_segment():
+    previous_centers = np.array([[0.0, 0.0], [10.0, 0.0]])
+    centers = np.array([[0.0, 30.0], [10.1, 0.0], [0.0, 0.2], [-40.0, 0.0]])
+    segments, distances = match_segments(previous_centers, [3, 5], centers, np.array([1.0, 2.0]), next_segment=9)
+    assert segments.tolist()[1:3] == [5, 3]
+    assert sorted(segments[[0, 3]].tolist()) == [9, 10]
+    assert np.isnan(distances[[0, 3]]).all()
+    # Distance mesurée en unités de `scale` : 0.2 sur la seconde variable (écart-type 2) vaut 0.1
+    assert distances[2] == pytest.approx(0.1)
+
+
+def test_match_segments_drops_vanished_segments():
+    previous_centers = np.array([[0.0], [5.0], [10.0]])
+    segments, distances = match_segments(previous_centers, [0, 1, 2], np.array([[9.5], [0.5]]), np.ones(1), 3)
+    assert segments.tolist() == [2, 0]
+    assert np.allclose(distances, [0.5, 0.5])
+
+
+def test_read_assignments_sorts_and_keeps_first_row(tmp_path):
+    path = tmp_path / 'clusters.csv'
+    pd.DataFrame({'user_id': [30, 10, 20, 10, None, 30], 'view': 1.0,
+                  'cluster': [2, 1, 0, 3, 1, 0]}).to_csv(path, index=False)
+    user_ids, clusters = read_assignments(str(path), chunk_size=2)
+    assert user_ids.tolist() == [10, 20, 30]
+    assert clusters.tolist() == [1, 0, 2]
@@ -0,0 +1,56 @@
+"""Profil en une passe de step1_load_explore.py : empreinte calculée pendant la lecture et statistiques."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import step1_load_explore
+from step1_load_explore import compute_profile, file_hash
+
+
+def write_features(path, n_rows, seed=0, trailing_newline=True):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'user_id': 500000000 + np.arange(n_rows),
+        'view': rng.poisson(30, n_rows),
+        'purchase': rng.poisson(1, n_rows),
+        'total_spent': np.round(rng.exponential(120, n_rows), 2),
+    })
+    df.loc[rng.random(n_rows) < 0.01, 'total_spent'] = np.nan
+    text = df.to_csv(index=False)
+    path.write_text(text if trailing_newline else text.rstrip('\n'))
+    return df
+
+
+@pytest.mark.parametrize('chunk_size', [1000, 4096, 100000])
+@pytest.mark.parametrize('trailing_newline', [True, False])
+def test_digest_matches_file_hash(tmp_path, monkeypatch, chunk_size, trailing_newline):
+    # Petits blocs de lecture : l'empreinte doit couvrir plusieurs blocs et la fin de fichier
+    monkeypatch.setattr(step1_load_explore, 'HASH_BLOCK_SIZE', 1024)
+    path = tmp_path / 'features.csv'
+    write_features(path, 10000, trailing_newline=trailing_newline)
+    profile = compute_profile(str(path), chunk_size=chunk_size)
+    assert profile['file_hash'] == file_hash(str(path))
+    assert profile['n_rows'] == 10000
+
+
+def test_digest_changes_with_content(tmp_path):
+    path = tmp_path / 'features.csv'
+    write_features(path, 2000, seed=0)
+    before = compute_profile(str(path))['file_hash']
+    write_features(path, 2000, seed=1)
+    assert compute_profile(str(path))['file_hash'] != before
+
+
+def test_stats_match_pandas(tmp_path):
+    path = tmp_path / 'features.csv'
+    df = write_features(path, 5000)
+    profile = compute_profile(str(path), chunk_size=700, sample_size=10000)
+    assert profile['missing'] == df.isna().sum().to_dict()
+    for col in ['view', 'purchase', 'total_spent']:
+        stats = profile['stats'][col]
+        assert stats['count'] == df[col].count()
+        assert stats['mean'] == pytest.approx(df[col].mean())
+        assert stats['std'] == pytest.approx(df[col].std(), rel=1e-3)
+        assert (stats['min'], stats['max']) == (df[col].min(), df[col].max())
+        # Échantillon plus grand que la population : quantiles exacts
+        assert stats['50%'] == pytest.approx(df[col].quantile(0.5))